@@ -15,10 +15,15 @@ class Benchmark():
                flags={}):
 
     self.benchmark_id = benchmark_id
+    # benchmark_id is reassigned when the benchmark is added to a graph,
+    # this keeps the id it was created with, its position in the configs
+    self.config_index = benchmark_id
     self.benchmark_type = benchmark_type
     self.status = "Not Executed"
     self.vms = []
     self.config_file = None
+    self.start_timestamp = None
+    self.end_timestamp = None
     self.flags = flags
     self.bigquery_table = bigquery_table
     self.bq_project = bq_project
@@ -49,6 +54,7 @@ class Benchmark():
 
   def copy_contents(self, bm):
     self.benchmark_id = bm.benchmark_id
+    self.config_index = bm.config_index
     self.benchmark_type = bm.benchmark_type
     self.zone1 = bm.zone1
     self.zone2 = bm.zone2
@@ -72,6 +78,24 @@ class Benchmark():
     self.estimated_bandwidth = bm.estimated_bandwidth
     self.vpc_peering = bm.vpc_peering
 
+  def to_dict(self):
+    """Returns the state of this benchmark as a json serializable dict
+
+    VMs are referenced by node id
+    """
+    return {
+      'benchmark_id': self.benchmark_id,
+      'config_index': self.config_index,
+      'benchmark_type': self.benchmark_type,
+      'status': self.status,
+      'config_file': self.config_file,
+      'bigquery_table': self.bigquery_table,
+      'zones': [vm_spec.zone for vm_spec in self.vm_specs],
+      'vms': [vm.node_id for vm in self.vms],
+      'start_timestamp': self.start_timestamp,
+      'end_timestamp': self.end_timestamp,
+    }
+
   def run(self):
     pass
 
@@ -0,0 +1,88 @@
+from __future__ import annotations
+import collections.abc
+import copy
+
+from typing import List, Dict, Tuple, Set, Any, Optional, Iterator, Mapping
+
+
+class BenchmarkFlags(collections.abc.MutableMapping):
+  """Flags of a benchmark, as a base shared by every benchmark of a config
+  file plus the few flags of this benchmark
+
+  Every flag_matrix combination of a config file has the same flags
+  except for its axis values, so the file's flags are kept once as the
+  base and each benchmark only stores its axis values. Changes only go
+  to the benchmark, the base is never written to. The full flags are
+  built with dict(flags) when they are needed, like when a pkb config
+  file is written.
+
+  Attributes:
+      base (Dict[str, Any]): flags shared with other benchmarks, read only
+      overlay (Dict[str, Any]): flags of this benchmark, over the base
+      removed (Optional[Set[str]]): base flags removed from this benchmark
+  """
+
+  __slots__ = ('base', 'overlay', 'removed')
+
+  def __init__(self, base: Optional[Dict[str, Any]] = None,
+               overlay: Optional[Dict[str, Any]] = None):
+    self.base = base if base is not None else {}
+    self.overlay = dict(overlay) if overlay else {}
+    self.removed = None
+
+  def __getitem__(self, key: str) -> Any:
+    if key in self.overlay:
+      return self.overlay[key]
+    if self.removed and key in self.removed:
+      raise KeyError(key)
+    return self.base[key]
+
+  def __setitem__(self, key: str, value: Any):
+    self.overlay[key] = value
+
+  def __delitem__(self, key: str):
+    if key not in self:
+      raise KeyError(key)
+    self.overlay.pop(key, None)
+    if key in self.base:
+      if self.removed is None:
+        self.removed = set()
+      self.removed.add(key)
+
+  def __contains__(self, key: Any) -> bool:
+    if key in self.overlay:
+      return True
+    if self.removed and key in self.removed:
+      return False
+    return key in self.base
+
+  def __iter__(self) -> Iterator[str]:
+    for key in self.base:
+      if key not in self.overlay and not (self.removed and key in self.removed):
+        yield key
+    yield from self.overlay
+
+  def __len__(self) -> int:
+    return sum(1 for key in self)
+
+  def __repr__(self) -> str:
+    return f'BenchmarkFlags({dict(self)!r})'
+
+  def __copy__(self) -> BenchmarkFlags:
+    flags = BenchmarkFlags(self.base, self.overlay)
+    if self.removed:
+      flags.removed = set(self.removed)
+    return flags
+
+  def __deepcopy__(self, memo: Dict[int, Any]) -> BenchmarkFlags:
+    # the base is never changed, so copies keep sharing it
+    flags = BenchmarkFlags(self.base, copy.deepcopy(self.overlay, memo))
+    if self.removed:
+      flags.removed = set(self.removed)
+    return flags
+
+  def __getstate__(self) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[Set[str]]]:
+    return (self.base, self.overlay, self.removed)
+
+  def __setstate__(self, state: Tuple[Dict[str, Any], Dict[str, Any], Optional[Set[str]]]):
+    self.base, self.overlay, self.removed = state
@@ -10,15 +10,23 @@ import yaml
 import threading
 import logging
 import math
+import itertools
 import cloud_util
+import pkb_tasks
 import time
 
-from queue import Queue
+from queue import Queue, Empty
 from deprecated import deprecated
 from typing import List, Dict, Tuple, Set, Any, Optional
 from benchmark import Benchmark
 from virtual_machine import VirtualMachine
 from region import Region
+from scheduling_strategy import SchedulingStrategy, MaximumMatchingStrategy
+from duration_model import BenchmarkDurationModel
+from pkb_executor import AsyncioPkbExecutor
+from instrumentation import Instrumentation
+from event_journal import EventJournal, get_vm_fields
+from run_history import RunHistory
 from absl import flags
 
 
@@ -39,7 +47,12 @@ class BenchmarkGraph():
 
   def __init__(self, ssh_pub="", ssh_priv="", ssl_cert="", pkb_location="./pkb.py",
                bigquery_table="daily_tests.scheduler_test_1",
-               bq_project="smu-benchmarking"):
+               bq_project="smu-benchmarking",
+               scheduling_strategy: Optional[SchedulingStrategy] = None,
+               pkb_executor: Optional[AsyncioPkbExecutor] = None,
+               instrumentation: Optional[Instrumentation] = None,
+               event_journal: Optional[EventJournal] = None,
+               run_history: Optional[RunHistory] = None):
 
     # get logger
     global logger 
@@ -52,8 +65,32 @@ class BenchmarkGraph():
     self.benchmarks = []
     self.benchmark_wait_list = []
     self.multiedge_benchmarks = []
+    self.scheduling_strategy = scheduling_strategy
+    if self.scheduling_strategy is None:
+      self.scheduling_strategy = MaximumMatchingStrategy()
+    # run times and creation times of past runs, if kept
+    self.run_history = run_history
+    self.duration_model = BenchmarkDurationModel(run_history)
+    # runs pkb processes if set, otherwise a process is started per task
+    self.pkb_executor = pkb_executor
+    # records how long starting each pkb process takes
+    self.instrumentation = instrumentation
+    if self.instrumentation is None:
+      self.instrumentation = Instrumentation()
+    # records every scheduling decision, see replay_journal.py
+    self.event_journal = event_journal
+    if self.event_journal is None:
+      self.event_journal = EventJournal()
+    # benchmarks started by continuous scheduling that have not been collected
+    self.running_benchmarks = []
+    # VM creations started ahead of the round that needs them, keyed by node id
+    self.pending_vm_creations = {}
     self.vm_total_count = 0
     self.bm_total_count = 0
+    # spec key -> node ids of equivalent VMs in the graph
+    # see VirtualMachine.get_spec_key
+    self.vm_spec_index = {}
+    self.vm_spec_index_no_network = {}
 
     self.network = {}
     #TODO create randomized run ID
@@ -123,13 +160,7 @@ class BenchmarkGraph():
     Returns:
         bool: if there is an equivalent VM
     """
-    for index in self.graph.nodes:
-      tmp_vm = self.graph.nodes[index]['vm']
-      if vm.vm_spec_is_equivalent(tmp_vm):
-        return True
-      else:
-        continue
-    return False
+    return len(self.get_equivalent_node_ids(vm)) > 0
 
   def print_graph(self):
     """Uses matplotlib to show a visual representation of the graph in its current state
@@ -150,13 +181,8 @@ class BenchmarkGraph():
       List[virtual_machine.VirtualMachine]: list of VMs with matching specs to parameter
     """
     vm_list = []
-    for index in self.graph.nodes:
-      tmp_vm = self.graph.nodes[index]['vm']
-      if vm.vm_spec_is_equivalent(tmp_vm):
-        # print(vm.zone + " Exists")
-        vm_list.append(tmp_vm)
-      else:
-        continue
+    for node_id in self.get_equivalent_node_ids(vm):
+      vm_list.append(self.graph.nodes[node_id]['vm'])
     return vm_list
 
   def get_node_id_list_if_vm_exists(self, vm: VirtualMachine) -> List[int]:
@@ -172,11 +198,55 @@ class BenchmarkGraph():
       list of node_ids with VMs with matching specs to parameter
       list[int]
     """
-    node_list = []
-    vm_list = self.get_list_if_vm_exists(vm)
-    for vm in vm_list:
-      node_list.append(vm.node_id)
-    return node_list
+    return self.get_equivalent_node_ids(vm)
+
+  def get_equivalent_node_ids(self, vm: VirtualMachine) -> List[int]:
+    """Looks up the node ids of VMs equivalent to vm in the spec index
+
+    Gives the same result as calling vm.vm_spec_is_equivalent
+    on every node, without scanning the graph
+
+    Args:
+      vm: vm with specs to search for
+
+    Returns:
+      list of node_ids with VMs with matching specs to parameter
+      list[int]
+    """
+    if vm.preexisting_network:
+      node_ids = self.vm_spec_index.get(vm.get_spec_key(), [])
+    else:
+      node_ids = self.vm_spec_index_no_network.get(vm.get_spec_key(include_network=False), [])
+    return list(node_ids)
+
+  def add_vm_node(self, vm: VirtualMachine):
+    """Adds a VM to the graph as a node and to the spec index
+
+    Args:
+        vm (VirtualMachine): VM to add, vm.node_id is used as the node id
+    """
+    self.virtual_machines.append(vm)
+    self.graph.add_node(vm.node_id, vm=vm)
+    self.vm_spec_index.setdefault(vm.get_spec_key(), []).append(vm.node_id)
+    self.vm_spec_index_no_network.setdefault(vm.get_spec_key(include_network=False),
+                                             []).append(vm.node_id)
+    self.event_journal.record('vm_added', **get_vm_fields(vm))
+
+  def remove_vm_node(self, node_id: int):
+    """Removes a VM node from the graph and from the spec index
+
+    Args:
+        node_id (int): node id of the VM to remove
+    """
+    vm = self.graph.nodes[node_id]['vm']
+    self.graph.remove_node(node_id)
+    for spec_index, spec_key in ((self.vm_spec_index, vm.get_spec_key()),
+                                 (self.vm_spec_index_no_network,
+                                  vm.get_spec_key(include_network=False))):
+      spec_index[spec_key].remove(node_id)
+      if len(spec_index[spec_key]) == 0:
+        del spec_index[spec_key]
+    self.event_journal.record('vm_removed', node_id=node_id)
 
   def check_if_should_add_vm(self, vm_list: List[VirtualMachine]) -> bool:
     """Checks if the degree of the vms on the list is less than the max of the
@@ -248,6 +318,8 @@ class BenchmarkGraph():
       logger.debug("BM WAITLISTED")
       bm.status = "Waitlist"
       self.benchmark_wait_list.append(bm)
+      self.event_journal.record('benchmark_waitlisted', config_index=bm.config_index,
+                                benchmark_type=bm.benchmark_type)
       return [], "Waitlisted"
 
   def add_vms_for_benchmark_if_possible(self, bm: Benchmark) -> List[VirtualMachine]:
@@ -308,8 +380,7 @@ class BenchmarkGraph():
           if success:
             logger.debug(f"ADD DUPLICATE VM {vm}")
             add_from_list = False
-            self.virtual_machines.append(vm)
-            self.graph.add_node(vm_id, vm=vm)
+            self.add_vm_node(vm)
             vms.append(vm)
             vm_ids.append(vm.node_id)
             self.vm_total_count += 1
@@ -359,8 +430,7 @@ class BenchmarkGraph():
         # and increment total number of vms, return True, and the vm
         if status is True:
           logger.debug("NO SUITABLE VM FOUND, CREATING NEW VM")
-          self.virtual_machines.append(vm)
-          self.graph.add_node(vm_id, vm=vm)
+          self.add_vm_node(vm)
           vms.append(vm)
           vm_ids.append(vm.node_id)
           self.vm_total_count += 1
@@ -437,6 +507,9 @@ class BenchmarkGraph():
               self.graph.remove_edge(max_node_id, node_to_transfer, key_to_remove)
               # add new edge
               self.graph.add_edges_from([(new_node_id, node_to_transfer, {'bm': bm_to_change})])
+              self.event_journal.record('edge_moved', benchmark_id=bm_to_change.benchmark_id,
+                                        from_node=max_node_id, to_node=new_node_id,
+                                        other_node=node_to_transfer)
               max_node_degree = self.graph.degree(max_node_id)
               number_changed += 1
               max_node_adjacency_list = list(self.graph[max_node_id])
@@ -477,8 +550,7 @@ class BenchmarkGraph():
           success = self.regions[vm_region].add_virtual_machine_if_possible(new_vm)
           if success:
             logger.debug("DUPLICATE VM ADDED")
-            self.virtual_machines.append(new_vm)
-            self.graph.add_node(new_vm_id, vm=new_vm)
+            self.add_vm_node(new_vm)
             self.vm_total_count += 1
             bm_to_change = None
             key_to_remove = None
@@ -507,6 +579,9 @@ class BenchmarkGraph():
               self.graph.remove_edge(max_node_id, node_to_transfer, key_to_remove)
               # add new edge
               self.graph.add_edges_from([(new_vm_id, node_to_transfer, {'bm': bm_to_change})])
+              self.event_journal.record('edge_moved', benchmark_id=bm_to_change.benchmark_id,
+                                        from_node=max_node_id, to_node=new_vm_id,
+                                        other_node=node_to_transfer)
               max_node_degree = self.graph.degree(max_node_id)
               number_changed += 1
               max_node_adjacency_list = list(self.graph[max_node_id])
@@ -579,152 +654,175 @@ class BenchmarkGraph():
 
     bm.benchmark_id = self.bm_total_count
     self.bm_total_count += 1
+    if self.event_journal.enabled:
+      if len(bm.vms) <= 2:
+        edges = [[vms[0].node_id, vms[-1].node_id]]
+      else:
+        edges = [[vms[i].node_id, vms[(i + 1) % len(vms)].node_id] for i in range(len(vms))]
+      self.event_journal.record('benchmark_added', benchmark_id=bm.benchmark_id,
+                                config_index=bm.config_index, benchmark_type=bm.benchmark_type,
+                                edges=edges)
 
   def maximum_matching(self) -> List[Tuple[int,int]]:
     return nx.max_weight_matching(self.graph, maxcardinality=True)
 
-  def get_benchmark_set(self) -> List[Tuple[int,int]]:
+  def get_benchmark_set(self, excluded_nodes: Optional[Set[int]] = None) -> List[Tuple[int,int]]:
     """Get the next benchmark set to run
     
+    Args:
+        excluded_nodes (Optional[Set[int]], optional): node ids that can not be
+          part of the set, such as VMs that are busy running a benchmark. Defaults to None.
+
     Returns:
         List[Tuple[int, int]]: list of tuples [(node1, node2)]
     """
+    if excluded_nodes is None:
+      excluded_nodes = set()
 
     logger.debug("GET BENCHMARK SET")
 
     # convert multigraph to simplified graph with weighted edges
     for i in self.graph.nodes:
       logger.debug(self.graph.nodes[i]['vm'].status)
-    # print(self.graph.edges)
+    node_list = [n for n in self.graph.nodes if n not in excluded_nodes]
+    weighted_edges = self.get_matching_weights(excluded_nodes)
+    logger.debug("EDGE SET")
+    logger.debug(weighted_edges)
+
+    vm_states = {}
+    for node in node_list:
+      vm_states[node] = self.graph.nodes[node]['vm'].status
+    bm_list = self.scheduling_strategy.get_benchmark_set(self.graph,
+                                                         self.regions,
+                                                         vm_states,
+                                                         weighted_edges)
+    if self.event_journal.enabled:
+      self.event_journal.record('matching_chosen',
+                                strategy=type(self.scheduling_strategy).__name__,
+                                excluded_nodes=sorted(excluded_nodes),
+                                pairs=[[node_1, node_2] for node_1, node_2 in bm_list],
+                                weights=[weighted_edges.get((node_1, node_2),
+                                                            weighted_edges.get((node_2, node_1)))
+                                         for node_1, node_2 in bm_list])
+    return bm_list
+
+  def get_matching_weights(self, excluded_nodes: Set[int]) -> Dict[Tuple[int, int], float]:
+    """Calculates the weight of each pair of nodes with a benchmark between them
+
+    Args:
+        excluded_nodes (Set[int]): node ids that can not be matched
+
+    Returns:
+        Dict[Tuple[int, int], float]: weight of each (node1, node2) pair.
+          Self-loops are (node, node)
+    """
     node_degree_dict = dict(nx.degree(self.graph))
     logger.debug(node_degree_dict)
-    tmp_graph = nx.Graph()
-    tmp_graph.add_nodes_from(self.graph.nodes)
-    edges_list = []
+    edges_set = set()
     for e in self.graph.edges:
-      edges_list.append(e[0:2])
-
-    edges_set = set(edges_list)
-    logger.debug("EDGE SET")
-    logger.debug(edges_set)
-    edges_to_add = []
-    dummy_node_index = -1
-    dummy_nodes = []
-    dummy_edges = []
+      if e[0] in excluded_nodes or e[1] in excluded_nodes:
+        continue
+      edges_set.add(e[0:2])
 
+    weighted_edges = {}
     # calculate weight based on degree of each node 1/(n1.degree * n2.degree)
     # also take into account if vms in benchmark are already created
     for e in edges_set:
-      # if self-loop, replace with dummy node and edge
+      # self-loops are replaced with a dummy node by the matching engine
       if e[0] == e[1]:
-        dummy_node = dummy_node_index
         c = 10 / (node_degree_dict[e[0]])
         if self.graph.nodes[e[0]]['vm'].status == 'Running':
           c = c + 10
-        t = (e[0], dummy_node, c)
-        edges_to_add.append(t)
-        dummy_nodes.append(dummy_node)
-        dummy_edges.append((e[0], dummy_node))
-        dummy_node_index -= 1
       else:
         c = 10 / (node_degree_dict[e[0]] * node_degree_dict[e[1]])
         if self.graph.nodes[e[0]]['vm'].status == 'Running':
           c = c + 10
         if self.graph.nodes[e[1]]['vm'].status == 'Running':
           c = c + 10
-        t = (e[0], e[1], c)
-        edges_to_add.append(t)
-
-    tmp_graph.add_weighted_edges_from(edges_to_add)
-    logger.debug(tmp_graph)
-    logger.debug("NODES:")
-    logger.debug(tmp_graph.nodes)
-    logger.debug("EDGES:")
-    logger.debug(tmp_graph.edges)
-    for e in tmp_graph.edges:
-      logger.debug(tmp_graph.edges[e])
-
-    node_list = self.graph.nodes
-
-    # for i in node_list:
-    #   node_list[i]['evenlevel'] = math.inf
-    #   node_list[i]['oddlevel'] = math.inf
-    #   node_list[i]['blossom'] = None
-    #   node_list[i]['predecessors'] = []
-    #   node_list[i]['anomalies'] = []
-    #   node_list[i]['visited'] = False
-
-    # for e in self.graph.edges:
-    #   self.graph.edges[e]['visited'] = False
-    #   self.graph.edges[e]['used'] = False
-
-    maximum_match = list(nx.max_weight_matching(tmp_graph, maxcardinality=True, weight='weight'))
-
-    # convert dummy nodes back to self-loops
-    for i in range(0, len(maximum_match)):
-      if maximum_match[i][0] < 0:
-        maximum_match[i] = (maximum_match[i][1], maximum_match[i][1])
-      elif maximum_match[i][1] < 0:
-        maximum_match[i] = (maximum_match[i][0], maximum_match[i][0])
-    return maximum_match
-
-  def create_vms(self, vm_list: List[int] = []) -> List[int]:
+      weighted_edges[e] = c
+
+    if FLAGS.runtime_aware_matching:
+      self.add_duration_weights(weighted_edges)
+
+    return weighted_edges
+
+  def add_duration_weights(self, weighted_edges: Dict[Tuple[int, int], float]):
+    """Adds a bonus to each pair of nodes based on estimated benchmark duration
+
+    The bonus is proportional to the estimated duration of the longest
+    benchmark between the pair, relative to the longest one in the graph.
+    Long benchmarks are picked first and run alongside each other, and
+    short benchmarks are grouped together in later sets, so each set
+    finishes close to the same time instead of waiting on one long run
+
+    Args:
+        weighted_edges (Dict[Tuple[int, int], float]): weights from
+          get_matching_weights, updated in place
+    """
+    pair_durations = {}
+    for e in weighted_edges:
+      duration = 0
+      for key in self.graph[e[0]][e[1]]:
+        bm = self.graph[e[0]][e[1]][key]['bm']
+        if bm.status == "Not Executed":
+          duration = max(duration, self.duration_model.estimate(bm))
+      pair_durations[e] = duration
+
+    if len(pair_durations) == 0:
+      return
+    longest_duration = max(pair_durations.values())
+    if longest_duration <= 0:
+      return
+
+    for e in weighted_edges:
+      weighted_edges[e] += 10 * pair_durations[e] / longest_duration
+
+  def create_vms(self, vm_list: List[int] = [], poll_interval: float = 1.0) -> List[int]:
     """Create Virtual Machines that have not yet been created
 
+    No more than max_processes VMs are created at a time. A new
+    creation is started as soon as any running one finishes.
+
     Args:
         vm_list (List[int], optional): List of VMs to create if not already created. Defaults to [].
+        poll_interval (float, optional): seconds between checks on running creations. Defaults to 1.0.
 
     Returns:
         List[int]: List of VM IDs that were created
     """
-    # TODO add max thread logic here, make sure things are stood up in a reasonable way
     # go through nodes in network. Stand up Vms that have not been created
     max_processes = FLAGS.max_processes
 
     node_list = vm_list
     if len(node_list) == 0:
       node_list = list(self.graph.nodes)
+    node_list = self.order_vm_creations(node_list)
     node_index = 0
     created_nodes = []
+    vm_processes = []
 
     logger.info("LENGTH NODE LIST: " + str(len(node_list)))
     logger.debug("NODE LIST")
     logger.debug(node_list)
     # for each node in the graph
-    while node_index < len(node_list):
-      vm_processes = []
-      thread_count = 0
-      while ((thread_count < max_processes or max_processes < 0) and
+    while node_index < len(node_list) or len(vm_processes) > 0:
+      while ((len(vm_processes) < max_processes or max_processes < 0) and
              node_index < len(node_list)):
-        # for index in node_list:
         vm = self.graph.nodes[node_list[node_index]]['vm']
 
-        vm_proc_container = {}
-        vm_proc_container['vm'] = vm
-
-        if vm.status == 'Not Created':
-          # vm.create_instance(self.pkb_location)
-          # t = threading.Thread(target=self.create_vm,
-          #                      args=(vm,))
-          queue = mp.Queue()
-          p = mp.Process(target=self.create_vm_process,
-                         args=(vm, queue))
-          vm_proc_container['process'] = p
-          vm_proc_container['data'] = queue
-
-          vm_processes.append(vm_proc_container)
-          p.start()
+        if node_list[node_index] in self.pending_vm_creations:
+          # creation was started ahead of this round, wait for it here
+          vm_processes.append(self.pending_vm_creations.pop(node_list[node_index]))
+          created_nodes.append(node_index)
+        elif vm.status == 'Not Created':
+          vm_processes.append(self.start_vm_creation(vm))
           created_nodes.append(node_index)
-          thread_count += 1
 
         node_index += 1
 
-      for container in vm_processes:
-        p = container['process']
-        new_vm = container['data'].get()
-        container['vm'].copy_contents(new_vm)
-        p.join()
-        print("Process Done")
+      finished = self.poll_vm_creations(vm_processes)
+      if len(finished) == 0 and len(vm_processes) > 0:
+        time.sleep(poll_interval)
 
     for index in created_nodes:
       vm = self.graph.nodes[node_list[index]]['vm']
@@ -736,26 +834,274 @@ class BenchmarkGraph():
 
     return created_nodes
 
-  def create_vm_process(self, vm: VirtualMachine, queue: mp.Queue):
-    vm.create_instance(self.pkb_location)
-    queue.put(vm)
+  def order_vm_creations(self, node_list: List[int]) -> List[int]:
+    """Orders VM creations so VMs that were slow to create in past runs start first
+
+    Uses the p90 creation time of the zone and machine type from the run
+    history. VMs without history keep their place after the ones with it
+
+    Args:
+        node_list (List[int]): node ids of VMs to create
+
+    Returns:
+        List[int]: node ids, slowest first
+    """
+    if self.run_history is None:
+      return node_list
+
+    def get_creation_estimate(node_id):
+      vm = self.graph.nodes[node_id]['vm']
+      estimate = self.run_history.estimate_vm_creation_time(vm.cloud, vm.zone, vm.machine_type,
+                                                            percentile=90)
+      return -estimate if estimate is not None else 0.0
+
+    return sorted(node_list, key=get_creation_estimate)
+
+  def poll_vm_creations(self, vm_processes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Applies the results of VM creations that have finished
+
+    Finished containers are removed from vm_processes
+
+    Args:
+        vm_processes (List[Dict[str, Any]]): containers from start_vm_creation
+
+    Returns:
+        List[Dict[str, Any]]: containers of the creations that finished
+    """
+    finished = []
+    for container in list(vm_processes):
+      if self.get_vm_creation_result(container, block=False):
+        vm_processes.remove(container)
+        finished.append(container)
+        print("Process Done")
+    return finished
+
+  def predict_next_benchmark_set(self, bm_list: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Predicts the benchmark set of the next round
+
+    Assumes every benchmark in bm_list succeeds, so their edges are
+    left out of the graph the next set is picked from
+
+    Args:
+        bm_list (List[Tuple[int, int]]): node_id tuples of the current round
+
+    Returns:
+        List[Tuple[int, int]]: predicted node_id tuples of the next round
+    """
+    weighted_edges = self.get_matching_weights(set())
+    for node_1, node_2 in bm_list:
+      if self.graph.number_of_edges(node_1, node_2) <= 1:
+        weighted_edges.pop((node_1, node_2), None)
+        weighted_edges.pop((node_2, node_1), None)
+
+    vm_states = {}
+    for node in self.graph.nodes:
+      vm_states[node] = self.graph.nodes[node]['vm'].status
+
+    return self.scheduling_strategy.get_benchmark_set(self.graph,
+                                                     self.regions,
+                                                     vm_states,
+                                                     weighted_edges)
+
+  def start_lookahead_vm_creations(self, bm_list: List[Tuple[int, int]]) -> List[int]:
+    """Starts creating the VMs of the predicted next round in the background
+
+    VMs in the graph already hold a reservation on their regional quota,
+    so creating them early does not go over quota. No more than
+    max_processes creations are started ahead of time. Creations that
+    are still running are waited on by create_vms in the next round.
+
+    Args:
+        bm_list (List[Tuple[int, int]]): node_id tuples of the current round
+
+    Returns:
+        List[int]: node ids of the VMs that started being created
+    """
+    max_processes = FLAGS.max_processes
+    current_nodes = set(itertools.chain(*bm_list))
+    predicted_set = self.predict_next_benchmark_set(bm_list)
+    logger.debug(f"PREDICTED NEXT SET: {predicted_set}")
+
+    started_nodes = []
+    for node in itertools.chain(*predicted_set):
+      if max_processes >= 0 and len(self.pending_vm_creations) >= max_processes:
+        break
+      if node in current_nodes or node in self.pending_vm_creations:
+        continue
+      vm = self.graph.nodes[node]['vm']
+      if vm.status != 'Not Created':
+        continue
+      self.pending_vm_creations[node] = self.start_vm_creation(vm)
+      started_nodes.append(node)
+
+    logger.info(f"LOOKAHEAD VM CREATIONS STARTED: {len(started_nodes)}")
+    return started_nodes
+
+  def finish_pending_vm_creations(self, node_list: Optional[List[int]] = None,
+                                  block: bool = False) -> List[int]:
+    """Applies the results of VM creations started ahead of time
+
+    Args:
+        node_list (Optional[List[int]], optional): only check these nodes. Defaults to all pending nodes.
+        block (bool, optional): wait for the creations to finish. Defaults to False.
+
+    Returns:
+        List[int]: node ids of the VMs whose creation finished
+    """
+    if node_list is None:
+      node_list = list(self.pending_vm_creations)
+
+    finished_nodes = []
+    for node in node_list:
+      if node not in self.pending_vm_creations:
+        continue
+      container = self.pending_vm_creations[node]
+      if self.get_vm_creation_result(container, block=block):
+        del self.pending_vm_creations[node]
+        self.vm_creation_times.append(container['vm'].creation_time)
+        finished_nodes.append(node)
+    return finished_nodes
+
+  def start_vm_creation(self, vm: VirtualMachine) -> Dict[str, Any]:
+    """Starts creating a VM without waiting for it to finish
+
+    Uses the pkb executor if there is one, otherwise a new process
+
+    Args:
+        vm (VirtualMachine): VM to create
+
+    Returns:
+        Dict[str, Any]: container to pass to get_vm_creation_result
+    """
+    vm_proc_container = {}
+    vm_proc_container['vm'] = vm
+
+    if self.pkb_executor and not FLAGS.no_run:
+      cmd = vm.get_create_command(self.pkb_location)
+      logging.info('CREATE INSTANCE: ' + cmd)
+      vm.create_timestamp = time.time()
+      spawn_start = time.perf_counter()
+      vm_proc_container['future'] = self.pkb_executor.submit(cmd.split(),
+                                                             label=f"vm {vm.node_id}")
+      self.instrumentation.record_spawn(time.perf_counter() - spawn_start)
+    else:
+      task = pkb_tasks.VmCreationTask(vm.node_id,
+                                      vm.get_create_command(self.pkb_location),
+                                      no_run=FLAGS.no_run)
+      queue = mp.Queue()
+      p = mp.Process(target=pkb_tasks.run_vm_creation_task,
+                     args=(task, queue))
+      vm_proc_container['process'] = p
+      vm_proc_container['data'] = queue
+      spawn_start = time.perf_counter()
+      p.start()
+      self.instrumentation.record_spawn(time.perf_counter() - spawn_start)
+
+    return vm_proc_container
+
+  def get_vm_creation_result(self, vm_proc_container: Dict[str, Any], block: bool = True) -> bool:
+    """Updates a VM with the result of its creation
+
+    Args:
+        vm_proc_container (Dict[str, Any]): container from start_vm_creation
+        block (bool, optional): wait for the creation to finish. Defaults to True.
+
+    Returns:
+        bool: True if the creation finished, False if it is still running
+    """
+    if 'future' in vm_proc_container:
+      if not block and not vm_proc_container['future'].done():
+        return False
+      process_result = vm_proc_container['future'].result()
+      vm_proc_container['vm'].apply_creation_output(process_result.output,
+                                                    process_result.run_time)
+      self.record_vm_status('vm_created', vm_proc_container['vm'])
+      return True
+
+    try:
+      creation_result = vm_proc_container['data'].get(block=block)
+    except Empty:
+      return False
+    vm_proc_container['vm'].apply_creation_result(creation_result)
+    vm_proc_container['process'].join()
+    self.record_vm_status('vm_created', vm_proc_container['vm'])
+    return True
+
+  def record_vm_status(self, event: str, vm: VirtualMachine):
+    """Journals the status of a VM after it was created, adopted or deleted
+
+    Args:
+        event (str): type of the event
+        vm (VirtualMachine): VM
+    """
+    self.event_journal.record(event, node_id=vm.node_id, status=vm.status,
+                              run_uri=vm.run_uri, creation_time=vm.creation_time)
 
   def create_vm(self, vm: VirtualMachine):
     vm.create_instance(self.pkb_location)
 
-  def run_benchmark_set(self, bm_list: List[Tuple[int, int]]):
+  def run_benchmark_set(self, bm_list: List[Tuple[int, int]], poll_interval: float = 1.0):
     """When given a list of tuples, where each element
        in the tuple is a node id, this function figures
        out the benchmark to run between those nodes.
        It then calls a function to create a config file for
        the benchmarks and then runs the benchmarks
 
+    No more than max_processes benchmarks run at a time. A new
+    benchmark is started as soon as any running one finishes.
+
     Args:
         bm_list (list[tuple[int, int]]): list of node_id tuples (node_id, node_id)
+        poll_interval (float, optional): seconds between checks on running benchmarks. Defaults to 1.0.
+    """
+    logger.debug("RUN BENCHMARKS")
+    benchmarks_to_run, benchmarks_to_run_tuples = self.get_benchmarks_to_run(bm_list)
+
+    # run benchmark configs
+    # run in parallel, starting a new benchmark whenever one finishes
+
+    bm_all_thread_results = []
+    bm_threads = []
+    bm_index = 0
+
+    max_processes = FLAGS.max_processes
+
+    while bm_index < len(benchmarks_to_run) or len(bm_threads) > 0:
+      while ((len(bm_threads) < max_processes or max_processes < 0) and
+              bm_index < len(benchmarks_to_run)):
+        bm_data = self.start_benchmark_process(benchmarks_to_run[bm_index],
+                                               benchmarks_to_run_tuples[bm_index],
+                                               bm_index)
+        bm_index += 1
+        if bm_data is None:
+          continue
+
+        bm_all_thread_results.append(bm_data)
+        bm_threads.append(bm_data)
+
+      finished = self.poll_benchmark_processes(bm_threads)
+      if len(finished) == 0 and len(bm_threads) > 0:
+        time.sleep(poll_interval)
+
+    logging.info("All threads done")
+
+    # TODO remove only successful benchmarks from graph
+    for bm_data in bm_all_thread_results:
+      self.remove_benchmark_edge_if_successful(bm_data)
+
+  def get_benchmarks_to_run(self,
+                            bm_list: List[Tuple[int, int]]) -> Tuple[List[Benchmark], List[Tuple[int, int, int]]]:
+    """Picks the benchmark to run on each node tuple and writes its config file
+
+    Args:
+        bm_list (List[Tuple[int, int]]): list of node_id tuples (node_id, node_id)
+
+    Returns:
+        Tuple[List[Benchmark], List[Tuple[int, int, int]]]: benchmarks to run and
+          the matching edge tuples (node1, node2, key)
     """
     benchmarks_to_run = []
     benchmarks_to_run_tuples = []
-    logger.debug("RUN BENCHMARKS")
 
     # Go through list of benchmarks to run and see what benchmarks are in each list
     # try to run benchmark with most occurences
@@ -818,110 +1164,254 @@ class BenchmarkGraph():
       benchmarks_to_run.append(bm_to_run)
       benchmarks_to_run_tuples.append(bm_tuple)
 
-    # run benchmark configs
-    # run in parallel
+    return benchmarks_to_run, benchmarks_to_run_tuples
 
-    bm_all_thread_results = []
-    # bm_thread_result_counter = 0
-    bm_index = 0
+  def start_benchmark_process(self,
+                              bm: Benchmark,
+                              bm_tuple: Tuple[int, int, int],
+                              bm_index: int) -> Optional[Dict[str, Any]]:
+    """Starts a process that runs a single benchmark
+
+    Args:
+        bm (Benchmark): benchmark to run
+        bm_tuple (Tuple[int, int, int]): edge of the benchmark (node1, node2, key)
+        bm_index (int): index of the benchmark in its set
 
+    Returns:
+        Optional[Dict[str, Any]]: process data for the benchmark, or None if
+          the VMs for the benchmark are not running yet
+    """
+    # make sure that all vms for benchmark have been created
+    # TODO try to ssh into it to make sure it is up
+    #      or at least ping it
+    if FLAGS.precreate_and_share_vms:
+      for vm in bm.vms:
+        if vm.status != "Running":
+          logger.debug(f"Needed VM is {vm.status}")
+          logger.debug("DO NOT RUN")
+          return None
+    else:
+      for vm in bm.vms:
+        vm.create_timestamp = time.time()
+
+    logger.debug(bm)
+    bm_data = {}
+    bm_data['bm'] = bm
+    bm_data['tuple'] = bm_tuple
+    bm.status = "Running"
+    bm.start_timestamp = time.time()
+    self.event_journal.record('benchmark_started', benchmark_id=bm.benchmark_id,
+                              nodes=[vm.node_id for vm in bm.vms])
+
+    if self.pkb_executor and not FLAGS.no_run:
+      cmd = self.get_benchmark_command(bm)
+      logger.debug("RUN BM: " + cmd)
+      spawn_start = time.perf_counter()
+      bm_data['future'] = self.pkb_executor.submit(cmd.split(),
+                                                   label=f"bm {bm.benchmark_id}")
+      self.instrumentation.record_spawn(time.perf_counter() - spawn_start)
+    else:
+      # create
+      task = pkb_tasks.BenchmarkTask(bm.benchmark_id,
+                                     bm_tuple,
+                                     bm_index,
+                                     self.get_benchmark_command(bm),
+                                     self.generated_config_path + bm.config_file,
+                                     no_run=FLAGS.no_run)
+      queue = mp.Queue()
+      p = mp.Process(target=pkb_tasks.run_benchmark_task,
+                     args=(task, queue))
+      bm_data['process'] = p
+      bm_data['queue'] = queue
+      spawn_start = time.perf_counter()
+      p.start()
+      self.instrumentation.record_spawn(time.perf_counter() - spawn_start)
+    return bm_data
+
+  def get_benchmark_result(self, bm_data: Dict[str, Any], block: bool = True) -> Optional[pkb_tasks.BenchmarkResult]:
+    """Gets the result of a benchmark started by start_benchmark_process
+
+    Args:
+        bm_data (Dict[str, Any]): process data from start_benchmark_process
+        block (bool, optional): wait for the benchmark to finish. Defaults to True.
+
+    Returns:
+        Optional[pkb_tasks.BenchmarkResult]: result, or None if the benchmark is still running
+    """
+    if 'future' in bm_data:
+      if not block and not bm_data['future'].done():
+        return None
+      process_result = bm_data['future'].result()
+      bm_result = pkb_tasks.BenchmarkResult(bm_data['bm'].benchmark_id, bm_data['tuple'], None)
+      # TODO make this actually do something on failure
+      bm_result.status = "Executed"
+      bm_result.success = True
+      bm_result.start_time = process_result.start_time
+      bm_result.end_time = process_result.end_time
+      bm_result.run_time = process_result.run_time
+      return bm_result
+
+    try:
+      bm_result = bm_data['queue'].get(block=block)
+    except Empty:
+      return None
+    bm_data['process'].join()
+    return bm_result
+
+  def finish_benchmark_process(self, bm_data: Dict[str, Any], bm_result: pkb_tasks.BenchmarkResult):
+    """Records the results of a finished benchmark process
+
+    Args:
+        bm_data (Dict[str, Any]): process data from start_benchmark_process
+        bm_result (pkb_tasks.BenchmarkResult): result from get_benchmark_result
+    """
+    self.benchmark_run_times.append(bm_result.run_time)
+    self.duration_model.record(bm_data['bm'], bm_result.run_time)
+    bm_data['bm'].status = bm_result.status
+    bm_data['bm'].end_timestamp = bm_result.end_time or time.time()
+    # TODO make sure this works
+    if not FLAGS.precreate_and_share_vms:
+      for vm in bm_data['bm'].vms:
+        vm.delete_timestamp = time.time()
+    bm_data['success'] = bm_result.success
+    self.event_journal.record('benchmark_finished', benchmark_id=bm_data['bm'].benchmark_id,
+                              status=bm_result.status, success=bm_result.success,
+                              run_time=bm_result.run_time)
+
+  def remove_benchmark_edge_if_successful(self, bm_data: Dict[str, Any]):
+    """Removes the edge of a finished benchmark from the graph if it succeeded
+
+    Args:
+        bm_data (Dict[str, Any]): process data of a finished benchmark
+    """
+    bm_loc = bm_data['tuple']
+    if bm_data['success']:
+      self.graph.remove_edge(bm_loc[0], bm_loc[1], bm_loc[2])
+      logging.debug("benchmark removed: " + str(bm_loc))
+      self.event_journal.record('benchmark_removed', benchmark_id=bm_data['bm'].benchmark_id,
+                                edge=[bm_loc[0], bm_loc[1]])
+
+  def start_benchmark_set(self, bm_list: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+    """Starts the benchmarks for a set of node tuples without waiting on them
+
+    Used by continuous scheduling. Benchmarks keep running in the
+    background and are collected with collect_finished_benchmarks.
+    No more than max_processes benchmarks run at a time, benchmarks
+    that do not fit are left in the graph for a later set.
+
+    Args:
+        bm_list (List[Tuple[int, int]]): list of node_id tuples (node_id, node_id)
+
+    Returns:
+        List[Dict[str, Any]]: process data of the benchmarks that were started
+    """
+    logger.debug("START BENCHMARKS")
+    benchmarks_to_run, benchmarks_to_run_tuples = self.get_benchmarks_to_run(bm_list)
     max_processes = FLAGS.max_processes
 
-    # run benchmarks threaded
-    while bm_index < len(benchmarks_to_run):
-      bm_threads = []
+    started = []
+    for bm_index in range(0, len(benchmarks_to_run)):
+      if max_processes >= 0 and len(self.running_benchmarks) >= max_processes:
+        logger.debug("MAX PROCESSES REACHED")
+        break
+      bm_data = self.start_benchmark_process(benchmarks_to_run[bm_index],
+                                             benchmarks_to_run_tuples[bm_index],
+                                             bm_index)
+      if bm_data is None:
+        continue
+      self.running_benchmarks.append(bm_data)
+      started.append(bm_data)
 
-      thread_count = 0
-      while ((thread_count < max_processes or max_processes < 0) and
-              bm_index < len(benchmarks_to_run)):
-        # TODO change this into a dict?
-        bm = benchmarks_to_run[bm_index]
-
-        # make sure that all vms for benchmark have been created
-        # TODO try to ssh into it to make sure it is up
-        #      or at least ping it
-        vms_created = True
-
-        if FLAGS.precreate_and_share_vms:
-          for vm in bm.vms:
-            if vm.status != "Running":
-              logger.debug("Needed VM is ", vm.status)
-              vms_created = False
-
-          if not vms_created:
-            logger.debug("DO NOT RUN")
-            bm_index += 1
-            continue
-        else:
-          for vm in bm.vms:
-            vm.create_timestamp = time.time()
-
-        # create
-        queue = mp.Queue()
-        logger.debug(bm)
-        p = mp.Process(target=self.run_benchmark_process,
-                       args=(bm,
-                             benchmarks_to_run_tuples[bm_index],
-                             bm_index,
-                             queue))
-
-        bm_data = {}
-        bm_data['bm'] = bm
-        bm_data['tuple'] = benchmarks_to_run_tuples[bm_index]
-        bm_data['process'] = p
-        bm_data['queue'] = queue
-        # bm_data = [bm, benchmarks_to_run_tuples[bm_index], p, queue]
-        bm_all_thread_results.append(bm_data)
-        bm_threads.append(bm_data)
-        p.start()
-        bm_index += 1
-        thread_count += 1
-
-        # TODO check to make sure both VMS are created
-
-      for bm_data in bm_threads:
-        bm_data['process'].join()
-        results_dict = bm_data['queue'].get()
-        self.benchmark_run_times.append(results_dict['run_time'])
-        bm_data['bm'].status = results_dict['status']
-        # TODO make sure this works
-        if not FLAGS.precreate_and_share_vms:
-          for vm in bm_data['bm'].vms:
-            vm.deletion_timestamp = time.time()
-        bm_data['success'] = results_dict['success']
-        logging.debug("thread done")
+    return started
 
-    logging.info("All threads done")
+  def poll_benchmark_processes(self, bm_threads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Records the results of benchmarks that have finished
 
-    # TODO remove only successful benchmarks from graph
-    for bm_data in bm_all_thread_results:
-      bm = bm_data['bm']
-      bm_loc = bm_data['tuple']
-      success = bm_data['success']
-      if success:
-        self.graph.remove_edge(bm_loc[0], bm_loc[1], bm_loc[2])
-        logging.debug("benchmark removed: " + str(bm_loc))
-      else:
-        pass
+    Finished benchmarks are removed from bm_threads
+
+    Args:
+        bm_threads (List[Dict[str, Any]]): process data from start_benchmark_process
+
+    Returns:
+        List[Dict[str, Any]]: process data of the benchmarks that finished
+    """
+    finished = []
+    for bm_data in list(bm_threads):
+      bm_result = self.get_benchmark_result(bm_data, block=False)
+      if bm_result is None:
+        continue
+      self.finish_benchmark_process(bm_data, bm_result)
+      bm_threads.remove(bm_data)
+      finished.append(bm_data)
+      logging.debug("thread done")
+    return finished
+
+  def collect_finished_benchmarks(self, block: bool = True,
+                                  poll_interval: float = 1.0) -> List[Dict[str, Any]]:
+    """Collects benchmarks started by start_benchmark_set that have finished
+
+    Removes the edges of successful benchmarks from the graph, which
+    frees their VMs for the next benchmark set.
 
+    Args:
+        block (bool, optional): wait until at least one benchmark finishes. Defaults to True.
+        poll_interval (float, optional): seconds between checks while waiting. Defaults to 1.0.
+
+    Returns:
+        List[Dict[str, Any]]: process data of the finished benchmarks
+    """
+    finished = []
+    while True:
+      finished = self.poll_benchmark_processes(self.running_benchmarks)
+
+      if finished or not block or len(self.running_benchmarks) == 0:
+        break
+      time.sleep(poll_interval)
+
+    for bm_data in finished:
+      self.remove_benchmark_edge_if_successful(bm_data)
+
+    return finished
+
+  def get_regions_in_use(self) -> Dict[str, Set[str]]:
+    """Returns the regions that host a VM in the graph or a waitlisted VM spec
 
-  def run_benchmark_process(self,
-                            bm: Benchmark,
-                            bm_tuple: Tuple[int,int,int],
-                            result_index: int,
-                            queue: mp.Queue):
-    # ./pkb.py --benchmarks=throughput_latency_jitter
-    # --benchmark_config_file=static_config2.yaml
+    Returns:
+        Dict[str, Set[str]]: region names, keyed by cloud name
+    """
+    regions_in_use = {}
+    for node in self.graph.nodes:
+      vm = self.graph.nodes[node]['vm']
+      region_name = cloud_util.get_region_from_zone(vm.cloud, vm.zone)
+      regions_in_use.setdefault(vm.cloud, set()).add(region_name)
+    for bm in self.benchmark_wait_list:
+      for vm_spec in bm.vm_specs:
+        region_name = cloud_util.get_region_from_zone(vm_spec.cloud, vm_spec.zone)
+        regions_in_use.setdefault(vm_spec.cloud, set()).add(region_name)
+    return regions_in_use
+
+  def get_busy_nodes(self) -> Set[int]:
+    """Returns the node ids of VMs that are running a benchmark
+
+    Returns:
+        Set[int]: node ids of busy VMs
+    """
+    busy_nodes = set()
+    for bm_data in self.running_benchmarks:
+      busy_nodes.add(bm_data['tuple'][0])
+      busy_nodes.add(bm_data['tuple'][1])
+    return busy_nodes
 
-    config_file_path = self.generated_config_path + bm.config_file
 
-    results_dict = {}
-    results_dict['bm_tuple'] = bm_tuple
-    results_dict['result_index'] = result_index
-    results_dict['bm'] = bm
-    results_dict['success'] = False
-    results_dict['run_time'] = None
+  def get_benchmark_command(self, bm: Benchmark) -> str:
+    """Returns the pkb command that runs a benchmark from its config file
 
+    Args:
+        bm (Benchmark): benchmark with a config file
+
+    Returns:
+        str: pkb command
+    """
     bm_clouds = []
     all_vms_have_preexisting_network = True
     for vm in bm.vms:
@@ -967,36 +1457,7 @@ class BenchmarkGraph():
 
     cmd = (cmd + f" --log_level={FLAGS.pkb_log_level}")
 
-    # TODO do install_packages if vm has already been used
-    logger.debug("BM TUPLE")
-    logger.debug(bm_tuple)
-    # print(bm.vm_specs[0].zone)
-    # print(bm.vm_specs[1].zone)
-    logger.debug(bm.config_file)
-    logger.debug("RUN BM: " + cmd)
-    if FLAGS.no_run:
-      results_dict['status'] = "Executed"
-      bm.status = "Executed"
-      results_dict['success'] = True
-      queue.put(results_dict)
-      return
-
-    start_time = time.time()
-    process = subprocess.Popen(cmd.split(),
-                             stdout=subprocess.PIPE)
-    output, error = process.communicate()
-    end_time = time.time()
-    run_time = end_time - start_time
-    # self.benchmark_run_times.append(run_time)
-
-    # TODO make this actually do something on failure
-    bm.status = "Executed"
-    results_dict['status'] = "Executed"
-    results_dict['success'] = True
-    results_dict['run_time'] = run_time
-    queue.put(results_dict)
-    return
-
+    return cmd
 
   def create_benchmark_config_file_static_vm(self,
                                              bm: Benchmark,
@@ -1007,7 +1468,9 @@ class BenchmarkGraph():
 
     config_yaml[bm.benchmark_type] = {}
     config_yaml[bm.benchmark_type]['vm_groups'] = {}
-    config_yaml[bm.benchmark_type]['flags'] = bm.flags
+    # the flags of the benchmark are merged into a new dict here, so
+    # changes for the config file do not change the benchmark
+    config_yaml[bm.benchmark_type]['flags'] = dict(bm.flags)
     config_flags = config_yaml[bm.benchmark_type]['flags']
 
     config_flags.pop("zones", None)
@@ -1061,7 +1524,9 @@ class BenchmarkGraph():
     if bm.vpc_peering:
       config_yaml[bm.benchmark_type]['vpc_peering'] = bm.vpc_peering
     config_yaml[bm.benchmark_type]['vm_groups'] = {}
-    config_yaml[bm.benchmark_type]['flags'] = bm.flags
+    # the flags of the benchmark are merged into a new dict here, so
+    # changes for the config file do not change the benchmark
+    config_yaml[bm.benchmark_type]['flags'] = dict(bm.flags)
     config_flags = config_yaml[bm.benchmark_type]['flags']
 
     config_flags.pop("zones", None)
@@ -1168,7 +1633,7 @@ class BenchmarkGraph():
       if len(bm.vm_specs) == len(vms_no_none) == len(vms):
         bm.vms = vms
         bm.status = 'Not Executed'
-        self.benchmarks.append(bm)
+        # add_benchmark_to_graph adds it to self.benchmarks
         self.add_benchmark_to_graph(bm, vms)
         bms_added.append(bm)
 
@@ -1194,12 +1659,17 @@ class BenchmarkGraph():
     # get dictionary of node degrees from graph
     node_degree_dict = dict(nx.degree(self.graph))
 
-    vm_threads = []
+    # VMs created ahead of time whose benchmarks were moved away
+    # have to finish creating before they can be deleted
+    pending_orphans = [node for node in self.pending_vm_creations
+                       if node_degree_dict.get(node) == 0]
+    self.finish_pending_vm_creations(pending_orphans, block=True)
+
     keys_to_remove = []
     vm_removed_count = 0
 
     if FLAGS.precreate_and_share_vms:
-      # start threads to remove vms
+      vms_to_delete = []
       for key in node_degree_dict.keys():
         # if a node has no edges
         if node_degree_dict[key] == 0:
@@ -1208,17 +1678,9 @@ class BenchmarkGraph():
 
             # TODO check if waitlist needs this node before removal
 
-            # vm.delete_instance(self.pkb_location)
             keys_to_remove.append(key)
-            t = threading.Thread(target=vm.delete_instance,
-                                 args=(self.pkb_location,))
-            vm_threads.append(t)
-            t.start()
-
-      # join threads
-      for t in vm_threads:
-        t.join()
-        logging.debug("Thread Done")
+            vms_to_delete.append(vm)
+      self.delete_vms(vms_to_delete)
 
     else:
       # start threads to remove vms
@@ -1230,13 +1692,82 @@ class BenchmarkGraph():
     for key in keys_to_remove:
       vm = self.graph.nodes[key]['vm']
       logging.debug("VM removed: " + str(key))
-      self.graph.remove_node(key)
+      self.remove_vm_node(key)
       vm_region = cloud_util.get_region_from_zone(vm.cloud, vm.zone)
       self.regions[vm_region].remove_virtual_machine(vm)
       vm_removed_count += 1
 
     return keys_to_remove
 
+  def delete_vms(self, vm_list: List[VirtualMachine]):
+    """Deletes VMs on the cloud and waits for the deletions to finish
+
+    Uses the pkb executor if there is one, otherwise a thread per VM
+
+    Args:
+        vm_list (List[VirtualMachine]): running VMs to delete
+    """
+    vm_threads = []
+    vm_deletions = []
+    for vm in vm_list:
+      if self.pkb_executor and not FLAGS.no_run:
+        cmd = vm.get_delete_command(self.pkb_location)
+        logging.info("DELETING INSTANCE: " + cmd)
+        vm_deletions.append((vm, self.pkb_executor.submit(cmd.split(),
+                                                          label=f"vm {vm.node_id}")))
+        continue
+      t = threading.Thread(target=vm.delete_instance,
+                           args=(self.pkb_location,))
+      vm_threads.append(t)
+      t.start()
+
+    # join threads
+    for t in vm_threads:
+      t.join()
+      logging.debug("Thread Done")
+    for vm, future in vm_deletions:
+      vm.apply_deletion(future.result().run_time)
+    for vm in vm_list:
+      self.record_vm_status('vm_deleted', vm)
+
+  def adopt_vms(self, vm_list: List[VirtualMachine]) -> List[VirtualMachine]:
+    """Takes over VMs that already run on the cloud, ex after a resume
+
+    Each VM replaces an equivalent node that was not created yet, so
+    the benchmarks of that node run on the existing VM
+
+    Args:
+        vm_list (List[VirtualMachine]): running VMs with a run_uri
+
+    Returns:
+        List[VirtualMachine]: VMs no node in the graph needed
+    """
+    unused_vms = []
+    for vm in vm_list:
+      adopted = False
+      for node_id in self.get_equivalent_node_ids(vm):
+        node_vm = self.graph.nodes[node_id]['vm']
+        if node_vm.status != "Not Created" or node_id in self.pending_vm_creations:
+          continue
+        result = pkb_tasks.VmCreationResult(node_id)
+        result.success = True
+        result.internal_ip = vm.internal_ip
+        result.ip_address = vm.ip_address
+        result.name = vm.name
+        result.run_uri = vm.run_uri
+        result.uid = vm.uid
+        result.password = vm.password
+        result.create_timestamp = vm.create_timestamp
+        result.creation_time = vm.creation_time
+        node_vm.apply_creation_result(result)
+        self.record_vm_status('vm_adopted', node_vm)
+        logger.info(f"ADOPTED VM {vm.run_uri} AS NODE {node_id}")
+        adopted = True
+        break
+      if not adopted:
+        unused_vms.append(vm)
+    return unused_vms
+
   def benchmarks_left(self) -> int:
     # TODO fix this
     return len(self.graph.edges) + len(self.benchmark_wait_list)
@@ -0,0 +1,184 @@
+from __future__ import annotations
+import collections.abc
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from typing import List, Dict, Tuple, Set, Any, Optional, Iterable, Iterator
+from benchmark_graph import BenchmarkGraph
+from virtual_machine import VirtualMachine
+
+# Checkpoints of a scheduler run, so a run that dies can be resumed
+# without re-provisioning its VMs or re-running finished benchmarks.
+#
+# A checkpoint is gzipped JSON with the VMs that are running on the
+# cloud, the config indexes of the benchmarks that finished and, for
+# inspection, the benchmarks still in the graph and on the waitlist.
+# Resuming parses the same config again, leaves out the finished
+# benchmarks and adopts the running VMs by run_uri, so benchmarks have
+# to come out of the config in the same order. The config hash is
+# checked for that.
+#
+# VMs that are still being created when a checkpoint is written are not
+# in it yet, they have to be cleaned up by hand if the run dies.
+
+CHECKPOINT_VERSION = 1
+
+
+def get_config_hash(benchmark_config_list: List[Tuple[str, Dict[str, Any]]]) -> str:
+  """Returns a hash of parsed configs that changes when config indexes would
+
+  Args:
+      benchmark_config_list (List[Tuple[str, Dict[str, Any]]]): parsed configs
+
+  Returns:
+      str: sha256 hex digest
+  """
+  config_hash = hashlib.sha256()
+  for benchmark_config in hash_configs(benchmark_config_list, config_hash):
+    pass
+  return config_hash.hexdigest()
+
+
+def _get_json_value(value: Any) -> Any:
+  # BenchmarkFlags hash the same as the dict they stand for
+  if isinstance(value, collections.abc.Mapping):
+    return dict(value)
+  return str(value)
+
+
+def hash_configs(benchmark_configs: Iterable[Tuple[str, Dict[str, Any]]],
+                 config_hash: Any) -> Iterator[Tuple[str, Dict[str, Any]]]:
+  """Passes configs through while adding them to a hash
+
+  Each config is hashed before it is yielded, so the hash is the one of
+  the parsed config even if the caller changes it afterwards. Once every
+  config went through, config_hash.hexdigest() equals get_config_hash
+
+  Args:
+      benchmark_configs (Iterable[Tuple[str, Dict[str, Any]]]): parsed configs
+      config_hash (Any): hashlib.sha256() object to update
+
+  Yields:
+      Tuple[str, Dict[str, Any]]: the configs, unchanged
+  """
+  for benchmark_config in benchmark_configs:
+    config_hash.update(json.dumps(benchmark_config, sort_keys=True,
+                                  default=_get_json_value).encode('utf-8'))
+    yield benchmark_config
+
+
+def create_checkpoint(full_graph: BenchmarkGraph, config_hash: str, rounds: int,
+                      previous_completed: Iterable[int] = ()) -> Dict[str, Any]:
+  """Collects the state of a run that is needed to resume it
+
+  Args:
+      full_graph (BenchmarkGraph): graph of the run
+      config_hash (str): hash of the configs the run was started with
+      rounds (int): number of scheduling rounds done
+      previous_completed (Iterable[int], optional): config indexes of benchmarks
+        completed before the run was resumed, they are not in the graph
+
+  Returns:
+      Dict[str, Any]: json serializable checkpoint
+  """
+  running_vms = [vm.to_dict() for vm in full_graph.virtual_machines
+                 if vm.status == "Running" and vm.run_uri]
+  completed_benchmarks = set(previous_completed)
+  completed_benchmarks.update(bm.config_index for bm in full_graph.benchmarks
+                              if bm.status == "Executed")
+  remaining_benchmarks = []
+  for node_1, node_2, bm in full_graph.graph.edges.data('bm'):
+    remaining_benchmarks.append(bm.to_dict())
+
+  return {
+    'version': CHECKPOINT_VERSION,
+    'config_hash': config_hash,
+    'timestamp': time.time(),
+    'rounds': rounds,
+    'vms': running_vms,
+    'completed_benchmarks': sorted(completed_benchmarks),
+    'remaining_benchmarks': remaining_benchmarks,
+    'waitlist': [bm.to_dict() for bm in full_graph.benchmark_wait_list],
+  }
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]):
+  """Writes a checkpoint without ever leaving a partly written file at path
+
+  The checkpoint is written to a temporary file in the same directory
+  and moved over path, which is atomic on POSIX and Windows
+
+  Args:
+      path (str): checkpoint file
+      checkpoint (Dict[str, Any]): checkpoint from create_checkpoint
+  """
+  directory = os.path.dirname(os.path.abspath(path))
+  file_descriptor, temp_path = tempfile.mkstemp(prefix='.checkpoint-', dir=directory)
+  try:
+    with os.fdopen(file_descriptor, 'wb') as raw_file:
+      with gzip.GzipFile(fileobj=raw_file, mode='wb') as checkpoint_file:
+        checkpoint_file.write(json.dumps(checkpoint, separators=(',', ':')).encode('utf-8'))
+      raw_file.flush()
+      os.fsync(raw_file.fileno())
+    os.replace(temp_path, path)
+  except BaseException:
+    if os.path.exists(temp_path):
+      os.remove(temp_path)
+    raise
+  logging.getLogger('pkb_scheduler').info(
+    f"CHECKPOINT SAVED: {len(checkpoint['vms'])} VMS, "
+    f"{len(checkpoint['completed_benchmarks'])} BENCHMARKS COMPLETED")
+
+
+def load_checkpoint(path: str, config_hash: Optional[str] = None) -> Dict[str, Any]:
+  """Reads a checkpoint written by save_checkpoint
+
+  Args:
+      path (str): checkpoint file
+      config_hash (Optional[str], optional): hash of the configs of the
+        resumed run, checked against the checkpoint. Defaults to None.
+
+  Raises:
+      ValueError: the checkpoint has another version or was made from other configs
+
+  Returns:
+      Dict[str, Any]: checkpoint
+  """
+  with gzip.open(path, 'rb') as checkpoint_file:
+    checkpoint = json.loads(checkpoint_file.read().decode('utf-8'))
+
+  if checkpoint.get('version') != CHECKPOINT_VERSION:
+    raise ValueError(f"Checkpoint {path} has version {checkpoint.get('version')}, "
+                     f"expected {CHECKPOINT_VERSION}")
+  if config_hash is not None:
+    check_config_hash(checkpoint, config_hash, path)
+  return checkpoint
+
+
+def check_config_hash(checkpoint: Dict[str, Any], config_hash: str, path: str = 'checkpoint'):
+  """Checks that a checkpoint was made from the same configs as the resumed run
+
+  Args:
+      checkpoint (Dict[str, Any]): checkpoint from load_checkpoint
+      config_hash (str): hash of the configs of the resumed run
+      path (str, optional): checkpoint file, for the error message. Defaults to 'checkpoint'.
+
+  Raises:
+      ValueError: the checkpoint was made from other configs
+  """
+  if checkpoint['config_hash'] != config_hash:
+    raise ValueError(f"Checkpoint {path} was made from different configs, "
+                     "resume with the configs of the original run")
+
+
+def get_completed_config_indexes(checkpoint: Dict[str, Any]) -> Set[int]:
+  return set(checkpoint['completed_benchmarks'])
+
+
+def get_running_vms(checkpoint: Dict[str, Any]) -> List[VirtualMachine]:
+  return [VirtualMachine.from_dict(vm_dict) for vm_dict in checkpoint['vms']]
@@ -2,10 +2,14 @@ import subprocess
 import json
 import re
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple, Set, Any, Sequence, Optional
 
 # TODO add support for additional clouds
 
+# max cli calls for per region quotas running at once, per cloud
+REGION_QUERY_CONCURRENCY = {'AWS': 8, 'AZURE': 4}
+
 
 def cpu_count_from_machine_type(cloud: str, machine_type: str) -> int:
   """Given a cloud and a machine type, return the associated cpu count
@@ -77,11 +81,17 @@ def cpu_type_from_machine_type(cloud: str, machine_type: str) -> str:
     return None
 
 
-def get_region_info(cloud: str):
+def get_region_info(cloud: str, max_workers: Optional[int] = None, regions: Optional[List[str]] = None):
   """get quota info for all regions in a specified cloud
+
+  AWS and Azure need cli calls for every region, these are run
+  at the same time, up to REGION_QUERY_CONCURRENCY per cloud
   
   Args:
     cloud: string in ['AWS','GCP','AZURE']
+    max_workers: max region queries at once, overrides REGION_QUERY_CONCURRENCY
+    regions: only query these regions. GCP returns every region in one call,
+             so this only skips calls for AWS and Azure
   
   Returns:
     region_dict: dictionary containing quota info about each region in a cloud
@@ -106,125 +116,139 @@ def get_region_info(cloud: str):
     return region_dict
   elif cloud == 'AWS':
     logging.info("Querying data from AWS")
-    # Get list of all AWS regions
-    region_list_command = 'aws ec2 describe-regions'
-    process = subprocess.Popen(region_list_command.split(),
-                               stdout=subprocess.PIPE)
-    output, error = process.communicate()
-    # load json and convert to a more useable output
-    region_json = json.loads((output.decode('utf-8')))
+    region_names = regions
+    if region_names is None:
+      # Get list of all AWS regions
+      region_json = _run_cli_json('aws ec2 describe-regions')
+      region_names = [region_iter['RegionName'] for region_iter in region_json['Regions']]
 
     # Get current VPC and VM usage info for each AWS region
-    for region_iter in region_json['Regions']:
-      region_name = region_iter['RegionName']
-      region_dict[region_name] = {}
+    return _query_regions(region_names, _get_aws_region_quotas,
+                          max_workers or REGION_QUERY_CONCURRENCY['AWS'])
+  elif cloud.upper() == "AZURE":
+    # region_dict has the following structure:
+    #
+    # region_dict = {'region1': {'region_name': 'region1',
+    #                            'QUOTA1': [usage, limit],
+    #                            'QUOTA2': [usage, limit]
+    #                           }
+    #               }
+    region_names = regions
+    if region_names is None:
+      region_json = _run_cli_json('az account list-locations')
+      region_names = [region_iter['name'] for region_iter in region_json]
 
-      # region_list_command = f"aws configure set region {region_name}"
-      # process = process = subprocess.Popen(region_list_command, stdout=subprocess.PIPE, shell=True)
-      # output, error = process.communicate()
+    region_dict = _query_regions(region_names, _get_azure_region_quotas,
+                                 max_workers or REGION_QUERY_CONCURRENCY['AZURE'])
+    print(f"Region Dict: {region_dict}")
 
-      region_list_command = f"aws ec2 describe-instances --query Reservations[].Instances[] --region={region_name}"
-      process = process = subprocess.Popen(region_list_command, stdout=subprocess.PIPE, shell=True)
-      output, error = process.communicate()
-      output = json.loads(output.decode('utf-8'))
+    return region_dict
+  else:
+    pass
 
-      region_dict[region_name]['vm'] ={}
-      region_dict[region_name]['vm']['limit'] = 1920
-      region_dict[region_name]['vm']['usage'] = len(output)
+  return region_dict
 
-      region_list_command = f"aws ec2 describe-vpcs --region={region_name}"
-      process = process = subprocess.Popen(region_list_command, stdout=subprocess.PIPE, shell=True)
-      output, error = process.communicate()
-      output = json.loads(output.decode('utf-8'))
 
-      region_dict[region_name]['vpc'] ={}
-      region_dict[region_name]['vpc']['limit'] = 5
-      region_dict[region_name]['vpc']['usage'] = len(output['Vpcs'])
+def _run_cli_json(command: str, shell: bool = False) -> Any:
+  """Runs a cloud cli command and loads its json output
 
-      region_list_command = f"aws ec2 describe-addresses --region={region_name}"
-      process = process = subprocess.Popen(region_list_command, stdout=subprocess.PIPE, shell=True)
-      output, error = process.communicate()
-      output = json.loads(output.decode('utf-8'))
+  Args:
+      command (str): command to run
+      shell (bool, optional): run the command through the shell. Defaults to False.
 
-      region_dict[region_name]['elastic_ip'] ={}
-      region_dict[region_name]['elastic_ip']['limit'] = 5
-      region_dict[region_name]['elastic_ip']['usage'] = len(output['Addresses'])
+  Returns:
+      Any: loaded json
+  """
+  if not shell:
+    command = command.split()
+  process = subprocess.Popen(command, stdout=subprocess.PIPE, shell=shell)
+  output, error = process.communicate()
+  return json.loads(output.decode('utf-8'))
 
-    return region_dict
-  elif cloud.upper() == "AZURE":
-    # Troy PUT CODE HERE
-    # fetch quota data from az cli (NOTE: there are two versions of azure cli. Use the newer version that uses the command 'az')
-    # figure out important quota data per region, if quotas are for the whole cloud instead of each region, we'll need to
-    # do something else
 
-    # region_dict should have the following structure (or something similar):
-    #
-    # region_dict = {'region1': {'quota1': {'limit': 10, 
-    #                                        'usage': 3}, 
-    #                             'quota2': {'limit': 50,
-    #                                        'usage': 30}
-    #                            }
-    #                'region2': {'quota1': {'limit': 10, 
-    #                                       'usage': 3}, 
-    #                            'quota2': {'limit': 50,
-    #                                       'usage': 30}
-    #                           }
-    #               }
-    # basically its dictionaries all the way down
-    region_list_command = 'az account list-locations'
-    process = subprocess.Popen(region_list_command.split(),
-                               stdout=subprocess.PIPE)
-    output, error = process.communicate()
-    # load json and convert to a more useable output
-    region_json = json.loads((output.decode('utf-8')))
-     
-    for region_iter in region_json:
-      try:
-        #print(f"region_iter is: {region_iter}")
-        # if region_iter['metadata']['regionCategory'] != 'Recommended':
-        #   continue
-        region_name = region_iter['name']
-        region_dict[region_name] = {"region_name" : region_name}
-        region_list_command = f'az vm list-usage --location "{region_name}"'
-        #print(f"region list commmand is: {region_list_command}")
-        process = process = subprocess.Popen(region_list_command, stdout=subprocess.PIPE, shell=True)
-        output, error = process.communicate()
-        #print(f"region diect: {region_dict}")
-        output = json.loads(output.decode('utf-8'))
-        #print(f"region_list_command is: {output}")
-        #print(f"Pre For Loop")
-        for quota_iter in output:
-          #print(f" variable is  and the result is: {quota_iter['currentValue']} and  {quota_iter['limit']}")
-          quotaName = quota_iter["localName"]
-          #print(f"region_dict is : {region_dict} \n\n quota name is: {quotaName}")
-          region_dict[region_name][quotaName.upper()] = [int(quota_iter["currentValue"]), int(quota_iter["limit"])]
-        #az network list-usages --location eastus --out table
-        region_list_command = f'az network list-usages --location "{region_name}"'
-        #print(f"region list commmand is: {region_list_command}")
-        #Public IP Addresses - Basic
-        process = process = subprocess.Popen(region_list_command, stdout=subprocess.PIPE, shell=True)
-        output, error = process.communicate()
-        #print(f"region diect: {region_dict}")
-        output = json.loads(output.decode('utf-8'))
-        #print(f"region_list_command is: {output}")
-        #print(f"Pre For Loop")
-        for quota_iter in output:
-          #print(f" variable is  and the result is: {quota_iter['currentValue']} and  {quota_iter['limit']}")
-          quotaName = quota_iter["localName"]
-          #print(f"region_dict is : {region_dict} \n\n quota name is: {quotaName}")
-          region_dict[region_name][quotaName.upper()] = [int(quota_iter["currentValue"]), int(quota_iter["limit"])]
-        #print(f"the region dict should be: {region_dict[region_name]}")
-      except:
-        print(f"Error occurred when reading in quotas. Region was {region_name}")
-    print(f"Region Dict: {region_dict}")
+def _query_regions(region_names: List[str], query_function, max_workers: int) -> Dict[str, Any]:
+  """Runs a quota query for every region on a bounded thread pool
 
-    return region_dict
-  else:
-    pass
+  Each query only waits on a cli subprocess, so threads are enough
+  to run them at the same time
+
+  Args:
+      region_names (List[str]): regions to query
+      query_function: function that takes a region name and returns its quota
+        dict, or None if the query failed
+      max_workers (int): max queries running at once
 
+  Returns:
+      Dict[str, Any]: quota dict of each region, in the order of region_names.
+        Regions whose query failed are left out
+  """
+  region_dict = {}
+  with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+    region_quotas = executor.map(query_function, region_names)
+    for region_name, quotas in zip(region_names, region_quotas):
+      if quotas is None:
+        continue
+      region_dict[region_name] = quotas
   return region_dict
 
 
+def _get_aws_region_quotas(region_name: str) -> Dict[str, Any]:
+  """Get VM, VPC and elastic ip usage of an AWS region
+
+  Args:
+      region_name (str): name of the region
+
+  Returns:
+      Dict[str, Any]: quota dict of the region
+  """
+  quotas = {}
+
+  output = _run_cli_json(f"aws ec2 describe-instances --query Reservations[].Instances[] --region={region_name}",
+                         shell=True)
+  quotas['vm'] = {}
+  quotas['vm']['limit'] = 1920
+  quotas['vm']['usage'] = len(output)
+
+  output = _run_cli_json(f"aws ec2 describe-vpcs --region={region_name}", shell=True)
+  quotas['vpc'] = {}
+  quotas['vpc']['limit'] = 5
+  quotas['vpc']['usage'] = len(output['Vpcs'])
+
+  output = _run_cli_json(f"aws ec2 describe-addresses --region={region_name}", shell=True)
+  quotas['elastic_ip'] = {}
+  quotas['elastic_ip']['limit'] = 5
+  quotas['elastic_ip']['usage'] = len(output['Addresses'])
+
+  return quotas
+
+
+def _get_azure_region_quotas(region_name: str) -> Optional[Dict[str, Any]]:
+  """Get compute and network usage of an Azure location
+
+  Args:
+      region_name (str): name of the location
+
+  Returns:
+      Optional[Dict[str, Any]]: quota dict of the location, values are
+        [usage, limit]. None if the az cli calls failed
+  """
+  quotas = {"region_name" : region_name}
+  try:
+    output = _run_cli_json(f'az vm list-usage --location "{region_name}"', shell=True)
+    for quota_iter in output:
+      quotaName = quota_iter["localName"]
+      quotas[quotaName.upper()] = [int(quota_iter["currentValue"]), int(quota_iter["limit"])]
+    #Public IP Addresses - Basic
+    output = _run_cli_json(f'az network list-usages --location "{region_name}"', shell=True)
+    for quota_iter in output:
+      quotaName = quota_iter["localName"]
+      quotas[quotaName.upper()] = [int(quota_iter["currentValue"]), int(quota_iter["limit"])]
+  except Exception as e:
+    logging.warning(f"Error occurred when reading in quotas. Region was {region_name}: {e}")
+    return None
+  return quotas
+
+
 def get_cloud_quotas(cloud: str) -> Dict[str,Any]:
   """Get cloud-wide quotas for each cloud service
   
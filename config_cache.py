@@ -0,0 +1,98 @@
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import zlib
+
+from typing import List, Dict, Tuple, Set, Any, Optional
+
+# Cache of parsed config files, so config directories that are run again
+# unchanged skip YAML parsing and flag_matrix expansion.
+#
+# Each config file has one cache file in the cache directory, named
+# after a hash of its absolute path. The cache file is a zlib compressed
+# pickle of the parser version, the path, a hash of the config file's
+# contents and what parsing the file produced. It is only used when all
+# three still match, a changed file is parsed again and its entry
+# replaced. Bump PARSER_VERSION when the parsed output of a config file
+# changes, so entries written by older versions are not used.
+
+PARSER_VERSION = 1
+
+logger = None
+
+
+def get_content_hash(contents: bytes) -> str:
+  return hashlib.sha256(contents).hexdigest()
+
+
+class ConfigCache():
+  """Parsed config files cached on disk by path and content hash
+
+  Attributes:
+      directory (str): directory of the cache files
+      parser_version (int): version entries must have to be used
+  """
+
+  def __init__(self, directory: str, parser_version: int = PARSER_VERSION):
+    global logger
+    logger = logging.getLogger('pkb_scheduler')
+
+    self.directory = directory
+    self.parser_version = parser_version
+    os.makedirs(directory, exist_ok=True)
+
+  def get_cache_path(self, path: str) -> str:
+    path_hash = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()
+    return os.path.join(self.directory, path_hash[:32] + '.pkl.z')
+
+  def load(self, path: str, content_hash: str) -> Optional[Any]:
+    """Returns the cached parse of a config file
+
+    Args:
+        path (str): config file
+        content_hash (str): get_content_hash of the file's current contents
+
+    Returns:
+        Optional[Any]: what was stored for the file, None if there is no
+          entry for these contents and parser version
+    """
+    try:
+      with open(self.get_cache_path(path), 'rb') as cache_file:
+        version, cached_path, cached_hash, parsed = pickle.loads(zlib.decompress(cache_file.read()))
+    except FileNotFoundError:
+      return None
+    except Exception as e:
+      # a broken entry is parsed again and overwritten
+      logger.debug(f"CONFIG CACHE ENTRY FOR {path} IS UNREADABLE: {e}")
+      return None
+
+    if (version != self.parser_version or cached_path != os.path.abspath(path)
+        or cached_hash != content_hash):
+      return None
+    return parsed
+
+  def store(self, path: str, content_hash: str, parsed: Any):
+    """Stores the parse of a config file
+
+    The entry is written to a temporary file and moved in place, so
+    processes parsing files at the same time never read a partial entry
+
+    Args:
+        path (str): config file
+        content_hash (str): get_content_hash of the contents that were parsed
+        parsed (Any): picklable parse of the file
+    """
+    data = zlib.compress(pickle.dumps((self.parser_version, os.path.abspath(path), content_hash, parsed),
+                                      protocol=pickle.HIGHEST_PROTOCOL))
+    file_descriptor, temp_path = tempfile.mkstemp(prefix='.config-', dir=self.directory)
+    try:
+      with os.fdopen(file_descriptor, 'wb') as cache_file:
+        cache_file.write(data)
+      os.replace(temp_path, self.get_cache_path(path))
+    except BaseException:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+      raise
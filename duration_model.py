@@ -0,0 +1,144 @@
+from __future__ import annotations
+import hashlib
+import json
+import statistics
+
+from typing import List, Dict, Tuple, Set, Any, Optional
+from benchmark import Benchmark
+
+# flags that pick where a benchmark runs, not how long it runs
+PLACEMENT_FLAGS = ['zones', 'extra_zones', 'machine_type', 'cloud',
+                   'bigquery_table', 'bq_project', 'estimated_bandwidth',
+                   'gce_network_name', 'gce_subnet_name', 'aws_vpc', 'aws_subnet',
+                   'static_cloud_metadata', 'static_network_tier_metadata']
+
+# rough pkb defaults (seconds) used when a flag is not set
+DEFAULT_NETPERF_TEST_LENGTH = 60
+DEFAULT_NETPERF_BENCHMARKS = 'TCP_RR,TCP_CRR,TCP_STREAM,UDP_RR'
+DEFAULT_IPERF_RUNTIME = 60
+DEFAULT_PING_DURATION = 60
+# time pkb spends on everything but the test itself (ssh, installs, cleanup)
+RUN_OVERHEAD = 120
+DEFAULT_DURATION = 600
+
+
+def get_flag_fingerprint(flags: Dict[str, Any]) -> str:
+  """Returns a short hash of the flags that affect how long a benchmark runs
+
+  Args:
+      flags (Dict[str, Any]): benchmark flags
+
+  Returns:
+      str: fingerprint of the flags
+  """
+  timing_flags = {}
+  for key in flags:
+    if key not in PLACEMENT_FLAGS:
+      timing_flags[key] = flags[key]
+  flags_json = json.dumps(timing_flags, sort_keys=True, default=str)
+  return hashlib.md5(flags_json.encode('utf-8')).hexdigest()[:12]
+
+
+def _count_values(value: Any, default: int = 1) -> int:
+  """Counts the entries of a comma separated flag value like '1,4,32'
+  """
+  if value is None:
+    return default
+  if isinstance(value, (list, tuple)):
+    return max(len(value), 1)
+  return max(len(str(value).split(',')), 1)
+
+
+def estimate_duration_from_flags(benchmark_type: str, flags: Dict[str, Any]) -> float:
+  """Estimates how long a benchmark will run from its flags alone
+
+  Args:
+      benchmark_type (str): name of the pkb benchmark
+      flags (Dict[str, Any]): benchmark flags
+
+  Returns:
+      float: estimated run time in seconds
+  """
+  # tests are run once per ip address type when ip_addresses is BOTH
+  ip_address_factor = 1
+  if str(flags.get('ip_addresses', 'EXTERNAL')).upper() == 'BOTH':
+    ip_address_factor = 2
+
+  netperf_time = (float(flags.get('netperf_test_length', DEFAULT_NETPERF_TEST_LENGTH)) *
+                  _count_values(flags.get('netperf_benchmarks', DEFAULT_NETPERF_BENCHMARKS)) *
+                  _count_values(flags.get('netperf_num_streams')))
+  iperf_time = (float(flags.get('iperf_runtime_in_seconds', DEFAULT_IPERF_RUNTIME)) *
+                _count_values(flags.get('iperf_sending_thread_count')))
+  ping_time = DEFAULT_PING_DURATION
+
+  if benchmark_type == 'netperf':
+    test_time = netperf_time
+  elif benchmark_type == 'iperf':
+    test_time = iperf_time
+  elif benchmark_type == 'ping':
+    test_time = ping_time
+  elif benchmark_type == 'throughput_latency_jitter':
+    test_time = netperf_time + iperf_time + ping_time
+  else:
+    return DEFAULT_DURATION
+
+  return RUN_OVERHEAD + test_time * ip_address_factor
+
+
+class BenchmarkDurationModel():
+  """Estimates benchmark run times per benchmark type and flag set
+
+  Uses the median of the run times recorded for the same benchmark type
+  and flag fingerprint, then the median of past runs in the run history,
+  and falls back to an estimate from the test length flags when nothing
+  has been recorded yet
+
+  Attributes:
+      history (Dict[Tuple[str, str], List[float]]): recorded run times
+        keyed by (benchmark_type, flag fingerprint)
+      run_history (Optional[RunHistory]): run times of past runs
+  """
+
+  def __init__(self, run_history=None):
+    self.history = {}
+    self.run_history = run_history
+    self._flag_estimates = {}
+    # id(bm) -> key, benchmarks stay referenced by the graph for the whole run
+    self._keys = {}
+
+  def get_key(self, bm: Benchmark) -> Tuple[str, str]:
+    if id(bm) not in self._keys:
+      self._keys[id(bm)] = (bm.benchmark_type, get_flag_fingerprint(bm.flags))
+    return self._keys[id(bm)]
+
+  def record(self, bm: Benchmark, run_time: Optional[float]):
+    """Records the run time of a finished benchmark
+
+    Args:
+        bm (Benchmark): finished benchmark
+        run_time (Optional[float]): run time in seconds, ignored if None
+    """
+    if run_time is None:
+      return
+    self.history.setdefault(self.get_key(bm), []).append(run_time)
+
+  def estimate(self, bm: Benchmark) -> float:
+    """Estimates the run time of a benchmark
+
+    Args:
+        bm (Benchmark): benchmark to estimate
+
+    Returns:
+        float: estimated run time in seconds
+    """
+    key = self.get_key(bm)
+    if key in self.history:
+      return statistics.median(self.history[key])
+    if key not in self._flag_estimates:
+      estimate = None
+      if self.run_history is not None:
+        estimate = self.run_history.estimate_benchmark_run_time(*key)
+      if estimate is None:
+        estimate = estimate_duration_from_flags(bm.benchmark_type, bm.flags)
+      self._flag_estimates[key] = estimate
+    return self._flag_estimates[key]
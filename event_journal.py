@@ -0,0 +1,157 @@
+from __future__ import annotations
+import json
+import os
+import time
+
+from typing import List, Dict, Tuple, Set, Any, Optional, Iterator
+
+# bytes read from the end of a journal to find its last event
+TAIL_SIZE = 65536
+
+
+class EventJournal():
+  """Appends every scheduling decision of a run to a JSONL file
+
+  Each line is one event, {"seq": 0, "time": 1600000000.0, "event": "vm_added", ...},
+  in the order the decisions were made. replay_journal.py rebuilds the
+  benchmark graph at any point of a run from these lines. A journal
+  without a path records nothing, so callers never have to check for one.
+
+  Lines are buffered, they are flushed at the start of every round and
+  when the journal is closed.
+
+  A resumed run appends to the journal of the run it resumes. Sequence
+  numbers continue from the last event already in the file, so they are
+  unique across every run in it.
+
+  Attributes:
+      path (Optional[str]): JSONL file events are appended to
+      seq (int): sequence number of the next event
+  """
+
+  def __init__(self, path: Optional[str] = None):
+    self.path = path
+    self.seq = 0
+    self._file = None
+    if path:
+      ends_with_newline = True
+      if os.path.exists(path):
+        last_seq = get_last_seq(path)
+        if last_seq is not None:
+          self.seq = last_seq + 1
+        with open(path, 'rb') as journal_file:
+          journal_file.seek(0, os.SEEK_END)
+          if journal_file.tell() > 0:
+            journal_file.seek(-1, os.SEEK_END)
+            ends_with_newline = journal_file.read(1) == b'\n'
+      self._file = open(path, 'a')
+      if not ends_with_newline:
+        # a line cut off by a crash is ended, so it stays unreadable on its own
+        self._file.write('\n')
+      self.record('run_started', pid=os.getpid())
+
+  @property
+  def enabled(self) -> bool:
+    return self._file is not None
+
+  def record(self, event: str, **fields: Any):
+    """Appends an event
+
+    Args:
+        event (str): type of the event, ex benchmark_added
+        **fields (Any): json serializable fields of the event
+    """
+    if self._file is None:
+      return
+    line = {'seq': self.seq, 'time': time.time(), 'event': event}
+    line.update(fields)
+    self._file.write(json.dumps(line, separators=(',', ':'), default=str) + '\n')
+    self.seq += 1
+
+  def flush(self):
+    if self._file is not None:
+      self._file.flush()
+
+  def close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+
+def get_vm_fields(vm) -> Dict[str, Any]:
+  """Returns the fields of a VM that are journaled when it is added
+
+  Args:
+      vm (VirtualMachine): VM
+
+  Returns:
+      Dict[str, Any]: spec of the VM, without credentials
+  """
+  return {
+    'node_id': vm.node_id,
+    'cloud': vm.cloud,
+    'zone': vm.zone,
+    'machine_type': vm.machine_type,
+    'os_type': vm.os_type,
+    'cpu_count': vm.cpu_count,
+    'network_tier': vm.network_tier,
+    'network_name': vm.network_name,
+    'subnet_name': vm.subnet_name,
+    'preexisting_network': vm.preexisting_network,
+    'status': vm.status,
+  }
+
+
+def get_last_seq(path: str) -> Optional[int]:
+  """Returns the sequence number of the last complete event of a journal
+
+  Only the end of the file is read, unless its last lines are too long
+
+  Args:
+      path (str): JSONL journal
+
+  Returns:
+      Optional[int]: sequence number, None if the journal has no events
+  """
+  with open(path, 'rb') as journal_file:
+    journal_file.seek(0, os.SEEK_END)
+    size = journal_file.tell()
+    offset = max(size - TAIL_SIZE, 0)
+    journal_file.seek(offset)
+    lines = journal_file.read().split(b'\n')
+  # the piece after the last newline is empty or cut off, the one
+  # before the first newline may start in the middle of a line
+  complete_lines = lines[:-1] if offset == 0 else lines[1:-1]
+  for line in reversed(complete_lines):
+    try:
+      return json.loads(line)['seq']
+    except (ValueError, KeyError, TypeError):
+      continue
+  if offset == 0:
+    return None
+  last_seq = None
+  for event in read_events(path):
+    last_seq = event['seq']
+  return last_seq
+
+
+def read_events(path: str) -> Iterator[Dict[str, Any]]:
+  """Reads the events of a journal in the order they were written
+
+  A line cut off by a crash is skipped
+
+  Args:
+      path (str): JSONL journal
+
+  Yields:
+      Dict[str, Any]: events
+  """
+  with open(path) as journal_file:
+    for line in journal_file:
+      if not line.endswith('\n'):
+        return
+      try:
+        event = json.loads(line)
+      except ValueError:
+        continue
+      yield event
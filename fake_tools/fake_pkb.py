@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Stand-in for PerfKitBenchmarker's pkb.py. It takes the same command
+# lines the scheduler builds, sleeps for a configurable time and prints
+# the vm_setup info section the scheduler parses after a creation.
+#
+# PATH=$PWD/fake_tools:$PATH FAKE_PKB_CREATE_TIME=20,60 FAKE_PKB_RUN_TIME=60,300 \
+#   python3 pkb_scheduler.py --config=gartner_all.yaml \
+#   --pkb_location=$PWD/fake_tools/fake_pkb.py --upload_results=False
+#
+# See fake_tool_util.py for every environment variable.
+import sys
+import uuid
+import fake_tool_util
+
+
+def create_vm(argv):
+  zone = fake_tool_util.get_arg(argv, 'zones') or 'fake-zone'
+  print(f"Provisioning resources in {zone}")
+  fake_tool_util.sleep_latency('FAKE_PKB_CREATE_TIME', (1.0, 3.0))
+  if fake_tool_util.should_fail('FAKE_PKB_CREATE_FAILURE_RATE'):
+    print(f"ERROR: fake quota exceeded in {zone}", file=sys.stderr)
+    sys.exit(1)
+
+  run_uri = uuid.uuid4().hex[:8]
+  host = int(run_uri[:4], 16)
+  print("----- VM INFO -----")
+  print(f"NAME: pkb-{run_uri}-0")
+  print(f"INTERNAL_IP: 10.{host // 256 % 256}.{host % 256}.2")
+  print(f"EXTERNAL_IP: 203.0.{host // 256 % 256}.{host % 256}")
+  print(f"RUN_URI: {run_uri}")
+  print(f"UID: vm_setup0-{run_uri}")
+  if 'windows' in (fake_tool_util.get_arg(argv, 'os_type') or ''):
+    print(f"PASSWORD: fake-{run_uri}")
+
+
+def delete_vm(argv):
+  run_uri = fake_tool_util.get_arg(argv, 'run_uri')
+  print(f"Tearing down resources for run uri {run_uri}")
+  fake_tool_util.sleep_latency('FAKE_PKB_DELETE_TIME', (0.5, 1.0))
+
+
+def run_benchmark(argv):
+  benchmarks = fake_tool_util.get_arg(argv, 'benchmarks') or 'unknown'
+  print(f"Running {benchmarks}")
+  fake_tool_util.sleep_latency('FAKE_PKB_RUN_TIME', (2.0, 5.0))
+  if fake_tool_util.should_fail('FAKE_PKB_RUN_FAILURE_RATE'):
+    print(f"ERROR: fake failure of {benchmarks}", file=sys.stderr)
+    sys.exit(1)
+  print(f"{benchmarks} SUCCEEDED")
+
+
+def main(argv):
+  run_stage = fake_tool_util.get_arg(argv, 'run_stage') or ''
+  if 'provision' in run_stage:
+    create_vm(argv)
+  elif 'teardown' in run_stage:
+    delete_vm(argv)
+  else:
+    run_benchmark(argv)
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,130 @@
+# Shared helpers for the stand-ins of pkb.py, gcloud, aws and az in
+# fake_tools. They only use the standard library, so the scheduler can
+# be run end to end on a machine without pkb, cloud clis or a network.
+#
+# Every stand-in is configured through environment variables:
+#
+#   FAKE_CLI_LATENCY              seconds a cloud cli call takes, "0.2" or "0.1,0.5"
+#   FAKE_CLI_FAILURE_RATE         fraction of cloud cli calls that fail
+#   FAKE_QUOTA_LIMIT              limit of every quota metric
+#   FAKE_QUOTA_LIMIT_<METRIC>     limit of one metric, ex FAKE_QUOTA_LIMIT_N2_CPUS
+#   FAKE_QUOTA_USAGE              usage of every quota metric
+#   FAKE_QUOTA_USAGE_<METRIC>     usage of one metric
+#   FAKE_GCP_REGIONS              comma separated GCP regions
+#   FAKE_AWS_REGIONS              comma separated AWS regions
+#   FAKE_AZURE_REGIONS            comma separated Azure locations
+#   FAKE_PKB_CREATE_TIME          seconds a VM creation takes
+#   FAKE_PKB_DELETE_TIME          seconds a VM deletion takes
+#   FAKE_PKB_RUN_TIME             seconds a benchmark run takes
+#   FAKE_PKB_CREATE_FAILURE_RATE  fraction of VM creations that fail
+#   FAKE_PKB_RUN_FAILURE_RATE     fraction of benchmark runs that fail
+#   FAKE_TOOLS_SEED               seed for the random failures and latencies
+import os
+import random
+import re
+import sys
+import time
+
+from typing import List, Tuple, Optional
+
+
+DEFAULT_QUOTA_LIMIT = 1000
+
+_rng = None
+
+
+def get_rng() -> random.Random:
+  global _rng
+  if _rng is None:
+    seed = os.environ.get('FAKE_TOOLS_SEED')
+    # every process gets its own stream, or all of them would fail together
+    _rng = random.Random(f"{seed}-{os.getpid()}" if seed is not None else None)
+  return _rng
+
+
+def get_float(name: str, default: float) -> float:
+  value = os.environ.get(name)
+  if value is None or value == "":
+    return default
+  return float(value)
+
+
+def get_list(name: str, default: List[str]) -> List[str]:
+  value = os.environ.get(name)
+  if not value:
+    return default
+  return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def get_latency_range(name: str, default: Tuple[float, float]) -> Tuple[float, float]:
+  """Reads a latency, either "seconds" or "low,high" for a uniform range
+  """
+  value = os.environ.get(name)
+  if not value:
+    return default
+  bounds = [float(bound) for bound in value.split(',')]
+  if len(bounds) == 1:
+    return (bounds[0], bounds[0])
+  return (bounds[0], bounds[1])
+
+
+def sleep_latency(name: str, default: Tuple[float, float]) -> float:
+  low, high = get_latency_range(name, default)
+  latency = get_rng().uniform(low, high)
+  if latency > 0:
+    time.sleep(latency)
+  return latency
+
+
+def should_fail(name: str) -> bool:
+  return get_rng().random() < get_float(name, 0.0)
+
+
+def _metric_env_name(metric: str) -> str:
+  return re.sub('[^A-Z0-9]', '_', metric.upper())
+
+
+def get_quota_limit(metric: str) -> int:
+  default = get_float('FAKE_QUOTA_LIMIT', DEFAULT_QUOTA_LIMIT)
+  return int(get_float('FAKE_QUOTA_LIMIT_' + _metric_env_name(metric), default))
+
+
+def get_quota_usage(metric: str) -> int:
+  default = get_float('FAKE_QUOTA_USAGE', 0)
+  return int(get_float('FAKE_QUOTA_USAGE_' + _metric_env_name(metric), default))
+
+
+def get_arg(argv: List[str], name: str) -> Optional[str]:
+  """Returns the value of --name=value or --name value from argv
+  """
+  prefix = '--' + name + '='
+  for index, argument in enumerate(argv):
+    if argument.startswith(prefix):
+      return argument[len(prefix):].strip('"')
+    if argument == '--' + name and index + 1 < len(argv):
+      return argv[index + 1].strip('"')
+  return None
+
+
+def get_cli_argv() -> List[str]:
+  """Returns the arguments of a cli call
+
+  cloud_util runs some commands through the shell as a single string,
+  so arguments are split again here to handle quoted location names
+  """
+  import shlex
+  return shlex.split(" ".join(sys.argv[1:]))
+
+
+def cli_call(tool: str) -> List[str]:
+  """Sleeps for the cli latency and exits like a failed call if one is drawn
+
+  Returns:
+      List[str]: arguments of the call
+  """
+  argv = get_cli_argv()
+  sleep_latency('FAKE_CLI_LATENCY', (0.2, 0.2))
+  if should_fail('FAKE_CLI_FAILURE_RATE'):
+    print(f"ERROR: ({tool}) fake failure for: {' '.join(argv)}", file=sys.stderr)
+    sys.exit(1)
+  return argv
@@ -0,0 +1,239 @@
+from __future__ import annotations
+import ast
+import collections
+import itertools
+import operator
+import types
+
+from typing import List, Dict, Tuple, Set, Any, Optional, Iterator, Mapping
+
+# Expands a flag_matrix into the axis values of every combination that
+# passes its flag_matrix_filters expression, without building the
+# combinations that do not.
+#
+# The filter is compiled once per config file. Filters that are a
+# comparison, or an "and" of comparisons, between axes and constants
+# (ex "zones < extra_zones") are turned into tables of the values of
+# one axis that pass for each value of another, and the product only
+# walks those values. Any other filter is evaluated as soon as every
+# axis it names has a value, and prunes the rest of the product below
+# that point when it is False.
+#
+# Combinations come out in the same order as itertools.product over
+# the axes sorted by name, like PKB expands them.
+
+COMPARISON_OPERATORS = {
+  ast.Eq: operator.eq,
+  ast.NotEq: operator.ne,
+  ast.Lt: operator.lt,
+  ast.LtE: operator.le,
+  ast.Gt: operator.gt,
+  ast.GtE: operator.ge,
+  ast.In: lambda a, b: a in b,
+  ast.NotIn: lambda a, b: a not in b,
+}
+
+
+class FlagMatrixFilter():
+  """A flag_matrix_filters expression compiled once
+
+  Attributes:
+      expression (str): the filter as written in the config
+      code (types.CodeType): compiled expression
+      names (Set[str]): flag names the expression reads
+      comparisons (Optional[List[Tuple[Any, Any, Any]]]): (left, operator, right)
+        of every comparison if the expression is only comparisons joined by
+        "and", otherwise None. Flag names are ast.Name nodes, constants are values
+  """
+
+  def __init__(self, expression: str):
+    self.expression = expression
+    self.code = compile(expression, '<flag_matrix_filter>', 'eval')
+    self.names = set(self.code.co_names)
+    # names used in comprehensions or lambdas are in nested code objects
+    self.has_nested_code = any(isinstance(const, types.CodeType) for const in self.code.co_consts)
+    self.comparisons = self._get_comparisons(ast.parse(expression, mode='eval').body)
+
+  @staticmethod
+  def _get_operand(node: ast.AST) -> Any:
+    if isinstance(node, ast.Name):
+      return node
+    # raises ValueError for anything that is not a literal
+    return ast.literal_eval(node)
+
+  def _get_comparisons(self, node: ast.AST) -> Optional[List[Tuple[Any, Any, Any]]]:
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+      comparisons = []
+      for value in node.values:
+        value_comparisons = self._get_comparisons(value)
+        if value_comparisons is None:
+          return None
+        comparisons.extend(value_comparisons)
+      return comparisons
+
+    if not isinstance(node, ast.Compare):
+      return None
+    try:
+      operands = [self._get_operand(operand) for operand in [node.left] + node.comparators]
+    except ValueError:
+      return None
+    comparisons = []
+    # a < b < c is a < b and b < c
+    for i in range(0, len(node.ops)):
+      compare = COMPARISON_OPERATORS.get(type(node.ops[i]))
+      if compare is None:
+        return None
+      comparisons.append((operands[i], compare, operands[i + 1]))
+    return comparisons
+
+  def evaluate(self, flags: Mapping[str, Any]) -> bool:
+    """Evaluates the filter the way PKB does
+
+    Args:
+        flags (Mapping[str, Any]): flags of a combination
+
+    Returns:
+        bool: True if the combination is kept
+    """
+    return bool(eval(self.code, {}, flags))
+
+
+def _get_pruning_tables(comparisons: List[Tuple[Any, Any, Any]],
+                        axis_names: List[str],
+                        axis_values: List[List[Any]]) -> Tuple[List[List[int]], Dict[int, List[Tuple[int, List[Set[int]]]]]]:
+  """Turns comparisons into the value indexes each axis may take
+
+  Args:
+      comparisons (List[Tuple[Any, Any, Any]]): from FlagMatrixFilter.comparisons,
+        every flag name must be an axis
+      axis_names (List[str]): axes in product order
+      axis_values (List[List[Any]]): values of each axis
+
+  Returns:
+      Tuple: indexes each axis may take whatever the other axes are, and for
+        each axis a list of (earlier axis, allowed indexes of this axis for
+        each index of the earlier axis)
+  """
+  axis_positions = {name: position for position, name in enumerate(axis_names)}
+  allowed = [set(range(0, len(values))) for values in axis_values]
+  pair_tables = collections.defaultdict(list)
+
+  for left, compare, right in comparisons:
+    left_is_axis = isinstance(left, ast.Name)
+    right_is_axis = isinstance(right, ast.Name)
+    if left_is_axis and right_is_axis:
+      left_position = axis_positions[left.id]
+      right_position = axis_positions[right.id]
+      if left_position == right_position:
+        allowed[left_position] &= {i for i, value in enumerate(axis_values[left_position])
+                                   if compare(value, value)}
+        continue
+      earlier, later = sorted((left_position, right_position))
+      table = []
+      for earlier_value in axis_values[earlier]:
+        passing = set()
+        for later_index, later_value in enumerate(axis_values[later]):
+          if earlier == left_position:
+            passed = compare(earlier_value, later_value)
+          else:
+            passed = compare(later_value, earlier_value)
+          if passed:
+            passing.add(later_index)
+        table.append(passing)
+      pair_tables[later].append((earlier, table))
+    elif left_is_axis or right_is_axis:
+      if left_is_axis:
+        position = axis_positions[left.id]
+        passing = {i for i, value in enumerate(axis_values[position]) if compare(value, right)}
+      else:
+        position = axis_positions[right.id]
+        passing = {i for i, value in enumerate(axis_values[position]) if compare(left, value)}
+      allowed[position] &= passing
+    elif not compare(left, right):
+      allowed = [set() for values in axis_values]
+
+  return [sorted(indexes) for indexes in allowed], pair_tables
+
+
+def _iterate_with_tables(axis_names: List[str], axis_values: List[List[Any]],
+                         comparisons: List[Tuple[Any, Any, Any]]) -> Iterator[Dict[str, Any]]:
+  allowed, pair_tables = _get_pruning_tables(comparisons, axis_names, axis_values)
+  chosen = [0] * len(axis_names)
+
+  def walk(depth: int) -> Iterator[Dict[str, Any]]:
+    if depth == len(axis_names):
+      yield {axis_names[i]: axis_values[i][chosen[i]] for i in range(0, len(axis_names))}
+      return
+    indexes = allowed[depth]
+    for earlier, table in pair_tables.get(depth, []):
+      passing = table[chosen[earlier]]
+      indexes = [index for index in indexes if index in passing]
+    for index in indexes:
+      chosen[depth] = index
+      yield from walk(depth + 1)
+
+  yield from walk(0)
+
+
+def _iterate_with_filter(axis_names: List[str], axis_values: List[List[Any]],
+                         base_flags: Mapping[str, Any],
+                         matrix_filter: FlagMatrixFilter) -> Iterator[Dict[str, Any]]:
+  # evaluate once every axis the filter reads has a value
+  filter_depth = len(axis_names)
+  if not matrix_filter.has_nested_code:
+    filter_depth = max([position + 1 for position, name in enumerate(axis_names)
+                        if name in matrix_filter.names], default=0)
+  values = {}
+  flags = collections.ChainMap(values, base_flags)
+
+  def walk(depth: int) -> Iterator[Dict[str, Any]]:
+    if depth == filter_depth and not matrix_filter.evaluate(flags):
+      return
+    if depth == len(axis_names):
+      yield dict(values)
+      return
+    for value in axis_values[depth]:
+      values[axis_names[depth]] = value
+      yield from walk(depth + 1)
+    values.pop(axis_names[depth], None)
+
+  yield from walk(0)
+
+
+def iterate_flag_matrix(flag_matrix: Dict[str, List[Any]],
+                        base_flags: Optional[Mapping[str, Any]] = None,
+                        filter_expression: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+  """Yields the axis values of every flag_matrix combination that passes the filter
+
+  Args:
+      flag_matrix (Dict[str, List[Any]]): values of each flag, from flag_matrix_defs
+      base_flags (Optional[Mapping[str, Any]], optional): flags of the config, the
+        filter sees them under the axis values. Defaults to None.
+      filter_expression (Optional[str], optional): flag_matrix_filters expression.
+        Defaults to None.
+
+  Yields:
+      Dict[str, Any]: value of every axis of a combination
+  """
+  axes = sorted(flag_matrix.items())
+  axis_names = [name for name, values in axes]
+  axis_values = [list(values) for name, values in axes]
+
+  if not filter_expression:
+    for combination in itertools.product(*axis_values):
+      yield dict(zip(axis_names, combination))
+    return
+  # an empty axis has no combinations, and the filter is never evaluated
+  if any(len(values) == 0 for values in axis_values):
+    return
+
+  matrix_filter = FlagMatrixFilter(filter_expression)
+  comparisons = matrix_filter.comparisons
+  if comparisons is not None:
+    flag_names = [operand.id for comparison in comparisons for operand in (comparison[0], comparison[2])
+                  if isinstance(operand, ast.Name)]
+    if flag_names and all(name in flag_matrix for name in flag_names):
+      yield from _iterate_with_tables(axis_names, axis_values, comparisons)
+      return
+
+  yield from _iterate_with_filter(axis_names, axis_values, base_flags or {}, matrix_filter)
@@ -0,0 +1,193 @@
+from __future__ import annotations
+import contextlib
+import logging
+import time
+
+from typing import List, Dict, Tuple, Set, Any, Optional, Iterable, Iterator
+
+
+logger = None
+
+
+class RoundStats():
+  """Timings and counts of one iteration of the scheduling loop
+
+  Attributes:
+      index (int): round number, starting at 0
+      start_time (float): timestamp the round started at
+      phase_times (Dict[str, float]): seconds spent in each phase, phases
+        that run more than once in a round are added up
+      counts (Dict[str, int]): graph sizes and other counts of the round
+      spawn_count (int): pkb processes started in the round
+      spawn_time (float): seconds spent starting pkb processes
+  """
+
+  def __init__(self, index: int, start_time: float):
+    self.index = index
+    self.start_time = start_time
+    self.phase_times = {}
+    self.counts = {}
+    self.spawn_count = 0
+    self.spawn_time = 0.0
+
+  def to_dict(self) -> Dict[str, Any]:
+    return {
+      'round': self.index,
+      'start_time': self.start_time,
+      'total_time': sum(self.phase_times.values()),
+      'phase_times': dict(self.phase_times),
+      'counts': dict(self.counts),
+      'spawn_count': self.spawn_count,
+      'spawn_time': self.spawn_time,
+    }
+
+
+class Instrumentation():
+  """Records where the time of each scheduling round goes
+
+  Phases are timed with time.perf_counter, so simulated runs still
+  measure the real time the scheduler spends in them. Phases timed
+  before the first round, like config parsing, are kept as setup.
+
+  Attributes:
+      rounds (List[RoundStats]): stats of every round so far
+      setup_times (Dict[str, float]): seconds spent in phases before the first round
+      spans (List[Tuple[str, int, float, float]]): (phase, round, start timestamp,
+        end timestamp) of every timed phase, round is -1 for setup. Timestamps
+        come from time.time, the virtual clock in simulated runs
+  """
+
+  def __init__(self):
+    global logger
+    logger = logging.getLogger('pkb_scheduler')
+
+    self.rounds = []
+    self.setup_times = {}
+    self.spans = []
+
+  @property
+  def current_round(self) -> Optional[RoundStats]:
+    if self.rounds:
+      return self.rounds[-1]
+    return None
+
+  def start_round(self, **counts: int) -> RoundStats:
+    """Starts a new round
+
+    Args:
+        **counts (int): counts known when the round starts, ex nodes=10
+
+    Returns:
+        RoundStats: stats of the new round
+    """
+    round_stats = RoundStats(len(self.rounds), time.time())
+    round_stats.counts.update(counts)
+    self.rounds.append(round_stats)
+    return round_stats
+
+  @contextlib.contextmanager
+  def phase(self, name: str):
+    """Times the body of a with statement as a phase of the current round
+
+    Args:
+        name (str): name of the phase
+    """
+    start_timestamp = time.time()
+    start_time = time.perf_counter()
+    try:
+      yield
+    finally:
+      elapsed = time.perf_counter() - start_time
+      phase_times = self.current_round.phase_times if self.current_round else self.setup_times
+      phase_times[name] = phase_times.get(name, 0.0) + elapsed
+      round_index = self.current_round.index if self.current_round else -1
+      self.spans.append((name, round_index, start_timestamp, time.time()))
+
+  def iterate_phase(self, name: str, iterable: Iterable[Any]) -> Iterator[Any]:
+    """Times getting the items of a lazy iterable as a phase
+
+    Only the time spent in the iterable is added to the phase, not the
+    time the caller spends on each item, so work done lazily inside a
+    bigger phase gets its own timing. The phase has one span, from the
+    first item to the end of the iterable.
+
+    Args:
+        name (str): name of the phase
+        iterable (Iterable[Any]): items to time
+
+    Yields:
+        Any: the items of the iterable
+    """
+    iterator = iter(iterable)
+    start_timestamp = time.time()
+    elapsed = 0.0
+    try:
+      while True:
+        start_time = time.perf_counter()
+        try:
+          item = next(iterator)
+        except StopIteration:
+          break
+        finally:
+          elapsed += time.perf_counter() - start_time
+        yield item
+    finally:
+      phase_times = self.current_round.phase_times if self.current_round else self.setup_times
+      phase_times[name] = phase_times.get(name, 0.0) + elapsed
+      round_index = self.current_round.index if self.current_round else -1
+      self.spans.append((name, round_index, start_timestamp, time.time()))
+
+  def count(self, name: str, value: int):
+    """Sets a count of the current round
+
+    Args:
+        name (str): name of the count
+        value (int): value of the count
+    """
+    if self.current_round:
+      self.current_round.counts[name] = value
+
+  def record_spawn(self, seconds: float):
+    """Adds a started pkb process to the current round
+
+    Args:
+        seconds (float): seconds it took to start the process
+    """
+    if self.current_round:
+      self.current_round.spawn_count += 1
+      self.current_round.spawn_time += seconds
+
+  def get_phase_totals(self) -> Dict[str, float]:
+    """Returns the seconds spent in each phase over all rounds
+    """
+    totals = {}
+    for round_stats in self.rounds:
+      for name, seconds in round_stats.phase_times.items():
+        totals[name] = totals.get(name, 0.0) + seconds
+    return totals
+
+  def get_summary(self) -> Dict[str, Any]:
+    """Returns the setup times, per phase totals and every round as a dict
+    """
+    spawn_count = sum(round_stats.spawn_count for round_stats in self.rounds)
+    spawn_time = sum(round_stats.spawn_time for round_stats in self.rounds)
+    return {
+      'setup_times': dict(self.setup_times),
+      'phase_totals': self.get_phase_totals(),
+      'spawn_count': spawn_count,
+      'spawn_time': spawn_time,
+      'avg_spawn_time': spawn_time / spawn_count if spawn_count else None,
+      'rounds': [round_stats.to_dict() for round_stats in self.rounds],
+    }
+
+  def log_summary(self):
+    """Logs one line per round and the per phase totals
+    """
+    for round_stats in self.rounds:
+      phases = ", ".join(f"{name}={seconds:.3f}s" for name, seconds in round_stats.phase_times.items())
+      counts = ", ".join(f"{name}={value}" for name, value in round_stats.counts.items())
+      logger.info(f"ROUND {round_stats.index}: {counts}, spawned={round_stats.spawn_count} "
+                  f"in {round_stats.spawn_time:.3f}s, {phases}")
+
+    for name, seconds in sorted(self.get_phase_totals().items(), key=lambda item: -item[1]):
+      logger.info(f"PHASE TOTAL {name}: {seconds:.3f} seconds")
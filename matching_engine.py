@@ -0,0 +1,221 @@
+from __future__ import annotations
+import networkx as nx
+import logging
+import multiprocessing as mp
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Tuple, Set, Any, Iterable
+
+
+logger = None
+
+
+def match_component(nodes: List[int], edges: List[Tuple[int, int, float]]) -> List[Tuple[int, int]]:
+  """Returns a maximum cardinality, maximum weight matching of one component
+
+  Takes the component as plain lists so it can run in a worker process.
+  Every component is matched through here, so the matching is the same
+  whether it ran in a worker or not. Matching a copy is also faster than
+  matching a subgraph view of the whole graph
+
+  Args:
+      nodes (List[int]): nodes of the component
+      edges (List[Tuple[int, int, float]]): (node1, node2, weight) edges of the component
+
+  Returns:
+      List[Tuple[int, int]]: matched node tuples
+  """
+  component_graph = nx.Graph()
+  component_graph.add_nodes_from(nodes)
+  component_graph.add_weighted_edges_from(edges)
+  return list(nx.max_weight_matching(component_graph, maxcardinality=True, weight='weight'))
+
+
+class MatchingEngine():
+  """Maximum weight matching over the simplified benchmark graph
+
+  Keeps the simplified graph (one weighted edge per pair of VMs, with
+  self-loops replaced by an edge to a dummy node) between rounds.
+  Each round only the nodes and edges that changed are applied, and
+  the matching of every connected component that was not touched is
+  reused from the previous round instead of running the blossom
+  algorithm on it again.
+
+  When at least two components that have to be matched again have
+  parallel_min_edges edges or more, they are matched in a pool of
+  worker processes while the small ones are matched here.
+
+  Attributes:
+      graph (nx.Graph): simplified weighted graph
+      dirty_nodes (Set[int]): nodes whose edges changed since the last matching
+      component_matchings (Dict[frozenset, List[Tuple[int, int]]]): matching
+        of each connected component from the last round
+      pool_size (int): worker processes for large components, 0 matches
+        every component in this process
+      parallel_min_edges (int): edges a component needs to be matched in a worker
+  """
+
+  def __init__(self, pool_size: int = 0, parallel_min_edges: int = 2000):
+    global logger
+    logger = logging.getLogger('pkb_scheduler')
+
+    self.graph = nx.Graph()
+    self.dirty_nodes = set()
+    self.component_matchings = {}
+    self.pool_size = pool_size
+    self.parallel_min_edges = parallel_min_edges
+    # started on first use and kept between rounds
+    self._pool = None
+
+  @staticmethod
+  def get_dummy_node(node_id: int) -> int:
+    """Returns the dummy node that stands in for the self-loop of a node
+
+    Node ids are never negative, so dummy nodes are negative and stable
+    between rounds
+
+    Args:
+        node_id (int): id of the node with a self-loop
+
+    Returns:
+        int: id of the dummy node
+    """
+    return -(node_id + 1)
+
+  @staticmethod
+  def is_dummy_node(node_id: int) -> bool:
+    return node_id < 0
+
+  def reset(self):
+    """Forgets the graph and matchings from previous rounds
+    """
+    self.graph = nx.Graph()
+    self.dirty_nodes = set()
+    self.component_matchings = {}
+
+  def close(self):
+    """Stops the worker processes, if any were started
+    """
+    if self._pool is not None:
+      self._pool.shutdown()
+      self._pool = None
+
+  def get_pool(self) -> ProcessPoolExecutor:
+    if self._pool is None:
+      # spawned workers do not inherit the scheduler's threads and open files
+      self._pool = ProcessPoolExecutor(max_workers=self.pool_size,
+                                       mp_context=mp.get_context('spawn'))
+    return self._pool
+
+  def update(self, nodes: Iterable[int], weighted_edges: Dict[Tuple[int, int], float]):
+    """Applies the difference between the stored graph and the current one
+
+    Args:
+        nodes (Iterable[int]): ids of the nodes that can be matched
+        weighted_edges (Dict[Tuple[int, int], float]): weight of each
+          (node1, node2) pair, self-loops are given as (node, node)
+    """
+    target_edges = {}
+    target_nodes = set(nodes)
+    for (node_1, node_2), weight in weighted_edges.items():
+      if node_1 == node_2:
+        node_2 = self.get_dummy_node(node_1)
+        target_nodes.add(node_2)
+      target_edges[(node_1, node_2)] = weight
+
+    for node in list(self.graph.nodes):
+      if node not in target_nodes:
+        self.dirty_nodes.update(self.graph[node])
+        self.graph.remove_node(node)
+
+    for node in target_nodes:
+      if node not in self.graph:
+        self.graph.add_node(node)
+        self.dirty_nodes.add(node)
+
+    for node_1, node_2 in list(self.graph.edges):
+      if (node_1, node_2) not in target_edges and (node_2, node_1) not in target_edges:
+        self.graph.remove_edge(node_1, node_2)
+        self.dirty_nodes.update((node_1, node_2))
+
+    for (node_1, node_2), weight in target_edges.items():
+      if (not self.graph.has_edge(node_1, node_2) or
+          self.graph[node_1][node_2]['weight'] != weight):
+        self.graph.add_edge(node_1, node_2, weight=weight)
+        self.dirty_nodes.update((node_1, node_2))
+
+  def get_matching(self) -> List[Tuple[int, int]]:
+    """Returns a maximum cardinality, maximum weight matching of the graph
+
+    Self-loops are returned as (node, node) tuples
+
+    Returns:
+        List[Tuple[int, int]]: list of matched node tuples
+    """
+    component_matchings = {}
+    components_reused = 0
+    # (component key, nodes, edges) of components that have to be matched again
+    small_components = []
+    large_components = []
+
+    for component in nx.connected_components(self.graph):
+      component_key = frozenset(component)
+      if (component_key in self.component_matchings and
+          self.dirty_nodes.isdisjoint(component)):
+        component_matchings[component_key] = self.component_matchings[component_key]
+        components_reused += 1
+      elif len(component) < 2:
+        component_matchings[component_key] = []
+      else:
+        # a component has no edges to other nodes, so these are exactly its edges
+        edges = list(self.graph.edges(component, data='weight'))
+        if self.pool_size > 0 and len(edges) >= self.parallel_min_edges:
+          large_components.append((component_key, list(component), edges))
+        else:
+          small_components.append((component_key, list(component), edges))
+        # placeholder keeps the components in graph order
+        component_matchings[component_key] = None
+
+    # one large component gains nothing from a worker
+    if len(large_components) < 2:
+      small_components.extend(large_components)
+      large_components = []
+    futures = []
+    if large_components:
+      try:
+        pool = self.get_pool()
+        futures = [(component_key, pool.submit(match_component, nodes, edges))
+                   for component_key, nodes, edges in large_components]
+      except (BrokenProcessPool, OSError) as e:
+        logger.warning(f"MATCHING POOL FAILED ({e}), MATCHING IN PROCESS")
+        self._pool = None
+        small_components.extend(large_components)
+        large_components = []
+
+    for component_key, nodes, edges in small_components:
+      component_matchings[component_key] = match_component(nodes, edges)
+    for (component_key, future), (_, nodes, edges) in zip(futures, large_components):
+      try:
+        component_matchings[component_key] = future.result()
+      except BrokenProcessPool as e:
+        logger.warning(f"MATCHING POOL FAILED ({e}), MATCHING IN PROCESS")
+        self._pool = None
+        component_matchings[component_key] = match_component(nodes, edges)
+
+    matching = []
+    for component_matching in component_matchings.values():
+      matching.extend(component_matching)
+
+    logger.debug(f"MATCHING COMPONENTS: {len(component_matchings)}, REUSED: {components_reused}, "
+                 f"IN WORKERS: {len(large_components)}")
+    self.component_matchings = component_matchings
+    self.dirty_nodes = set()
+
+    # convert dummy nodes back to self-loops
+    for i in range(0, len(matching)):
+      if self.is_dummy_node(matching[i][0]):
+        matching[i] = (matching[i][1], matching[i][1])
+      elif self.is_dummy_node(matching[i][1]):
+        matching[i] = (matching[i][0], matching[i][0])
+    return matching
@@ -0,0 +1,111 @@
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+
+from typing import List, Dict, Tuple, Set, Any, Optional
+
+
+logger = None
+
+# longest line of pkb output that can be read, in bytes
+OUTPUT_LINE_LIMIT = 1024 * 1024
+
+
+class PkbProcessResult():
+  """Output of a finished pkb process
+
+  Attributes:
+      returncode (int): exit code of the process
+      output (str): everything the process wrote to stdout
+      start_time (float): timestamp the process was started at
+      end_time (float): timestamp the process exited at
+  """
+
+  def __init__(self, returncode: int, output: str, start_time: float, end_time: float):
+    self.returncode = returncode
+    self.output = output
+    self.start_time = start_time
+    self.end_time = end_time
+
+  @property
+  def run_time(self) -> float:
+    return self.end_time - self.start_time
+
+
+class AsyncioPkbExecutor():
+  """Runs pkb processes from a single asyncio event loop
+
+  The event loop runs in a background thread, so pkb processes are
+  started with asyncio.create_subprocess_exec instead of forking a
+  python process for each one. Results are returned through
+  concurrent.futures.Future objects that can be polled or waited on
+  from the scheduler thread.
+
+  Attributes:
+      max_concurrency (int): max processes running at once, -1 for no limit
+  """
+
+  def __init__(self, max_concurrency: int = -1):
+    global logger
+    logger = logging.getLogger('pkb_scheduler')
+
+    self.max_concurrency = max_concurrency
+    self._loop = asyncio.new_event_loop()
+    self._semaphore = None
+    self._thread = threading.Thread(target=self._run_loop, daemon=True)
+    self._thread.start()
+    if self.max_concurrency > 0:
+      self._semaphore = asyncio.run_coroutine_threadsafe(self._create_semaphore(),
+                                                         self._loop).result()
+
+  def _run_loop(self):
+    asyncio.set_event_loop(self._loop)
+    self._loop.run_forever()
+
+  async def _create_semaphore(self) -> asyncio.Semaphore:
+    return asyncio.Semaphore(self.max_concurrency)
+
+  def submit(self, command: List[str], label: str = "pkb") -> concurrent.futures.Future:
+    """Starts a pkb process
+
+    Args:
+        command (List[str]): command line, split into arguments
+        label (str, optional): prefix for the streamed output in the debug log. Defaults to "pkb".
+
+    Returns:
+        concurrent.futures.Future: future that resolves to a PkbProcessResult
+    """
+    return asyncio.run_coroutine_threadsafe(self._run_process(command, label), self._loop)
+
+  async def _run_process(self, command: List[str], label: str) -> PkbProcessResult:
+    if self._semaphore:
+      async with self._semaphore:
+        return await self._exec(command, label)
+    return await self._exec(command, label)
+
+  async def _exec(self, command: List[str], label: str) -> PkbProcessResult:
+    start_time = time.time()
+    process = await asyncio.create_subprocess_exec(*command,
+                                                   stdout=asyncio.subprocess.PIPE,
+                                                   limit=OUTPUT_LINE_LIMIT)
+    output_lines = []
+    # stream stdout as it is written instead of waiting for the process to exit
+    while True:
+      line = await process.stdout.readline()
+      if not line:
+        break
+      line = line.decode('utf-8', errors='replace')
+      output_lines.append(line)
+      logger.debug(f"[{label}] {line.rstrip()}")
+    returncode = await process.wait()
+    end_time = time.time()
+    return PkbProcessResult(returncode, "".join(output_lines), start_time, end_time)
+
+  def shutdown(self):
+    """Stops the event loop. Processes that are still running are not killed
+    """
+    self._loop.call_soon_threadsafe(self._loop.stop)
+    self._thread.join()
@@ -7,8 +7,8 @@
 # default when using just PKB
 from __future__ import annotations
 import yaml
-import six
-import copy
+import collections
+import hashlib
 import itertools
 import os
 import benchmark_graph
@@ -17,17 +17,32 @@ import json
 import time
 import logging
 import cloud_util
+import scheduling_strategy
+import simulator
+import checkpoint
+import flag_matrix
+import trace_events
 import uuid
 import sys
+import multiprocessing
 
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from google.cloud import bigquery
-from typing import List, Dict, Tuple, Set, Any, Sequence, Optional
+from typing import List, Dict, Tuple, Set, Any, Sequence, Optional, Iterable, Iterator
 from benchmark import Benchmark
+from benchmark_flags import BenchmarkFlags
 from virtual_machine import VirtualMachine
 from virtual_machine_spec import VirtualMachineSpec
 from region import Region, GcpRegion, AwsRegion, AzureRegion
 from cloud import Cloud
+from pkb_executor import AsyncioPkbExecutor
+from quota_cache import QuotaCache
+from instrumentation import Instrumentation
+from event_journal import EventJournal
+from config_cache import ConfigCache, get_content_hash
+from run_history import RunHistory
+from simulator import Simulator
 from absl import flags
 from absl import app
 
@@ -43,7 +58,6 @@ from absl import app
 # TODO disk_stuff/dedicated host
 #      to every config file. Edit the static vm stuff in pkb to handle it
 
-# TODO add in the linear programming optimization stuff
 # TODO support AWS and multicloud
 # TODO thread and optimize what is happening at once when max threads is used
 # TODO experiment with install_packages flag
@@ -62,9 +76,6 @@ from absl import app
 # TODO change algorithm to try to limit egress/ingress per region
 # per test
 # TODO change estimated bandwidth
-# TODO maybe change the algorithm to choose the tests completely.
-# instead of maximum matching, use a linear programming, constraint optimization
-# or edit maximum matching to take into account certain parameters
 
 # python3
 
@@ -76,6 +87,10 @@ os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = 'service_key.json'
 
 FLAGS = flags.FLAGS
 
+# the libyaml loader parses config files much faster, when pyyaml is
+# built without it the pure python loader is used
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 flags.DEFINE_boolean(
   'no_run', False, 
@@ -143,6 +158,65 @@ flags.DEFINE_string(
   'bq_project', 'smu-benchmarking',
   'bigquery project to push results to')
 
+flags.DEFINE_string(
+  'round_summary_output', 'round_summary.json',
+  'File the phase timings and counts of every scheduling round are '
+  'written to at the end of a run')
+
+flags.DEFINE_string(
+  'trace_file', None,
+  'If set, a timeline of VM lifecycles, benchmark runs and scheduler '
+  'phases is written to this file in the Chrome trace event format. '
+  'Open it in chrome://tracing or ui.perfetto.dev')
+
+flags.DEFINE_integer(
+  'config_parse_processes', 1,
+  'Worker processes that parse config files in parallel. 1 parses the '
+  'files one after another, 0 uses one per CPU')
+
+flags.DEFINE_string(
+  'config_cache_dir', None,
+  'If set, the parsed and expanded configs of each config file are '
+  'cached in this directory, and config files that did not change since '
+  'the last run are loaded from it without being parsed again')
+
+flags.DEFINE_string(
+  'journal_file', None,
+  'If set, every scheduling decision (VMs and benchmarks added, edges '
+  'moved, matchings chosen, runs started and finished, quota updates) is '
+  'appended to this JSONL file. replay_journal.py rebuilds the graph '
+  'at any point of the run from it')
+
+flags.DEFINE_string(
+  'run_history_db', None,
+  'If set, benchmark run times and VM creation times are stored in this '
+  'SQLite database at the end of a run. Past runs in it are used to '
+  'estimate benchmark durations and to create the VMs that are slowest '
+  'to provision first')
+
+flags.DEFINE_string(
+  'checkpoint_file', None,
+  'If set, the running VMs and completed benchmarks are saved to this '
+  'file every --checkpoint_interval seconds, so the run can be continued '
+  'with --resume if the scheduler dies')
+
+flags.DEFINE_integer(
+  'checkpoint_interval', 300,
+  'Minimum seconds between checkpoints. A checkpoint is only written '
+  'between rounds, 0 writes one after every round. Rounds that create '
+  'VMs always write one, so no running VM is missing from it')
+
+flags.DEFINE_boolean(
+  'resume', False,
+  'If true, continues the run saved in --checkpoint_file. The configs '
+  'have to be the same as in the original run. Running VMs are reused '
+  'and completed benchmarks are not run again')
+
+flags.DEFINE_boolean(
+  'upload_results', True,
+  'If False, stats about the run are not uploaded to bigquery at the end. '
+  'Use with the stand-ins in fake_tools, which have no credentials')
+
 flags.DEFINE_boolean(
   'precreate_and_share_vms', True,
   'If true, this will precreate and reuse vms. '
@@ -153,6 +227,41 @@ flags.DEFINE_boolean(
   'use_maximum_matching', True,
   'If true, this run VMs based on maximum matching')
 
+flags.DEFINE_enum(
+  'scheduling_strategy', 'MAXIMUM_MATCHING', ['MAXIMUM_MATCHING', 'MILP'],
+  'How the next benchmark set is picked. MAXIMUM_MATCHING uses maximum '
+  'weight matching. MILP solves a mixed integer linear program that also '
+  'takes regional quotas and bandwidth limits into account (requires scipy)')
+
+flags.DEFINE_float(
+  'scheduling_time_budget', 10.0,
+  'Max seconds a scheduling strategy solver may take per round. '
+  'Maximum matching is used for the round if it runs out of time')
+
+flags.DEFINE_boolean(
+  'incremental_matching', True,
+  'If true, the weighted graph used for maximum matching is kept between '
+  'rounds and only connected components that changed are matched again')
+
+flags.DEFINE_integer(
+  'matching_pool_size', 0,
+  'Worker processes that match large connected components of the graph '
+  'in parallel. Only used when a round has at least two components with '
+  '--parallel_matching_min_edges edges that changed. 0 matches every '
+  'component in the scheduler process')
+
+flags.DEFINE_integer(
+  'parallel_matching_min_edges', 2000,
+  'Edges a connected component needs to be matched in a worker process')
+
+flags.DEFINE_boolean(
+  'runtime_aware_matching', False,
+  'If true, matching weights get a bonus proportional to the estimated '
+  'run time of the longest benchmark between each pair of VMs, so the '
+  'longest benchmarks are scheduled first and short ones are grouped in '
+  'later sets. Run times come from previous runs of the same benchmark '
+  'type and flags or from the test length flags')
+
 flags.DEFINE_boolean(
   'skip_prepare', True,
   'skips the prepare phase for benchmarks where this is implemented')
@@ -169,12 +278,66 @@ flags.DEFINE_integer(
   'max_retries', 20,
   'Amount of times it will keep attempting to allocate and run tests that there are not space for. -1 for infinite')
 
+flags.DEFINE_boolean(
+  'continuous_scheduling', False,
+  'If true, a new benchmark set is scheduled every time a benchmark '
+  'finishes instead of waiting for the whole set to finish. '
+  'VMs freed by a finished benchmark are reused right away')
+
+flags.DEFINE_integer(
+  'quota_cache_ttl', 300,
+  'Seconds region quotas fetched from the cloud providers are reused for. '
+  'Between rounds only regions used by the graph or the waitlist are '
+  'refreshed. 0 refreshes them every round')
+
+flags.DEFINE_boolean(
+  'simulate', False,
+  'If true, no pkb processes are run. VM creation, benchmarks, teardown and '
+  'quota queries take simulated time on a virtual clock, and metrics of the '
+  'run are written to --simulation_output. Overrides --no_run')
+
+flags.DEFINE_string(
+  'simulation_config', None,
+  'YAML file with the distributions and quotas used by --simulate. '
+  'See simulator.Simulator for the format')
+
+flags.DEFINE_integer(
+  'simulation_seed', 0,
+  'Random seed for --simulate')
+
+flags.DEFINE_string(
+  'simulation_output', 'simulation_metrics.json',
+  'File the metrics of a --simulate run are written to')
+
+flags.DEFINE_boolean(
+  'lookahead_provisioning', False,
+  'If true, VMs for the predicted next benchmark set are created in the '
+  'background while the current set runs, so they are already running '
+  'when the next round starts. Only used with precreate_and_share_vms')
+
+flags.DEFINE_enum(
+  'pkb_executor', 'MULTIPROCESSING', ['MULTIPROCESSING', 'ASYNCIO'],
+  'How pkb processes for VM creation and benchmarks are started. '
+  'MULTIPROCESSING forks a python process per pkb process. ASYNCIO runs '
+  'all pkb processes from one asyncio event loop and streams their '
+  'output to the debug log')
+
 logger = None
+quota_cache = None
+instrumentation = None
+event_journal = None
+run_history = None
+config_cache = None
+config_hash = None
+last_checkpoint_time = None
+resumed_checkpoint = None
+simulation = None
 
 maximum_sets = []
+round_start_times = []
+waitlist_sizes = []
 vms_created = []
 vms_removed = []
-region_quota_usage = []
 benchmarks_per_table = {}
 
 def main(argv):
@@ -187,25 +350,54 @@ def main(argv):
   config_locations = FLAGS.config
   pkb_command = "python3 " + FLAGS.pkb_location
 
-  benchmark_config_list = []
-
   config_locations.extend(FLAGS.config_individual)
 
-  for config_location in config_locations:
-    if(config_location.endswith(".yaml")):
-      benchmark_config_list.extend(parse_config_file(config_location))
-    else:
-      benchmark_config_list.extend(parse_config_folder(config_location))
-
-
-  logger.debug("\nNUMBER OF CONFIGS")
-  logger.debug(len(benchmark_config_list))
-  # for config in benchmark_config_list:
-  #   print(config)
+  with get_instrumentation().phase('find_config_files'):
+    file_list = []
+    for config_location in config_locations:
+      if(config_location.endswith(".yaml")):
+        file_list.append(config_location)
+      else:
+        file_list.extend(_find_config_files(config_location))
+
+  logger.debug("\nNUMBER OF CONFIG FILES")
+  logger.debug(len(file_list))
+
+  # configs are expanded while the graph is created, one at a time, so
+  # parse_config is timed on its own and is also part of create_graph
+  benchmark_configs = get_instrumentation().iterate_phase('parse_config',
+                                                          iterate_config_files(file_list))
+
+  pkb_executor = None
+  if FLAGS.simulate:
+    pkb_executor = start_simulation().executor
+
+  global config_hash, resumed_checkpoint
+  completed_config_indexes = set()
+  config_hasher = None
+  if FLAGS.checkpoint_file:
+    config_hasher = hashlib.sha256()
+    benchmark_configs = checkpoint.hash_configs(benchmark_configs, config_hasher)
+  if FLAGS.resume:
+    if not FLAGS.checkpoint_file:
+      raise app.UsageError("--resume needs --checkpoint_file")
+    # the config hash is only known once every config went into the graph
+    resumed_checkpoint = checkpoint.load_checkpoint(FLAGS.checkpoint_file)
+    completed_config_indexes = checkpoint.get_completed_config_indexes(resumed_checkpoint)
 
   # Create the initial graph from the config directory or file
-  full_graph = create_graph_from_config_list(benchmark_config_list,
-                                             pkb_command)
+  with get_instrumentation().phase('create_graph'):
+    full_graph = create_graph_from_config_list(benchmark_configs,
+                                               pkb_command,
+                                               pkb_executor=pkb_executor,
+                                               skip_config_indexes=completed_config_indexes)
+  if config_hasher:
+    config_hash = config_hasher.hexdigest()
+  if resumed_checkpoint:
+    checkpoint.check_config_hash(resumed_checkpoint, config_hash, FLAGS.checkpoint_file)
+    resume_from_checkpoint(full_graph, resumed_checkpoint)
+  if simulation:
+    simulation.graph = full_graph
 
   # logger.debug("\nVMS TO CREATE:")
   # print(full_graph.virtual_machines)
@@ -223,6 +415,11 @@ def main(argv):
 
   # This method does almost everything
   run_benchmarks(full_graph)
+  save_checkpoint_if_due(full_graph, force=True)
+
+  if full_graph.pkb_executor:
+    full_graph.pkb_executor.shutdown()
+  full_graph.scheduling_strategy.close()
 
   end_time = time.time()
   total_run_time = (end_time - start_time)
@@ -238,46 +435,19 @@ def main(argv):
                               len(list(filter(None, full_graph.benchmark_run_times))))
     logging.info("AVG BENCHMARK RUN TIME: " + str(avg_benchmark_run_time))
 
-  # print("ALL MAXIMUM SETS")
-  # for max_set in maximum_sets:
-  #   print(max_set)
-  # print("ALL VMS CREATED")
-  # for vm_set in vms_created:
-  #   print(vm_set)
-  # print("ALL VMS DESTROYED")
-  # for vm_set in vms_removed:
-  #   print(vm_set)
-    
-  print("BENCHMARK SCHEDULE HISTORY")
-  vms_at_time = 0
-  if FLAGS.precreate_and_share_vms:
-    for i in range(0, len(maximum_sets)):
-      vms_at_time = vms_at_time + len(vms_created[i])
-      vms_used_this_round = len(list(itertools.chain(*maximum_sets[i])))
-      logger.debug(f"ROUND \n{i}")
-      logger.debug(f"VM USAGE: {vms_used_this_round}/{vms_at_time}")
-      logger.debug(f"{len(vms_created[i])} VMS CREATED:")
-      logger.debug(vms_created[i])
-      logger.debug(f"MAXIMUM SET LENGTH: {len(maximum_sets[i])}, ARRAY:")
-      logger.debug(maximum_sets[i])
-      logger.debug(f"{len(vms_removed[i])} VMS DESTROYED:")
-      logger.debug(vms_removed[i])
-      vms_at_time = vms_at_time - len(vms_removed[i])
-      logger.debug(f"ALL REGION QUOTA USAGE:")
-      for region_quota in region_quota_usage[i]:
-        for key in region_quota:
-          quota = region_quota[key]
-          #print(f"region: {key}, CPU QUOTA: {quota['CPUS']['limit']}, "
-          #      f"CPU USE: {quota['CPUS']['usage']}, "
-          #      f"ADDRS QUOTA: {quota['IN_USE_ADDRESSES']['limit']}, "
-          #      f"ADDRS USE: {quota['IN_USE_ADDRESSES']['usage']}")
-      # print(region_quota_usage[i])
-  else:
-    for i in range(0, len(maximum_sets)):
-      logger.debug(f"ROUND \n{i}")
-      logger.debug(f"MAXIMUM SET LENGTH: {len(maximum_sets[i])}, ARRAY:")
-      logger.debug(maximum_sets[i])
-  
+  instrumentation = get_instrumentation()
+  instrumentation.log_summary()
+  with open(FLAGS.round_summary_output, 'w') as json_file:
+    json.dump(instrumentation.get_summary(), json_file, indent=2)
+  if FLAGS.trace_file:
+    trace_events.write_trace_file(FLAGS.trace_file, full_graph, instrumentation)
+  get_event_journal().close()
+  if run_history:
+    if not FLAGS.simulate and not FLAGS.no_run:
+      run_history.record_run(uuid.uuid4().hex, full_graph.benchmarks,
+                             full_graph.virtual_machines, since=start_time)
+    run_history.close()
+
   logger.info("ALL BENCHMARK TIMES:")
   logger.info(full_graph.benchmark_run_times)
   try:
@@ -296,7 +466,15 @@ def main(argv):
   with open('benchmarks_per_table.json', 'w') as json_file:
     json.dump(benchmarks_per_table, json_file)
 
-  if FLAGS.no_run == False:
+  if simulation:
+    metrics = simulation.get_metrics(maximum_sets, waitlist_sizes, round_start_times)
+    logger.info(f"SIMULATED MAKESPAN: {metrics['makespan']} seconds")
+    logger.info(f"SIMULATED VM UPTIME: {metrics['total_vm_uptime']} seconds")
+    logger.info(f"VM UTILIZATION: {metrics['vm_utilization']}")
+    logger.info(f"WAITLIST STALLS: {metrics['waitlist_stalls']}")
+    with open(FLAGS.simulation_output, 'w') as json_file:
+      json.dump(metrics, json_file, indent=2)
+  elif FLAGS.no_run == False and FLAGS.upload_results:
     upload_stats_to_bigquery(benchmarks_per_table)
 
   exit(0)
@@ -348,22 +526,34 @@ def setup_logging():
 
 def run_benchmarks(benchmark_graph: benchmark_graph.BenchmarkGraph):
 
-  benchmarks_run = []
+  if FLAGS.continuous_scheduling:
+    run_benchmarks_continuous(benchmark_graph)
+    return
+
+  instrumentation = get_instrumentation()
   benchmark_graph.equalize_graph()
   if FLAGS.print_graph:
     benchmark_graph.print_graph()
   max_set_empty_counter = 0
 
   while benchmark_graph.benchmarks_left() > 0:
+    round_start_times.append(time.time())
+    waitlist_sizes.append(len(benchmark_graph.benchmark_wait_list))
+    round_stats = instrumentation.start_round(nodes=len(benchmark_graph.graph.nodes),
+                                              edges=len(benchmark_graph.graph.edges),
+                                              waitlist=len(benchmark_graph.benchmark_wait_list))
+    get_event_journal().record('round_started', round=round_stats.index, **round_stats.counts)
+    get_event_journal().flush()
     logger.info(f"graph nodes remaining: {len(benchmark_graph.graph.nodes)}")
     logger.info(f"graph edges remaining: {len(benchmark_graph.graph.edges)}")
     logger.info(f"benchmarks on waitlist: {len(benchmark_graph.benchmark_wait_list)}" )
     logger.info(f"benchmarks left: {benchmark_graph.benchmarks_left()}")
     logger.info(f"multiedge benchmarks: {benchmark_graph.multiedge_benchmarks}")
 
-    # TODO make get_benchmark_set work better than maximum matching
-    maximum_set = benchmark_graph.get_benchmark_set()
-    # maximum_set = list(benchmark_graph.maximum_matching())
+    # the algorithm used here can be changed with --scheduling_strategy
+    with instrumentation.phase('get_benchmark_set'):
+      maximum_set = benchmark_graph.get_benchmark_set()
+    instrumentation.count('benchmark_set', len(maximum_set))
 
     if len(maximum_set) == 0:
       max_set_empty_counter += 1
@@ -373,61 +563,163 @@ def run_benchmarks(benchmark_graph: benchmark_graph.BenchmarkGraph):
     if FLAGS.max_retries >= 0 and max_set_empty_counter > FLAGS.max_retries:
       logger.debug("BENCHMARK WAIT LIST")
       logger.debug(benchmark_graph.benchmark_wait_list)
+      with instrumentation.phase('finish_pending_vm_creations'):
+        benchmark_graph.finish_pending_vm_creations(block=True)
       return
     logger.debug("MAXIMUM SET")
     logger.debug(maximum_set)
 
     max_set_vms = list(itertools.chain(*maximum_set))
     if FLAGS.precreate_and_share_vms:
-      created_list = benchmark_graph.create_vms(vm_list=max_set_vms)
+      with instrumentation.phase('create_vms'):
+        created_list = benchmark_graph.create_vms(vm_list=max_set_vms)
       vms_created.append(created_list)
+      instrumentation.count('vms_created', len(created_list))
+      # new VMs have to be in a checkpoint before the long benchmark runs
+      with instrumentation.phase('save_checkpoint'):
+        save_checkpoint_if_due(benchmark_graph, force=len(created_list) > 0)
+      if FLAGS.lookahead_provisioning:
+        with instrumentation.phase('start_lookahead_vm_creations'):
+          benchmark_graph.start_lookahead_vm_creations(maximum_set)
 
     maximum_sets.append(maximum_set)
-    benchmarks_run.append(maximum_set)
-    quota_usage = benchmark_graph.get_all_quota_usage()
-    for region_quota in quota_usage:
-      for key in region_quota:
-        quota = region_quota[key]
-        #print(f"region: {key}, CPU QUOTA: {quota['CPUS']['limit']}, "
-        #      f"CPU USE: {quota['CPUS']['usage']}, "
-        #      f"ADDRS QUOTA: {quota['IN_USE_ADDRESSES']['limit']}, "
-        #      f"ADDRS USE: {quota['IN_USE_ADDRESSES']['usage']}")
-    region_quota_usage.append(quota_usage)
     # This actually runs all the benchmarks in this set
-    benchmark_graph.run_benchmark_set(maximum_set)
+    with instrumentation.phase('run_benchmark_set'):
+      benchmark_graph.run_benchmark_set(maximum_set)
     # TODO possibly check completion status
     # Completion statuses can be found at: 
     # /tmp/perfkitbenchmarker/runs/7fab9158/completion_statuses.json
     # before removal of edges
-    benchmark_graph.add_benchmarks_from_waitlist()
-    benchmark_graph.equalize_graph()
-    removed_list = benchmark_graph.remove_orphaned_nodes()
+    with instrumentation.phase('add_benchmarks_from_waitlist'):
+      benchmark_graph.add_benchmarks_from_waitlist()
+    with instrumentation.phase('equalize_graph'):
+      benchmark_graph.equalize_graph()
+    with instrumentation.phase('remove_orphaned_nodes'):
+      removed_list = benchmark_graph.remove_orphaned_nodes()
     vms_removed.append(removed_list)
+    instrumentation.count('vms_removed', len(removed_list))
     logger.info("UPDATE REGION QUOTAS")
-    update_quota_usage(benchmark_graph)
+    with instrumentation.phase('update_quota_usage'):
+      update_quota_usage(benchmark_graph)
+    with instrumentation.phase('save_checkpoint'):
+      save_checkpoint_if_due(benchmark_graph)
     logger.debug("create vms and add benchmarks")
-    benchmark_graph.add_benchmarks_from_waitlist()
-    benchmark_graph.equalize_graph()
+    with instrumentation.phase('add_benchmarks_from_waitlist'):
+      benchmark_graph.add_benchmarks_from_waitlist()
+    with instrumentation.phase('equalize_graph'):
+      benchmark_graph.equalize_graph()
     logger.debug("benchmarks left: " + str(benchmark_graph.benchmarks_left()))
-    time.sleep(2)
+    with instrumentation.phase('sleep'):
+      time.sleep(2)
     if FLAGS.print_graph:
       benchmark_graph.print_graph()
 
-  logger.debug(len(benchmarks_run))
-  logger.debug("BMS RUN EACH LOOP")
-  for bmset in benchmarks_run:
-    logger.debug(len(bmset))
 
-  logger.debug("VMS REMOVED EACH LOOP")
-  for vm_list in vms_removed:
-    logger.debug(vm_list)
+def run_benchmarks_continuous(benchmark_graph: benchmark_graph.BenchmarkGraph):
+  """Runs benchmarks without waiting for a whole benchmark set to finish
+
+  Every time a benchmark finishes, its VMs are freed, the waitlist is
+  retried and a new benchmark set is started on the VMs that are not
+  busy running a benchmark.
+
+  Args:
+    benchmark_graph: Benchmark/VM Graph to run
+  """
+  instrumentation = get_instrumentation()
+  benchmark_graph.equalize_graph()
+  if FLAGS.print_graph:
+    benchmark_graph.print_graph()
+  max_set_empty_counter = 0
+
+  while benchmark_graph.benchmarks_left() > 0:
+    round_start_times.append(time.time())
+    waitlist_sizes.append(len(benchmark_graph.benchmark_wait_list))
+    round_stats = instrumentation.start_round(nodes=len(benchmark_graph.graph.nodes),
+                                              edges=len(benchmark_graph.graph.edges),
+                                              waitlist=len(benchmark_graph.benchmark_wait_list),
+                                              running=len(benchmark_graph.running_benchmarks))
+    get_event_journal().record('round_started', round=round_stats.index, **round_stats.counts)
+    get_event_journal().flush()
+    logger.info(f"graph nodes remaining: {len(benchmark_graph.graph.nodes)}")
+    logger.info(f"graph edges remaining: {len(benchmark_graph.graph.edges)}")
+    logger.info(f"benchmarks on waitlist: {len(benchmark_graph.benchmark_wait_list)}" )
+    logger.info(f"benchmarks left: {benchmark_graph.benchmarks_left()}")
+    logger.info(f"benchmarks running: {len(benchmark_graph.running_benchmarks)}")
+
+    with instrumentation.phase('get_benchmark_set'):
+      busy_nodes = benchmark_graph.get_busy_nodes()
+      maximum_set = benchmark_graph.get_benchmark_set(excluded_nodes=busy_nodes)
+    instrumentation.count('benchmark_set', len(maximum_set))
+
+    # only count as a stall if nothing is running that could free up VMs
+    if len(maximum_set) == 0 and len(benchmark_graph.running_benchmarks) == 0:
+      max_set_empty_counter += 1
+    else:
+      max_set_empty_counter = 0
+
+    if FLAGS.max_retries >= 0 and max_set_empty_counter > FLAGS.max_retries:
+      logger.debug("BENCHMARK WAIT LIST")
+      logger.debug(benchmark_graph.benchmark_wait_list)
+      return
+    logger.debug("MAXIMUM SET")
+    logger.debug(maximum_set)
+
+    max_set_vms = list(itertools.chain(*maximum_set))
+    if FLAGS.precreate_and_share_vms:
+      created_list = []
+      if len(max_set_vms) > 0:
+        with instrumentation.phase('create_vms'):
+          created_list = benchmark_graph.create_vms(vm_list=max_set_vms)
+      vms_created.append(created_list)
+      instrumentation.count('vms_created', len(created_list))
+      with instrumentation.phase('save_checkpoint'):
+        save_checkpoint_if_due(benchmark_graph, force=len(created_list) > 0)
+
+    maximum_sets.append(maximum_set)
+
+    with instrumentation.phase('start_benchmark_set'):
+      benchmark_graph.start_benchmark_set(maximum_set)
+
+    if len(benchmark_graph.running_benchmarks) > 0:
+      # wait for at least one benchmark to finish and free its VMs
+      with instrumentation.phase('collect_finished_benchmarks'):
+        finished = benchmark_graph.collect_finished_benchmarks()
+      logger.debug(f"{len(finished)} BENCHMARKS FINISHED")
+      instrumentation.count('benchmarks_finished', len(finished))
+    else:
+      with instrumentation.phase('sleep'):
+        time.sleep(2)
+
+    with instrumentation.phase('add_benchmarks_from_waitlist'):
+      benchmark_graph.add_benchmarks_from_waitlist()
+    with instrumentation.phase('equalize_graph'):
+      benchmark_graph.equalize_graph()
+    with instrumentation.phase('remove_orphaned_nodes'):
+      removed_list = benchmark_graph.remove_orphaned_nodes()
+    vms_removed.append(removed_list)
+    instrumentation.count('vms_removed', len(removed_list))
+    logger.info("UPDATE REGION QUOTAS")
+    with instrumentation.phase('update_quota_usage'):
+      update_quota_usage(benchmark_graph)
+    with instrumentation.phase('save_checkpoint'):
+      save_checkpoint_if_due(benchmark_graph)
+    with instrumentation.phase('add_benchmarks_from_waitlist'):
+      benchmark_graph.add_benchmarks_from_waitlist()
+    with instrumentation.phase('equalize_graph'):
+      benchmark_graph.equalize_graph()
+    logger.debug("benchmarks left: " + str(benchmark_graph.benchmarks_left()))
+    if FLAGS.print_graph:
+      benchmark_graph.print_graph()
 
 
 def update_quota_usage(benchmark_graph: benchmark_graph.BenchmarkGraph):
   """update the regional quotas based on data pulled from the cloud provider
 
-  Pulls current usage information from the cloud provider and updates
-  quota information based off of that
+  Pulls current usage information for the regions the graph uses and
+  merges it with the reservations of VMs that are not created yet.
+  Regions are only queried again once their --quota_cache_ttl runs out,
+  until then they keep the usage tracked by the scheduler. A cached
+  snapshot would miss VMs created since it was taken
 
   Args:
     benchmark_graph: Benchmark/VM Graph to update
@@ -436,33 +728,119 @@ def update_quota_usage(benchmark_graph: benchmark_graph.BenchmarkGraph):
   if FLAGS.no_run:
     return
 
+  regions_in_use = benchmark_graph.get_regions_in_use()
   for cloud in benchmark_graph.clouds:
-    #TODO change this
-    if cloud == 'GCP':
-      logger.debug(benchmark_graph.regions)
-      region_dict = cloud_util.get_region_info(cloud='GCP')
-      for region_name in benchmark_graph.regions:
-        if benchmark_graph.regions[region_name].cloud == 'GCP':
-          quotas = region_dict[region_name]
-          benchmark_graph.regions[region_name].update_quotas(quotas)
-    elif cloud == 'AWS':
-      region_dict = cloud_util.get_region_info(cloud='AWS')
-      logger.debug(benchmark_graph.regions)
-      logger.debug(region_dict)
-      for region_name in benchmark_graph.regions:
-        if benchmark_graph.regions[region_name].cloud == 'AWS':
-          quotas = region_dict[region_name]
-          benchmark_graph.regions[region_name].update_quotas(quotas)
-    elif cloud == 'Azure':
-      region_dict = cloud_util.get_region_info(cloud='Azure')
-      for region_name in benchmark_graph.regions:
-        if benchmark_graph.regions[region_name].cloud == 'Azure':
-          quotas = region_dict[region_name]
-          # print(f"\n\n\nQuotas from main: {quotas}\n\n\n")
-          benchmark_graph.regions[region_name].update_quotas(quotas)
-          # print(f"\n\n\nQuotas from main: {quotas}\n\n\n")
-    else:
-      pass
+    region_dict = get_quota_cache().refresh_region_info(cloud, regions_in_use.get(cloud, []))
+    for region_name in region_dict:
+      if region_name in benchmark_graph.regions:
+        benchmark_graph.regions[region_name].merge_quotas(region_dict[region_name])
+        get_event_journal().record('quota_update', cloud=cloud, region=region_name,
+                                   quotas=benchmark_graph.regions[region_name].get_all_quotas()[region_name])
+
+
+def save_checkpoint_if_due(benchmark_graph: benchmark_graph.BenchmarkGraph, force: bool = False):
+  """Saves a checkpoint of the run if --checkpoint_interval has passed
+
+  Args:
+    benchmark_graph: Benchmark/VM Graph of the run
+    force: save even if the interval has not passed
+  """
+  global last_checkpoint_time
+  if not FLAGS.checkpoint_file:
+    return
+  now = time.time()
+  if (not force and last_checkpoint_time is not None
+      and now - last_checkpoint_time < FLAGS.checkpoint_interval):
+    return
+
+  rounds = len(maximum_sets)
+  previous_completed = []
+  if resumed_checkpoint:
+    rounds += resumed_checkpoint['rounds']
+    previous_completed = resumed_checkpoint['completed_benchmarks']
+  checkpoint.save_checkpoint(FLAGS.checkpoint_file,
+                             checkpoint.create_checkpoint(benchmark_graph, config_hash, rounds,
+                                                          previous_completed))
+  last_checkpoint_time = now
+
+
+def resume_from_checkpoint(benchmark_graph: benchmark_graph.BenchmarkGraph, resumed: Dict[str, Any]):
+  """Adopts the VMs of a checkpoint into a graph built without its completed benchmarks
+
+  VMs that no remaining benchmark needs are deleted right away
+
+  Args:
+    benchmark_graph: Benchmark/VM Graph of the resumed run
+    resumed: checkpoint from checkpoint.load_checkpoint
+  """
+  running_vms = checkpoint.get_running_vms(resumed)
+  unused_vms = benchmark_graph.adopt_vms(running_vms)
+  logger.info(f"RESUMING AFTER {resumed['rounds']} ROUNDS: "
+              f"{len(resumed['completed_benchmarks'])} BENCHMARKS COMPLETED, "
+              f"{len(running_vms) - len(unused_vms)} VMS ADOPTED")
+  if unused_vms:
+    logger.info(f"DELETING {len(unused_vms)} VMS NO REMAINING BENCHMARK NEEDS")
+    benchmark_graph.delete_vms(unused_vms)
+
+
+def get_instrumentation() -> Instrumentation:
+  """Returns the phase timings shared by the whole run
+
+  Returns:
+      Instrumentation: phase timings
+  """
+  global instrumentation
+  if instrumentation is None:
+    instrumentation = Instrumentation()
+  return instrumentation
+
+
+def get_event_journal() -> EventJournal:
+  """Returns the journal of scheduling decisions shared by the whole run
+
+  Returns:
+      EventJournal: journal, it records nothing without --journal_file
+  """
+  global event_journal
+  if event_journal is None:
+    event_journal = EventJournal(FLAGS.journal_file)
+  return event_journal
+
+
+def get_run_history() -> Optional[RunHistory]:
+  """Returns the run times of past runs kept in --run_history_db
+
+  Returns:
+      Optional[RunHistory]: run history, None without --run_history_db
+  """
+  global run_history
+  if run_history is None and FLAGS.run_history_db:
+    run_history = RunHistory(FLAGS.run_history_db)
+  return run_history
+
+
+def get_config_cache() -> Optional[ConfigCache]:
+  """Returns the cache of parsed config files in --config_cache_dir
+
+  Returns:
+      Optional[ConfigCache]: config cache, None without --config_cache_dir
+  """
+  global config_cache
+  if config_cache is None and FLAGS.config_cache_dir:
+    config_cache = ConfigCache(FLAGS.config_cache_dir)
+  return config_cache
+
+
+def get_quota_cache() -> QuotaCache:
+  """Returns the quota cache shared by the whole run
+
+  Returns:
+      QuotaCache: quota cache
+  """
+  global quota_cache
+  if quota_cache is None:
+    quota_cache = QuotaCache(ttl=FLAGS.quota_cache_ttl)
+  return quota_cache
 
 
 def create_benchmark_from_config(benchmark_config, benchmark_id: int):
@@ -654,97 +1032,80 @@ def create_benchmark_from_config(benchmark_config, benchmark_id: int):
 
   return bm
 
-def create_graph_from_config_list(benchmark_config_list, pkb_command: str) -> benchmark_graph.BenchmarkGraph:
+def start_simulation() -> Simulator:
+  """Sets up --simulate before the benchmark graph is created
 
-  full_graph = benchmark_graph.BenchmarkGraph(ssh_pub="ssh_key.pub",
-                                              ssh_priv="ssh_key",
-                                              ssl_cert="cert.pem",
-                                              pkb_location=pkb_command,
-                                              bigquery_table=FLAGS.bigquery_table,
-                                              bq_project=FLAGS.bq_project)
-
-  # First pass, find all the regions and add them to the graph
-  # config[0] is the benchmark_name
-  # config[1] is all the flags
-
-  # TODO MAKE CLOUDS
-  # ADD REGIONS TO CLOUDS
-  # IF AWS REGION, GIVE VPC QUOTA OF 5
-  # IF AWS CLOUD, give CPU resource of 1900
-  # USE THIS COMMAND TO GET USAGE
-  # aws ec2 describe-vpcs --region us-east-1
+  Switches the scheduler to a virtual clock, and makes quota queries
+  return simulated quotas. create_graph_from_config_list adds the
+  regions used by the configs to the simulation
 
-  # get all regions from gcloud
-  # make regions
-  clouds_in_benchmark_set = []
-  for benchmark_config in benchmark_config_list: 
-    if 'vm_groups' in benchmark_config[1]:
-      for key in benchmark_config[1]['vm_groups']:
-        cloud = benchmark_config[1]['vm_groups'][key]['cloud']
-        clouds_in_benchmark_set.append(cloud)
-    else:
-      cloud = benchmark_config[1]['flags']['cloud']
-      clouds_in_benchmark_set.append(cloud)
-
-  clouds_in_benchmark_set = list(set(clouds_in_benchmark_set))
-  logger.debug("CLOUDS IN BENCHMARK SET")
-  logger.debug(clouds_in_benchmark_set)
+  Returns:
+    Simulator: the simulation, its executor runs the pkb commands
+  """
+  global simulation, quota_cache
+  # simulated commands go through the executor, which is skipped by no_run
+  FLAGS.no_run = False
+  simulation = Simulator.from_config_file(FLAGS.simulation_config, seed=FLAGS.simulation_seed)
 
-  # CREATE and ADD regions for GCP
+  simulator.install_clock(simulation.clock, [sys.modules[__name__]])
+  quota_cache = QuotaCache(ttl=FLAGS.quota_cache_ttl, fetch_function=simulation.get_region_info)
+  return simulation
 
-  if 'GCP' in clouds_in_benchmark_set:
-    region_dict = cloud_util.get_region_info(cloud='GCP')
 
-    new_cloud = Cloud('GCP', instance_quota=None, cpu_quota=None, address_quota=None, bandwidth_limit=FLAGS.cloud_bandwidth_limit)
-    full_graph.add_cloud_if_not_exists(new_cloud)
-    for key in region_dict:
-      # if region['description'] in full_graph.regions
-      new_region = GcpRegion(region_name=key,
-                             cloud=new_cloud,
-                             quotas=region_dict[key],
-                             bandwidth_limit=FLAGS.regional_bandwidth_limit)
-      full_graph.add_region_if_not_exists(new_region=new_region)
+def create_graph_from_config_list(benchmark_config_list, pkb_command: str,
+                                  pkb_executor=None,
+                                  skip_config_indexes: Set[int] = frozenset()) -> benchmark_graph.BenchmarkGraph:
+  """Creates the benchmark graph from parsed configs
 
-  if 'AWS' in clouds_in_benchmark_set:
-    # CREATE and ADD regions for AWS
-    new_cloud = Cloud('AWS', instance_quota=None, cpu_quota=None, address_quota=None, bandwidth_limit=FLAGS.cloud_bandwidth_limit)
-    full_graph.add_cloud_if_not_exists(new_cloud)
-    region_dict = cloud_util.get_region_info(cloud='AWS')
-    for key in region_dict:
-      # if region['description'] in full_graph.regions
-      new_region = AwsRegion(region_name=key,
-                             cloud=new_cloud,
-                             quotas=region_dict[key],
-                             bandwidth_limit=FLAGS.regional_bandwidth_limit)
-      full_graph.add_region_if_not_exists(new_region=new_region)
+  Args:
+    benchmark_config_list: (benchmark_name, config) tuples, a list or an
+      iterator like iterate_config_files that is consumed once
+    pkb_command: command that runs pkb
+    pkb_executor: executor for pkb processes, see AsyncioPkbExecutor
+    skip_config_indexes: config indexes of benchmarks that are not added,
+      ex ones completed before a resume
 
-  if 'Azure' in clouds_in_benchmark_set:
-    # CREATE and ADD regions for Azure
-    # Troy if there are any cloud wide quotas, we should deal with them here
-    # Also let me know, because I'll need to add better support for cloud-wide quotas (currently there is ~None)
-    new_cloud = Cloud('Azure', instance_quota=None, cpu_quota=None, address_quota=None, bandwidth_limit=FLAGS.cloud_bandwidth_limit)
-    full_graph.add_cloud_if_not_exists(new_cloud)
-    region_dict = cloud_util.get_region_info(cloud='Azure')
-    for key in region_dict:
-      # if region['description'] in full_graph.regions
-      print(f"\n\n\nADDING QUOTAS HERE: {region_dict[key]}\n\n\n")
-      new_region = AzureRegion(region_name=key,
-                               cloud=new_cloud,
-                               quotas=region_dict[key],
-                               bandwidth_limit=FLAGS.regional_bandwidth_limit)
-      full_graph.add_region_if_not_exists(new_region=new_region)
+  Returns:
+    benchmark_graph.BenchmarkGraph: graph of VMs and benchmarks
+  """
 
+  strategy = scheduling_strategy.get_scheduling_strategy(FLAGS.scheduling_strategy,
+                                                         incremental_matching=FLAGS.incremental_matching,
+                                                         time_budget=FLAGS.scheduling_time_budget,
+                                                         matching_pool_size=FLAGS.matching_pool_size,
+                                                         parallel_matching_min_edges=FLAGS.parallel_matching_min_edges)
+  executor = pkb_executor
+  if executor is None and FLAGS.pkb_executor == 'ASYNCIO':
+    executor = AsyncioPkbExecutor(max_concurrency=FLAGS.max_processes)
+  full_graph = benchmark_graph.BenchmarkGraph(ssh_pub="ssh_key.pub",
+                                              ssh_priv="ssh_key",
+                                              ssl_cert="cert.pem",
+                                              pkb_location=pkb_command,
+                                              bigquery_table=FLAGS.bigquery_table,
+                                              bq_project=FLAGS.bq_project,
+                                              scheduling_strategy=strategy,
+                                              pkb_executor=executor,
+                                              instrumentation=get_instrumentation(),
+                                              event_journal=get_event_journal(),
+                                              run_history=get_run_history())
 
   # This takes all the stuff from the config dictionaries
-  # and puts them in benchmark objects
+  # and puts them in benchmark objects, one config at a time,
+  # so only the benchmark objects are kept
   # will need more logic for differently formatted configs
   benchmark_counter = 0
   temp_benchmarks = []
+  # cloud -> regions used by the benchmarks, in the order they were found
+  regions_in_benchmark_set = {}
   for config in benchmark_config_list:
     new_benchmark = create_benchmark_from_config(config,
                                                  benchmark_counter)
-    temp_benchmarks.append(new_benchmark)
     benchmark_counter += 1
+    for vm_spec in new_benchmark.vm_specs:
+      region_name = cloud_util.get_region_from_zone(vm_spec.cloud, vm_spec.zone)
+      regions_in_benchmark_set.setdefault(vm_spec.cloud, {})[region_name] = None
+    if simulation:
+      simulation.add_vm_specs(new_benchmark.vm_specs)
 
     # Logic to count number of benchmarks for each bigquery table
     if new_benchmark.bigquery_table in benchmarks_per_table:
@@ -752,6 +1113,35 @@ def create_graph_from_config_list(benchmark_config_list, pkb_command: str) -> be
     else:
       benchmarks_per_table[new_benchmark.bigquery_table] = 1
 
+    # already completed by the run that is resumed
+    if new_benchmark.config_index in skip_config_indexes:
+      continue
+    temp_benchmarks.append(new_benchmark)
+
+  logger.debug("NUMBER OF CONFIGS")
+  logger.debug(benchmark_counter)
+  logger.debug("CLOUDS IN BENCHMARK SET")
+  logger.debug(list(regions_in_benchmark_set))
+
+  # Only the regions the benchmarks use are created, with one quota
+  # query per cloud
+  # TODO IF AWS REGION, GIVE VPC QUOTA OF 5
+  # aws ec2 describe-vpcs --region us-east-1
+  for cloud_name, region_class in (('GCP', GcpRegion), ('AWS', AwsRegion), ('Azure', AzureRegion)):
+    if cloud_name not in regions_in_benchmark_set:
+      continue
+    # Troy if there are any cloud wide quotas, we should deal with them here
+    new_cloud = Cloud(cloud_name, instance_quota=None, cpu_quota=None, address_quota=None, bandwidth_limit=FLAGS.cloud_bandwidth_limit)
+    full_graph.add_cloud_if_not_exists(new_cloud)
+    region_dict = get_quota_cache().get_region_info(cloud_name,
+                                                    regions=list(regions_in_benchmark_set[cloud_name]))
+    for key in region_dict:
+      logger.debug(f"ADDING {cloud_name} REGION {key} WITH QUOTAS: {region_dict[key]}")
+      new_region = region_class(region_name=key,
+                                cloud=new_cloud,
+                                quotas=region_dict[key],
+                                bandwidth_limit=FLAGS.regional_bandwidth_limit)
+      full_graph.add_region_if_not_exists(new_region=new_region)
 
   logger.debug("Number of benchmarks: " + str(len(temp_benchmarks)))
   temp_benchmarks.sort(key=lambda x: x.largest_vm, reverse=True)
@@ -763,10 +1153,6 @@ def create_graph_from_config_list(benchmark_config_list, pkb_command: str) -> be
 
   logger.debug("Number of benchmarks: " + str(len(full_graph.benchmarks)))
 
-  # Second pass, add
-  for config in benchmark_config_list:
-    pass
-
   return full_graph
 
 
@@ -784,22 +1170,12 @@ def parse_config_list(config_list, ignore_hidden_folders: bool = True):
   print(config_list)
   for path in config_list:
     print(f'PATH: {path}')
-    path = path.strip()
-    for r, d, f in os.walk(path):
-      for file in f:
-        if ('.yaml' in file) or ('.yml' in file):
-          file_path = os.path.join(r, file)
-          if ('/.' not in file_path) or (ignore_hidden_folders is False):
-            file_list.append(os.path.join(r, file))
+    file_list.extend(_find_config_files(path.strip(), ignore_hidden_folders))
 
   for f in file_list:
     print(f)
 
-  benchmark_config_list = []
-  for file in file_list:
-    benchmark_config_list.extend(parse_config_file(file))
-
-  return benchmark_config_list
+  return parse_config_files(file_list)
 
 
 
@@ -812,49 +1188,176 @@ def parse_config_folder(path: str = "configs/", ignore_hidden_folders: bool = Tr
   Args:
     path: The folder path to look for config files (default: {"configs/"})
   """
+  file_list = _find_config_files(path, ignore_hidden_folders)
+
+  for f in file_list:
+    print(f)
+
+  return parse_config_files(file_list)
+
+
+def _find_config_files(path: str, ignore_hidden_folders: bool = True) -> List[str]:
+  """Finds all .yaml and .yml files in a folder and its subfolders
+
+  Folders and files are walked in sorted order, so the benchmarks of a
+  config tree get the same config indexes on every machine
+
+  Args:
+    path: folder to search
+    ignore_hidden_folders: skip files in folders starting with a dot
+
+  Returns:
+    List[str]: paths of the config files
+  """
   file_list = []
   for r, d, f in os.walk(path):
-    for file in f:
+    d.sort()
+    for file in sorted(f):
       if ('.yaml' in file) or ('.yml' in file):
         file_path = os.path.join(r, file)
         if ('/.' not in file_path) or (ignore_hidden_folders is False):
-          file_list.append(os.path.join(r, file))
+          file_list.append(file_path)
+  return file_list
+
+
+def parse_config_files(file_list: List[str]) -> List[Tuple[str,Dict[Any,Any]]]:
+  """Parses config files in a process pool
+
+  Args:
+    file_list: config files to parse
+
+  Returns:
+    List[Tuple[str, Dict[Any, Any]]]: (benchmark_name, config) of every file
+  """
+  return list(iterate_config_files(file_list))
 
-  for f in file_list:
-    print(f)
 
-  benchmark_config_list = []
-  for file in file_list:
-    benchmark_config_list.extend(parse_config_file(file))
+def iterate_config_files(file_list: List[str]) -> Iterator[Tuple[str,Dict[Any,Any]]]:
+  """Yields the configs of config files, parsed in a process pool
 
-  return benchmark_config_list
+  With --config_parse_processes above 1, each file is parsed by
+  parse_config_file in a worker process. The configs are yielded in the
+  order of file_list, the same as parsing the files one after another.
+  Only a few files more than there are workers are parsed ahead of the
+  caller, so at most those are in memory
+
+  Args:
+    file_list: config files to parse
 
+  Yields:
+    Tuple[str, Dict[Any, Any]]: (benchmark_name, config)
+  """
+  processes = FLAGS.config_parse_processes or os.cpu_count() or 1
+  processes = min(processes, len(file_list))
+  if processes <= 1:
+    for file in file_list:
+      yield from iterate_config_file(file, get_config_cache())
+    return
 
-def parse_config_file(path: str = "configs/file.yaml") -> List[Tuple[str,Dict[Any,Any]]]:
+  # configs are consumed while the graph is built, when the pkb executor
+  # may already run its event loop thread, so workers are spawned instead
+  # of forked. They have no parsed flags, the ones they need are passed in
+  with ProcessPoolExecutor(max_workers=processes,
+                           mp_context=multiprocessing.get_context('spawn')) as executor:
+    pending = collections.deque()
+    files = iter(file_list)
+    for file in itertools.islice(files, processes * 2):
+      pending.append(executor.submit(parse_config_file, file, FLAGS.config_cache_dir))
+    while pending:
+      file_configs = pending.popleft().result()
+      for file in itertools.islice(files, 1):
+        pending.append(executor.submit(parse_config_file, file, FLAGS.config_cache_dir))
+      yield from file_configs
+
+
+def parse_config_file(path: str = "configs/file.yaml",
+                      config_cache_dir: Optional[str] = None) -> List[Tuple[str,Dict[Any,Any]]]:
   """Parse config file functions, largely taken from the PKB parsing function
+
+  Runs in config parsing worker processes, which do not parse flags
   
   Args:
       path (str, optional): Description
+      config_cache_dir (Optional[str], optional): --config_cache_dir. Defaults to None.
   
   Returns:
       List[Tuple[str, Dict[Any, Any]]]: Description
   """
-  crossed_axes = []
-  benchmark_config_list = []
-
-  # open file and parse yaml
-  # return empty list if not correct yaml
-  f = open(path, "r")
-  contents = f.read()
-  yaml_contents = yaml.safe_load(contents)
+  global logger
+  if logger is None:
+    logger = logging.getLogger('pkb_scheduler')
+  cache = ConfigCache(config_cache_dir) if config_cache_dir else None
+  return list(iterate_config_file(path, cache))
+
+
+def iterate_config_file(path: str = "configs/file.yaml",
+                        cache: Optional[ConfigCache] = None) -> Iterator[Tuple[str,Dict[Any,Any]]]:
+  """Yields the configs of a config file one flag_matrix combination at a time
+
+  Each combination is only built when it is reached and passes
+  flag_matrix_filters, so a large flag_matrix is never expanded all at
+  once. Combinations share the flags of the file and only hold their
+  own axis values
+
+  With a cache, the flag_matrix combinations of the file are kept in
+  it, and a file that did not change is not parsed again
+
+  Args:
+      path (str, optional): config file
+      cache (Optional[ConfigCache], optional): cache of parsed config
+        files, see get_config_cache. Defaults to None.
+
+  Yields:
+      Tuple[str, Dict[Any, Any]]: (benchmark_name, config)
+  """
+  with open(path, "rb") as f:
+    contents = f.read()
+
+  content_hash = None
+  parsed_file = None
+  if cache:
+    content_hash = get_content_hash(contents)
+    parsed_file = cache.load(path, content_hash)
+    logger.debug(f"CONFIG CACHE {'HIT' if parsed_file else 'MISS'}: {path}")
+
+  if parsed_file is None:
+    parsed_file = expand_config_file(contents)
+    if cache:
+      if parsed_file:
+        benchmark_name, config_dict, base_flags, combinations = parsed_file
+        parsed_file = (benchmark_name, config_dict, base_flags, list(combinations))
+      cache.store(path, content_hash, parsed_file)
+
+  # yield nothing if not correct yaml
+  if not parsed_file:
+    return
+  benchmark_name, config_dict, base_flags, combinations = parsed_file
+  for axis_values in combinations:
+    config = _GetConfigForAxis(config_dict, base_flags, axis_values)
+    yield (benchmark_name, config)
+
+
+def expand_config_file(contents: bytes) -> Optional[Tuple[str, Dict[str, Any], Dict[str, Any], Iterator[Dict[str, Any]]]]:
+  """Parses a config file and expands its flag_matrix
+
+  Args:
+      contents (bytes): contents of the config file
+
+  Returns:
+      Optional[Tuple]: (benchmark_name, config without flags, flags, axis
+        values of each combination that passes flag_matrix_filters), None
+        if the file is not a yaml mapping. The combinations are generated
+        as they are iterated
+  """
+  yaml_contents = yaml.load(contents, Loader=YamlLoader)
   if not isinstance(yaml_contents, dict):
-    return []
+    return None
 
   benchmark_name = list(yaml_contents.keys())[0]
   config_dict = yaml_contents[benchmark_name]
 
   flag_matrix_name = config_dict.get('flag_matrix', None)
-  flag_matrix = config_dict.pop(
+  flag_matrix_values = config_dict.pop(
       'flag_matrix_defs', {}).get(flag_matrix_name, {})
 
   flag_matrix_filter = config_dict.pop(
@@ -863,32 +1366,34 @@ def parse_config_file(path: str = "configs/file.yaml") -> List[Tuple[str,Dict[An
   config_dict.pop('flag_matrix', None)
   config_dict.pop('flag_zip', None)
 
-  for flag, values in sorted(six.iteritems(flag_matrix)):
-      crossed_axes.append([{flag: v} for v in values])
-
-  for flag_config in itertools.product(*crossed_axes):
-    config = {}
-    config = _GetConfigForAxis(config_dict, flag_config)
-    if (flag_matrix_filter and not eval(flag_matrix_filter, {},
-                                        config['flags'])):
-      # logger.debug("Did not pass Flag Matrix Filter")
-      continue
+  # the filter is checked against the axis values before a config is
+  # built, combinations that fail it are never built
+  base_flags = config_dict.pop('flags', {}) or {}
+  combinations = flag_matrix.iterate_flag_matrix(flag_matrix_values,
+                                                 base_flags,
+                                                 flag_matrix_filter)
+  return (benchmark_name, config_dict, base_flags, combinations)
 
-    benchmark_config_list.append((benchmark_name, config))
 
-  f.close()
+def _GetConfigForAxis(benchmark_config: Dict[str, Any], base_flags: Dict[str, Any],
+                      axis_values: Dict[str, Any]) -> Dict[str, Any]:
+  """Returns the config of one flag_matrix combination
 
-  return benchmark_config_list
+  The flags of the file are shared by every combination, see
+  BenchmarkFlags. Everything else in the config is shared too and is
+  only read
 
+  Args:
+      benchmark_config (Dict[str, Any]): config of the file, without its flags
+      base_flags (Dict[str, Any]): flags of the file
+      axis_values (Dict[str, Any]): flag values of the combination
 
-def _GetConfigForAxis(benchmark_config, flag_config):
-  config = copy.copy(benchmark_config)
-  config_local_flags = config.get('flags', {})
-  config['flags'].update(config_local_flags)
-  for setting in flag_config:
-    config['flags'].update(setting)
-  return_config = copy.deepcopy(config)
-  return return_config
+  Returns:
+      Dict[str, Any]: config of the combination
+  """
+  config = dict(benchmark_config)
+  config['flags'] = BenchmarkFlags(base_flags, axis_values)
+  return config
 
 
 def parse_named_configs(config):
@@ -0,0 +1,208 @@
+from __future__ import annotations
+import logging
+import multiprocessing as mp
+import subprocess
+import time
+
+from typing import List, Dict, Tuple, Set, Any, Optional
+
+# Small records passed to and from the worker processes that run pkb.
+# Workers get a task with only what they need to start pkb, and send
+# back a result with only what the scheduler needs from the run, so the
+# benchmark graph never has to be pickled for a worker.
+
+
+class VmCreationTask():
+  """Everything a worker needs to create a VM
+
+  Attributes:
+      node_id (int): node id of the VM in the benchmark graph
+      command (str): pkb command that creates the VM
+      no_run (bool): fake the creation instead of running pkb
+  """
+
+  def __init__(self, node_id: int, command: str, no_run: bool = False):
+    self.node_id = node_id
+    self.command = command
+    self.no_run = no_run
+
+
+class VmCreationResult():
+  """What a worker found out about a VM it created
+
+  Attributes:
+      node_id (int): node id of the VM in the benchmark graph
+      success (bool): the pkb output had the VM info section
+      internal_ip (str): internal ip of the VM
+      ip_address (str): external ip of the VM
+      name (str): name of the VM on the cloud
+      run_uri (str): pkb run_uri that owns the VM
+      uid (str): pkb uid of the VM
+      password (str): password of windows VMs
+      create_timestamp (float): timestamp the creation started at
+      creation_time (float): seconds the creation took, None if faked
+      output (str): pkb output, only kept when the info section was not found
+  """
+
+  def __init__(self, node_id: int):
+    self.node_id = node_id
+    self.success = False
+    self.internal_ip = ""
+    self.ip_address = ""
+    self.name = ""
+    self.run_uri = None
+    self.uid = None
+    self.password = None
+    self.create_timestamp = None
+    self.creation_time = None
+    self.output = ""
+
+
+class BenchmarkTask():
+  """Everything a worker needs to run a benchmark
+
+  Attributes:
+      benchmark_id (int): id of the benchmark
+      bm_tuple (Tuple[int, int, int]): (node1, node2, edge key) of the benchmark
+      result_index (int): index of the benchmark in its set
+      command (str): pkb command that runs the benchmark
+      config_file (str): benchmark config file used by the command
+      no_run (bool): fake the run instead of running pkb
+  """
+
+  def __init__(self, benchmark_id: int, bm_tuple: Tuple[int, int, int],
+               result_index: int, command: str, config_file: str, no_run: bool = False):
+    self.benchmark_id = benchmark_id
+    self.bm_tuple = bm_tuple
+    self.result_index = result_index
+    self.command = command
+    self.config_file = config_file
+    self.no_run = no_run
+
+
+class BenchmarkResult():
+  """Outcome of a benchmark run by a worker
+
+  Attributes:
+      benchmark_id (int): id of the benchmark
+      bm_tuple (Tuple[int, int, int]): (node1, node2, edge key) of the benchmark
+      result_index (int): index of the benchmark in its set
+      status (str): new status of the benchmark
+      success (bool): the benchmark can be removed from the graph
+      start_time (float): timestamp the run started at
+      end_time (float): timestamp the run ended at
+      run_time (float): seconds the run took, None if faked
+  """
+
+  def __init__(self, benchmark_id: int, bm_tuple: Tuple[int, int, int], result_index: int):
+    self.benchmark_id = benchmark_id
+    self.bm_tuple = bm_tuple
+    self.result_index = result_index
+    self.status = "Not Executed"
+    self.success = False
+    self.start_time = None
+    self.end_time = None
+    self.run_time = None
+
+
+def parse_creation_output(node_id: int, output: str) -> VmCreationResult:
+  """Reads the VM info section from the output of a pkb vm_setup run
+
+  Args:
+      node_id (int): node id of the VM in the benchmark graph
+      output (str): stdout of pkb
+
+  Returns:
+      VmCreationResult: result without any timing set
+  """
+  result = VmCreationResult(node_id)
+
+  # have to use this instead of line in output
+  # because that splits by letter when threading?
+  for line in output.split('\n'):
+    if "INTERNAL_IP:" in line:
+      result.internal_ip = line.split()[1]
+    elif "EXTERNAL_IP:" in line:
+      result.ip_address = line.split()[1]
+    elif "NAME:" in line:
+      result.name = line.split()[1]
+    elif "RUN_URI" in line:
+      result.run_uri = line.split()[1]
+    elif "UID" in line:
+      result.uid = line.split()[1]
+    # only for windows VMs
+    elif "PASSWORD" in line:
+      result.password = line.split()[1]
+
+  result.success = result.run_uri is not None
+  if not result.success:
+    result.output = output
+  return result
+
+
+def run_vm_creation_task(task: VmCreationTask, queue: mp.Queue):
+  """Worker process target that creates a VM and puts a VmCreationResult on the queue
+
+  Args:
+      task (VmCreationTask): VM to create
+      queue (mp.Queue): queue to put the result on
+  """
+  logger = logging.getLogger('pkb_scheduler')
+  logger.info('CREATE INSTANCE: ' + task.command)
+
+  if task.no_run:
+    result = VmCreationResult(task.node_id)
+    result.success = True
+    result.run_uri = "no_run"
+    result.uid = "no_run"
+    result.ip_address = "9.9.9.9"
+    result.internal_ip = "172.0.0.1"
+    result.name = "no run"
+    result.create_timestamp = time.time()
+    queue.put(result)
+    return
+
+  start_time = time.time()
+  process = subprocess.Popen(task.command.split(),
+                             stdout=subprocess.PIPE)
+  output, error = process.communicate()
+  end_time = time.time()
+  time.sleep(1)
+
+  result = parse_creation_output(task.node_id, output.decode("utf-8"))
+  result.create_timestamp = start_time
+  result.creation_time = end_time - start_time
+  queue.put(result)
+
+
+def run_benchmark_task(task: BenchmarkTask, queue: mp.Queue):
+  """Worker process target that runs a benchmark and puts a BenchmarkResult on the queue
+
+  Args:
+      task (BenchmarkTask): benchmark to run
+      queue (mp.Queue): queue to put the result on
+  """
+  logger = logging.getLogger('pkb_scheduler')
+  logger.debug("BM TUPLE")
+  logger.debug(task.bm_tuple)
+  logger.debug(task.config_file)
+  logger.debug("RUN BM: " + task.command)
+
+  result = BenchmarkResult(task.benchmark_id, task.bm_tuple, task.result_index)
+  if task.no_run:
+    result.status = "Executed"
+    result.success = True
+    queue.put(result)
+    return
+
+  result.start_time = time.time()
+  process = subprocess.Popen(task.command.split(),
+                             stdout=subprocess.PIPE)
+  output, error = process.communicate()
+  result.end_time = time.time()
+  result.run_time = result.end_time - result.start_time
+
+  # TODO make this actually do something on failure
+  result.status = "Executed"
+  result.success = True
+  queue.put(result)
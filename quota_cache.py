@@ -0,0 +1,126 @@
+from __future__ import annotations
+import copy
+import logging
+import time
+import cloud_util
+
+from typing import List, Dict, Tuple, Set, Any, Optional, Iterable
+
+
+logger = None
+
+
+class QuotaCache():
+  """Caches region quotas from cloud_util.get_region_info
+
+  Every region is fetched at most once per ttl seconds. Callers pass
+  the regions they care about, so regions that are not in use are
+  never queried again after the first fetch.
+
+  Attributes:
+      ttl (float): seconds region quotas are reused for, 0 to always refresh
+      fetch_function: function that queries the cloud, defaults to cloud_util.get_region_info
+      region_info (Dict[str, Dict[str, Any]]): cached quotas, keyed by cloud then region
+      fetch_times (Dict[Tuple[str, str], float]): when each (cloud, region) was fetched
+  """
+
+  def __init__(self, ttl: float = 300, fetch_function=None):
+    global logger
+    logger = logging.getLogger('pkb_scheduler')
+
+    self.ttl = ttl
+    self.fetch_function = fetch_function or cloud_util.get_region_info
+    self.region_info = {}
+    self.fetch_times = {}
+
+  def is_stale(self, cloud: str, region_name: str, now: Optional[float] = None) -> bool:
+    """Checks whether the quotas of a region have to be fetched again
+
+    Args:
+        cloud (str): name of the cloud
+        region_name (str): name of the region
+        now (Optional[float], optional): current timestamp. Defaults to time.time().
+
+    Returns:
+        bool: True if the region was never fetched or its ttl ran out
+    """
+    if now is None:
+      now = time.time()
+    fetch_time = self.fetch_times.get((cloud, region_name))
+    return fetch_time is None or now - fetch_time >= self.ttl
+
+  def get_region_info(self, cloud: str, regions: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Get quota info for regions of a cloud, refreshing only stale regions
+
+    Args:
+        cloud (str): name of the cloud
+        regions (Optional[Iterable[str]], optional): regions to get. Defaults to every region of the cloud.
+
+    Returns:
+        Dict[str, Any]: copy of the quotas, same shape as cloud_util.get_region_info
+    """
+    now = time.time()
+    cached_regions = self.region_info.setdefault(cloud, {})
+
+    if regions is None:
+      if len(cached_regions) == 0 or any(self.is_stale(cloud, name, now) for name in cached_regions):
+        self._fetch(cloud, None)
+      return copy.deepcopy(cached_regions)
+
+    regions = list(regions)
+    stale_regions = [name for name in regions if self.is_stale(cloud, name, now)]
+    if stale_regions:
+      self._fetch(cloud, stale_regions)
+
+    region_dict = {}
+    for name in regions:
+      if name in cached_regions:
+        region_dict[name] = cached_regions[name]
+    return copy.deepcopy(region_dict)
+
+  def refresh_region_info(self, cloud: str, regions: Iterable[str]) -> Dict[str, Any]:
+    """Fetches the regions whose ttl ran out and returns only those
+
+    Regions that are still within their ttl are left out, their cached
+    quotas are older than the usage the scheduler tracked since. So are
+    regions the cloud did not return, like ones whose query failed,
+    which keep their previous quotas
+
+    Args:
+        cloud (str): name of the cloud
+        regions (Iterable[str]): regions to refresh
+
+    Returns:
+        Dict[str, Any]: copy of the quotas fetched in this call, same shape
+          as cloud_util.get_region_info
+    """
+    now = time.time()
+    self.region_info.setdefault(cloud, {})
+    stale_regions = [name for name in regions if self.is_stale(cloud, name, now)]
+    if not stale_regions:
+      return {}
+
+    fetched_regions = self._fetch(cloud, stale_regions)
+    region_dict = {}
+    for name in stale_regions:
+      if name in fetched_regions:
+        region_dict[name] = self.region_info[cloud][name]
+    return copy.deepcopy(region_dict)
+
+  def _fetch(self, cloud: str, regions: Optional[List[str]]) -> Set[str]:
+    """Queries the cloud and caches what it returned
+
+    Returns:
+        Set[str]: names of the regions the cloud returned
+    """
+    logger.debug(f"REFRESHING {cloud} QUOTAS: {regions if regions is not None else 'all regions'}")
+    region_dict = self.fetch_function(cloud=cloud, regions=regions)
+    fetch_time = time.time()
+    for name in region_dict:
+      # GCP returns every region from one call, keep them all
+      self.region_info[cloud][name] = region_dict[name]
+      self.fetch_times[(cloud, name)] = fetch_time
+    # regions the cloud did not return are not asked for again until the ttl runs out
+    for name in regions or []:
+      self.fetch_times[(cloud, name)] = fetch_time
+    return set(region_dict)
@@ -153,6 +153,26 @@ class Region():
   def update_quotas(self, quotas):
     pass
 
+  def merge_quotas(self, quotas):
+    """Replaces the quotas with fresh ones from the cloud provider
+
+    The fresh usage only counts VMs that are on the cloud. VMs in this
+    region that have not been created yet still hold a reservation,
+    so their usage is added back on top
+    
+    Args:
+        quotas: quotas of this region from cloud_util.get_region_info
+    """
+    quotas = copy.deepcopy(quotas)
+    for vm in self.virtual_machines:
+      if vm.status == 'Not Created':
+        for quota_name, amount in self.get_vm_quota_usage(vm).items():
+          self._add_quota_usage(quotas, quota_name, amount)
+    self.update_quotas(quotas)
+
+  def _add_quota_usage(self, quotas, quota_name: str, amount: int):
+    pass
+
   def get_all_quotas(self) -> Dict[str,Dict[str,int]]:
     quotas = {}
     quotas[self.name] = {}
@@ -160,6 +180,39 @@ class Region():
     quotas[self.name]['address_quota'] = self.address_quota
     return quotas
 
+  def get_vm_quota_usage(self, vm: VirtualMachine) -> Dict[str,int]:
+    """Get how much of each quota in this region a virtual machine uses
+    
+    Args:
+        vm (VirtualMachine): VirtualMachine in this region
+    
+    Returns:
+        Dict[str, int]: amount used, keyed by quota name
+    """
+    return {}
+
+  def get_quota_limit(self, quota_name: str) -> Optional[int]:
+    """Get the limit of a quota in this region
+    
+    Args:
+        quota_name (str): name of the quota
+    
+    Returns:
+        Optional[int]: limit of the quota, None if it is not tracked
+    """
+    return None
+
+  def get_quota_usage(self, quota_name: str) -> Optional[int]:
+    """Get the current usage of a quota in this region
+    
+    Args:
+        quota_name (str): name of the quota
+    
+    Returns:
+        Optional[int]: usage of the quota, None if it is not tracked
+    """
+    return None
+
 
 class GcpRegion(Region):
   """Class that represents a specific region in Google Cloud
@@ -324,6 +377,24 @@ class GcpRegion(Region):
     quotas[self.name] = copy.deepcopy(self.quotas)
     return quotas
 
+  def get_vm_quota_usage(self, vm: VirtualMachine) -> Dict[str,int]:
+    return {self._get_cpu_type(vm.machine_type): vm.cpu_count,
+            'IN_USE_ADDRESSES': 1}
+
+  def get_quota_limit(self, quota_name: str) -> Optional[int]:
+    if quota_name not in self.quotas:
+      return None
+    return self.quotas[quota_name]['limit']
+
+  def get_quota_usage(self, quota_name: str) -> Optional[int]:
+    if quota_name not in self.quotas:
+      return None
+    return self.quotas[quota_name]['usage']
+
+  def _add_quota_usage(self, quotas: Dict[Any,Any], quota_name: str, amount: int):
+    if quota_name in quotas:
+      quotas[quota_name]['usage'] += amount
+
 
 class AwsRegion(Region):
   """Class that represents a specific region in AWS
@@ -430,6 +501,23 @@ class AwsRegion(Region):
   def update_quotas(self, quotas: Dict[Any,Any]):
     self.quotas = quotas
 
+  def get_vm_quota_usage(self, vm: VirtualMachine) -> Dict[str,int]:
+    return {'vm': 1, 'vpc': 1, 'elastic_ip': 1}
+
+  def get_quota_limit(self, quota_name: str) -> Optional[int]:
+    if quota_name not in self.quotas:
+      return None
+    return self.quotas[quota_name]['limit']
+
+  def get_quota_usage(self, quota_name: str) -> Optional[int]:
+    if quota_name not in self.quotas:
+      return None
+    return self.quotas[quota_name]['usage']
+
+  def _add_quota_usage(self, quotas: Dict[Any,Any], quota_name: str, amount: int):
+    if quota_name in quotas:
+      quotas[quota_name]['usage'] += amount
+
 
 # Troy, I've split region into subclasses for each cloud
 # so put all the azure stuff in this class
@@ -447,6 +535,28 @@ class AzureRegion(Region):
     self.quotas = quotas # this is a dictionary
     Region.__init__(self, region_name, cloud, bandwidth_limit=bandwidth_limit)
 
+  def _get_family_quota_name(self, machine_type: str) -> str:
+    """Get the name of the vCPU family quota for a machine type
+    
+    Args:
+        machine_type (str): Full machine type string, ex Standard_D2s_v3
+    
+    Returns:
+        str: quota name, ex STANDARD DSV3 FAMILY VCPUS
+    """
+    verified_machine_type = machine_type
+    previous = ""
+    counter = 0 
+    for x in machine_type:
+      if x.isdigit() and previous != 'v':
+        verified_machine_type = verified_machine_type[0:counter] + verified_machine_type[counter+1:]
+      counter += 1
+      previous = x
+    verified_machine_type = verified_machine_type.replace("Standard_", "")
+    verified_machine_type = verified_machine_type.replace("_", "")
+    verified_machine_type = verified_machine_type.upper()
+    return "STANDARD " + verified_machine_type + " FAMILY VCPUS"
+
   def has_enough_resources(self, cpu_count: int, machine_type: str, estimated_bandwidth: Optional[int] = -1):
     """Checks all the resource quotas for this cloud region.
     Returns whether or not we can add another machine
@@ -502,18 +612,7 @@ class AzureRegion(Region):
       if vm.cloud.upper() == "AZURE":
         # verified_machine_type = re.findall("[123456789-]+", vm.machine_type)
         # verified_machine_type = vm.machine_type.replace(verified_machine_type[0], "")
-        verified_machine_type = vm.machine_type
-        previous = ""
-        counter = 0 
-        for x in vm.machine_type:
-          if x.isdigit() and previous != 'v':
-            verified_machine_type = verified_machine_type[0:counter] + verified_machine_type[counter+1:]
-          counter += 1
-          previous = x
-        verified_machine_type = verified_machine_type.replace("Standard_", "")
-        verified_machine_type = verified_machine_type.replace("_", "")
-        verified_machine_type = verified_machine_type.upper()
-        full_machine_string = "STANDARD " + verified_machine_type + " FAMILY VCPUS"
+        full_machine_string = self._get_family_quota_name(vm.machine_type)
         if self.quotas[full_machine_string][0] == self.quotas[full_machine_string][1]:
           return False
         self.quotas[full_machine_string][0] += 1
@@ -542,21 +641,7 @@ class AzureRegion(Region):
     """
 
     if self.cloud.name.upper() == "AZURE":
-      verified_machine_type = vm.machine_type
-
-      previous = ""
-      counter = 0 
-      for x in vm.machine_type:
-        if x.isdigit() and previous != 'v':
-          #print(f"Before type is: {verified_machine_type}")
-          verified_machine_type = verified_machine_type[0:counter] + verified_machine_type[counter+1:]
-          #print(f"After type is: {verified_machine_type}")
-        counter += 1
-        previous = x
-      verified_machine_type = verified_machine_type.replace("Standard_", "")
-      verified_machine_type = verified_machine_type.replace("_", "")
-      verified_machine_type = verified_machine_type.upper()
-      full_machine_string = "STANDARD " + verified_machine_type + " FAMILY VCPUS"
+      full_machine_string = self._get_family_quota_name(vm.machine_type)
       self.quotas[full_machine_string][0] -= 1
       self.quotas['TOTAL REGIONAL VCPUS'][0] -= 1
       self.quotas['VIRTUAL MACHINES'][0] -= 1
@@ -596,3 +681,24 @@ class AzureRegion(Region):
 
   def update_quotas(self, quotas):
     self.quotas = quotas
+
+  def get_vm_quota_usage(self, vm: VirtualMachine) -> Dict[str,int]:
+    return {self._get_family_quota_name(vm.machine_type): 1,
+            'TOTAL REGIONAL VCPUS': 1,
+            'VIRTUAL MACHINES': 1,
+            'PUBLIC IP ADDRESSES - BASIC': 1}
+
+  # azure quotas are stored as [usage, limit]
+  def get_quota_limit(self, quota_name: str) -> Optional[int]:
+    if quota_name not in self.quotas:
+      return None
+    return self.quotas[quota_name][1]
+
+  def get_quota_usage(self, quota_name: str) -> Optional[int]:
+    if quota_name not in self.quotas:
+      return None
+    return self.quotas[quota_name][0]
+
+  def _add_quota_usage(self, quotas, quota_name: str, amount: int):
+    if quota_name in quotas:
+      quotas[quota_name][0] += amount
@@ -0,0 +1,282 @@
+# Rebuilds the benchmark graph of a scheduler run from its --journal_file,
+# to see the state the scheduler made a decision in without running it
+# again.
+#
+# python3 replay_journal.py --journal=journal.jsonl --until_round=12 --replay_output=state.json
+#
+# Events are applied in the order they were written. A journal that was
+# appended to by a resumed run holds several runs, each starting with a
+# run_started event; replay starts over at each of them, so the state
+# is the one of the last run before the stopping point. Sequence numbers
+# keep counting across the runs of a journal, so --until_seq can stop in
+# any of them, while --until_round stops at the first run that reaches
+# the round.
+from __future__ import annotations
+import json
+import logging
+
+from typing import List, Dict, Tuple, Set, Any, Optional, Iterable
+from absl import flags
+from absl import app
+from benchmark import Benchmark
+from benchmark_graph import BenchmarkGraph
+from event_journal import read_events
+from virtual_machine import VirtualMachine
+
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+  'journal', None,
+  'JSONL journal written by pkb_scheduler.py --journal_file')
+
+flags.DEFINE_integer(
+  'until_seq', None,
+  'Stop after the event with this sequence number, sequence numbers are '
+  'unique across the runs of a journal')
+
+flags.DEFINE_integer(
+  'until_round', None,
+  'Stop at the start of this scheduling round, before any of its decisions')
+
+flags.DEFINE_float(
+  'until_time', None,
+  'Stop after the last event at or before this timestamp')
+
+flags.DEFINE_string(
+  'replay_output', None,
+  'If set, the replayed nodes, edges, waitlist and quotas are written '
+  'to this JSON file')
+
+logger = None
+
+
+class JournalReplay():
+  """Applies journal events to a BenchmarkGraph
+
+  Only the parts of the graph that decisions change are rebuilt, the
+  VMs, the benchmark edges between them, the waitlist and the last
+  quotas of each region. VMs have no credentials or IP addresses.
+
+  Attributes:
+      graph (BenchmarkGraph): replayed graph
+      benchmarks (Dict[int, Benchmark]): benchmarks of the run by benchmark_id
+      waitlist (Dict[int, str]): benchmark type of waitlisted benchmarks by config_index
+      quotas (Dict[str, Dict[str, Any]]): last quotas of each region
+      round (int): last round started, -1 before the first one
+      last_matching (List[List[int]]): node pairs of the last benchmark set chosen
+      last_event (Optional[Dict[str, Any]]): last event applied
+      round_events (Dict[int, Dict[str, int]]): number of events of each type per round
+      mismatches (List[str]): rounds where the recorded graph size differs
+        from the replayed one
+  """
+
+  def __init__(self):
+    global logger
+    logger = logging.getLogger('pkb_scheduler')
+    self.reset()
+
+  def reset(self):
+    self.graph = BenchmarkGraph()
+    self.benchmarks = {}
+    self.waitlist = {}
+    self.quotas = {}
+    self.round = -1
+    self.last_matching = []
+    self.last_event = None
+    self.round_events = {}
+    self.mismatches = []
+
+  def apply(self, event: Dict[str, Any]):
+    """Applies one event
+
+    Args:
+        event (Dict[str, Any]): event read from the journal
+    """
+    apply_event = getattr(self, '_apply_' + event['event'], None)
+    if apply_event is None:
+      logger.warning(f"UNKNOWN JOURNAL EVENT {event['event']} AT SEQ {event['seq']}")
+    else:
+      apply_event(event)
+    self.last_event = event
+    round_counts = self.round_events.setdefault(self.round, {})
+    round_counts[event['event']] = round_counts.get(event['event'], 0) + 1
+
+  def _apply_run_started(self, event: Dict[str, Any]):
+    self.reset()
+
+  def _apply_round_started(self, event: Dict[str, Any]):
+    self.round = event['round']
+    replayed = {'nodes': len(self.graph.graph.nodes),
+                'edges': len(self.graph.graph.edges),
+                'waitlist': len(self.waitlist)}
+    for name, count in replayed.items():
+      if name in event and event[name] != count:
+        self.mismatches.append(f"round {self.round}: {name} recorded {event[name]}, replayed {count}")
+
+  def _apply_vm_added(self, event: Dict[str, Any]):
+    vm = VirtualMachine(node_id=event['node_id'],
+                        cpu_count=event['cpu_count'],
+                        zone=event['zone'],
+                        os_type=event['os_type'],
+                        machine_type=event['machine_type'],
+                        cloud=event['cloud'],
+                        network_tier=event['network_tier'],
+                        network_name=event['network_name'],
+                        subnet_name=event['subnet_name'],
+                        preexisting_network=event['preexisting_network'])
+    vm.status = event['status']
+    self.graph.add_vm_node(vm)
+
+  def _apply_vm_removed(self, event: Dict[str, Any]):
+    self.graph.remove_vm_node(event['node_id'])
+
+  def _apply_vm_status(self, event: Dict[str, Any]):
+    if event['node_id'] not in self.graph.graph.nodes:
+      return
+    vm = self.graph.graph.nodes[event['node_id']]['vm']
+    vm.status = event['status']
+    vm.run_uri = event['run_uri']
+    vm.creation_time = event['creation_time']
+
+  _apply_vm_created = _apply_vm_status
+  _apply_vm_adopted = _apply_vm_status
+  _apply_vm_deleted = _apply_vm_status
+
+  def _apply_benchmark_waitlisted(self, event: Dict[str, Any]):
+    self.waitlist[event['config_index']] = event['benchmark_type']
+
+  def _apply_benchmark_added(self, event: Dict[str, Any]):
+    self.waitlist.pop(event['config_index'], None)
+    bm = Benchmark(event['benchmark_id'], event['benchmark_type'])
+    bm.config_index = event['config_index']
+    node_ids = []
+    for node_1, node_2 in event['edges']:
+      for node_id in (node_1, node_2):
+        if node_id not in node_ids:
+          node_ids.append(node_id)
+      self.graph.graph.add_edge(node_1, node_2, bm=bm)
+    bm.vms = [self.graph.graph.nodes[node_id]['vm'] for node_id in node_ids]
+    self.benchmarks[bm.benchmark_id] = bm
+    self.graph.benchmarks.append(bm)
+
+  def _remove_edge(self, node_1: int, node_2: int, benchmark_id: int) -> Benchmark:
+    """Removes the edge of a benchmark between two nodes and returns the benchmark
+    """
+    for key, data in self.graph.graph.get_edge_data(node_1, node_2).items():
+      if data['bm'].benchmark_id == benchmark_id:
+        self.graph.graph.remove_edge(node_1, node_2, key)
+        return data['bm']
+    raise KeyError(f"benchmark {benchmark_id} is not between nodes {node_1} and {node_2}")
+
+  def _apply_edge_moved(self, event: Dict[str, Any]):
+    bm = self._remove_edge(event['from_node'], event['other_node'], event['benchmark_id'])
+    self.graph.graph.add_edge(event['to_node'], event['other_node'], bm=bm)
+    bm.vms.remove(self.graph.graph.nodes[event['from_node']]['vm'])
+    bm.vms.append(self.graph.graph.nodes[event['to_node']]['vm'])
+
+  def _apply_matching_chosen(self, event: Dict[str, Any]):
+    self.last_matching = event['pairs']
+
+  def _apply_benchmark_started(self, event: Dict[str, Any]):
+    self.benchmarks[event['benchmark_id']].status = "Running"
+
+  def _apply_benchmark_finished(self, event: Dict[str, Any]):
+    self.benchmarks[event['benchmark_id']].status = event['status']
+
+  def _apply_benchmark_removed(self, event: Dict[str, Any]):
+    node_1, node_2 = event['edge']
+    self._remove_edge(node_1, node_2, event['benchmark_id'])
+
+  def _apply_quota_update(self, event: Dict[str, Any]):
+    self.quotas[event['region']] = event['quotas']
+
+  def get_state(self) -> Dict[str, Any]:
+    """Returns the replayed state as a json serializable dict
+    """
+    nodes = []
+    for node_id, vm in self.graph.graph.nodes.data('vm'):
+      nodes.append({'node_id': node_id, 'cloud': vm.cloud, 'zone': vm.zone,
+                    'machine_type': vm.machine_type, 'status': vm.status,
+                    'run_uri': vm.run_uri, 'degree': self.graph.graph.degree(node_id)})
+    edges = []
+    for node_1, node_2, bm in self.graph.graph.edges.data('bm'):
+      edges.append({'nodes': [node_1, node_2], 'benchmark_id': bm.benchmark_id,
+                    'config_index': bm.config_index, 'benchmark_type': bm.benchmark_type,
+                    'status': bm.status})
+    return {
+      'last_seq': self.last_event['seq'] if self.last_event else None,
+      'last_time': self.last_event['time'] if self.last_event else None,
+      'round': self.round,
+      'last_matching': self.last_matching,
+      'nodes': nodes,
+      'edges': edges,
+      'waitlist': [{'config_index': config_index, 'benchmark_type': benchmark_type}
+                   for config_index, benchmark_type in self.waitlist.items()],
+      'quotas': self.quotas,
+      'round_events': {str(round_index): counts for round_index, counts in self.round_events.items()},
+      'mismatches': self.mismatches,
+    }
+
+
+def replay(events: Iterable[Dict[str, Any]],
+           until_seq: Optional[int] = None,
+           until_round: Optional[int] = None,
+           until_time: Optional[float] = None) -> JournalReplay:
+  """Replays journal events up to a stopping point
+
+  Args:
+      events (Iterable[Dict[str, Any]]): events in journal order
+      until_seq (Optional[int], optional): last sequence number to apply. Defaults to None.
+      until_round (Optional[int], optional): stop after the start of this round. Defaults to None.
+      until_time (Optional[float], optional): last timestamp to apply. Defaults to None.
+
+  Returns:
+      JournalReplay: replayed state
+  """
+  journal_replay = JournalReplay()
+  for event in events:
+    if until_time is not None and event['time'] > until_time:
+      break
+    journal_replay.apply(event)
+    if until_seq is not None and event['seq'] == until_seq:
+      break
+    if (until_round is not None and event['event'] == 'round_started'
+        and event['round'] == until_round):
+      break
+  return journal_replay
+
+
+def main(argv):
+  global logger
+  logger = logging.getLogger('pkb_scheduler')
+  logger.setLevel(logging.INFO)
+  logger.addHandler(logging.StreamHandler())
+  logger.propagate = False
+  if not FLAGS.journal:
+    raise app.UsageError("--journal is required")
+
+  journal_replay = replay(read_events(FLAGS.journal),
+                          until_seq=FLAGS.until_seq,
+                          until_round=FLAGS.until_round,
+                          until_time=FLAGS.until_time)
+  state = journal_replay.get_state()
+
+  for round_index, counts in sorted(journal_replay.round_events.items()):
+    events = ", ".join(f"{name}={count}" for name, count in sorted(counts.items()))
+    logger.info(f"ROUND {round_index}: {events}")
+  logger.info(f"REPLAYED UP TO SEQ {state['last_seq']} IN ROUND {state['round']}")
+  logger.info(f"NODES: {len(state['nodes'])}, EDGES: {len(state['edges'])}, "
+              f"WAITLIST: {len(state['waitlist'])}")
+  running = sum(1 for edge in state['edges'] if edge['status'] == "Running")
+  logger.info(f"BENCHMARKS RUNNING: {running}")
+  for mismatch in journal_replay.mismatches:
+    logger.warning(f"REPLAY MISMATCH {mismatch}")
+
+  if FLAGS.replay_output:
+    with open(FLAGS.replay_output, 'w') as json_file:
+      json.dump(state, json_file, indent=2)
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,231 @@
+from __future__ import annotations
+import logging
+import math
+import sqlite3
+
+from typing import List, Dict, Tuple, Set, Any, Optional, Iterable
+from duration_model import get_flag_fingerprint
+
+
+logger = None
+
+# most recent samples used for an estimate, older runs age out
+MAX_SAMPLES = 200
+# fewer samples than this for a zone falls back to wider groups
+MIN_SAMPLES = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS benchmark_runs (
+  run_id TEXT NOT NULL,
+  timestamp REAL NOT NULL,
+  benchmark_type TEXT NOT NULL,
+  flag_fingerprint TEXT NOT NULL,
+  cloud TEXT,
+  zones TEXT,
+  machine_type TEXT,
+  run_time REAL NOT NULL,
+  success INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS benchmark_runs_key
+  ON benchmark_runs (benchmark_type, flag_fingerprint, zones);
+CREATE TABLE IF NOT EXISTS vm_creations (
+  run_id TEXT NOT NULL,
+  timestamp REAL NOT NULL,
+  cloud TEXT NOT NULL,
+  zone TEXT NOT NULL,
+  machine_type TEXT,
+  creation_time REAL NOT NULL,
+  success INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vm_creations_key
+  ON vm_creations (cloud, zone, machine_type);
+"""
+
+
+def get_percentile(values: List[float], percentile: float) -> Optional[float]:
+  """Returns a percentile of values, interpolating between the closest ranks
+
+  Args:
+      values (List[float]): samples
+      percentile (float): 0 to 100, 50 is the median
+
+  Returns:
+      Optional[float]: percentile, None if there are no values
+  """
+  if not values:
+    return None
+  ordered = sorted(values)
+  rank = (len(ordered) - 1) * percentile / 100.0
+  lower = math.floor(rank)
+  upper = math.ceil(rank)
+  return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def get_zones_key(zones: Iterable[str]) -> str:
+  return ",".join(sorted(zones))
+
+
+class RunHistory():
+  """Benchmark run times and VM creation times of past runs in SQLite
+
+  Rows are written once at the end of a run. Estimates use the most
+  recent MAX_SAMPLES successful rows of the narrowest group that has
+  MIN_SAMPLES of them, and are cached for the lifetime of the object,
+  so they reflect past runs only.
+
+  Attributes:
+      path (str): SQLite database file
+  """
+
+  def __init__(self, path: str):
+    global logger
+    logger = logging.getLogger('pkb_scheduler')
+
+    self.path = path
+    self.connection = sqlite3.connect(path)
+    self.connection.executescript(SCHEMA)
+    self._benchmark_estimates = {}
+    self._creation_estimates = {}
+
+  def close(self):
+    self.connection.close()
+
+  def _get_samples(self, query: str, params: Tuple[Any, ...]) -> List[float]:
+    rows = self.connection.execute(query + " ORDER BY timestamp DESC LIMIT ?",
+                                   params + (MAX_SAMPLES,)).fetchall()
+    return [row[0] for row in rows]
+
+  def get_benchmark_run_times(self, benchmark_type: str, flag_fingerprint: str,
+                              zones: Optional[Iterable[str]] = None) -> List[float]:
+    """Returns the recent run times of successful benchmarks of a kind
+
+    Args:
+        benchmark_type (str): name of the pkb benchmark
+        flag_fingerprint (str): fingerprint from duration_model.get_flag_fingerprint
+        zones (Optional[Iterable[str]], optional): only runs between these zones. Defaults to None.
+
+    Returns:
+        List[float]: run times in seconds, most recent first
+    """
+    query = ("SELECT run_time FROM benchmark_runs WHERE success = 1 "
+             "AND benchmark_type = ? AND flag_fingerprint = ?")
+    params = (benchmark_type, flag_fingerprint)
+    if zones is not None:
+      query += " AND zones = ?"
+      params += (get_zones_key(zones),)
+    return self._get_samples(query, params)
+
+  def get_vm_creation_times(self, cloud: str, zone: Optional[str] = None,
+                            machine_type: Optional[str] = None) -> List[float]:
+    """Returns the recent creation times of successfully created VMs
+
+    Args:
+        cloud (str): cloud of the VMs
+        zone (Optional[str], optional): only VMs in this zone. Defaults to None.
+        machine_type (Optional[str], optional): only VMs of this machine type. Defaults to None.
+
+    Returns:
+        List[float]: creation times in seconds, most recent first
+    """
+    query = "SELECT creation_time FROM vm_creations WHERE success = 1 AND cloud = ?"
+    params = (cloud,)
+    if zone is not None:
+      query += " AND zone = ?"
+      params += (zone,)
+    if machine_type is not None:
+      query += " AND machine_type = ?"
+      params += (machine_type,)
+    return self._get_samples(query, params)
+
+  def estimate_benchmark_run_time(self, benchmark_type: str, flag_fingerprint: str,
+                                  zones: Optional[Iterable[str]] = None,
+                                  percentile: float = 50) -> Optional[float]:
+    """Estimates the run time of a benchmark from past runs
+
+    Runs between the same zones are used if there are enough of them,
+    otherwise all runs of the benchmark type and flags
+
+    Args:
+        benchmark_type (str): name of the pkb benchmark
+        flag_fingerprint (str): fingerprint from duration_model.get_flag_fingerprint
+        zones (Optional[Iterable[str]], optional): zones of the benchmark. Defaults to None.
+        percentile (float, optional): 50 for the median, 90 for p90. Defaults to 50.
+
+    Returns:
+        Optional[float]: estimate in seconds, None if the benchmark never ran
+    """
+    zones_key = get_zones_key(zones) if zones is not None else None
+    key = (benchmark_type, flag_fingerprint, zones_key, percentile)
+    if key not in self._benchmark_estimates:
+      samples = []
+      if zones is not None:
+        samples = self.get_benchmark_run_times(benchmark_type, flag_fingerprint, zones)
+      if len(samples) < MIN_SAMPLES:
+        samples = self.get_benchmark_run_times(benchmark_type, flag_fingerprint)
+      self._benchmark_estimates[key] = get_percentile(samples, percentile)
+    return self._benchmark_estimates[key]
+
+  def estimate_vm_creation_time(self, cloud: str, zone: str, machine_type: Optional[str] = None,
+                                percentile: float = 50) -> Optional[float]:
+    """Estimates how long creating a VM takes from past runs
+
+    Falls back from the zone and machine type to the zone, then to the cloud,
+    when there are not enough samples
+
+    Args:
+        cloud (str): cloud of the VM
+        zone (str): zone of the VM
+        machine_type (Optional[str], optional): machine type of the VM. Defaults to None.
+        percentile (float, optional): 50 for the median, 90 for p90. Defaults to 50.
+
+    Returns:
+        Optional[float]: estimate in seconds, None if the cloud has no history
+    """
+    key = (cloud, zone, machine_type, percentile)
+    if key not in self._creation_estimates:
+      samples = []
+      for group in ((zone, machine_type), (zone, None), (None, None)):
+        samples = self.get_vm_creation_times(cloud, *group)
+        if len(samples) >= MIN_SAMPLES:
+          break
+      self._creation_estimates[key] = get_percentile(samples, percentile)
+    return self._creation_estimates[key]
+
+  def record_run(self, run_id: str, benchmarks: Iterable[Any], virtual_machines: Iterable[Any],
+                 since: Optional[float] = None):
+    """Stores the run times of finished benchmarks and the creation times of VMs
+
+    Args:
+        run_id (str): id of the scheduler run
+        benchmarks (Iterable[Benchmark]): benchmarks of the run
+        virtual_machines (Iterable[VirtualMachine]): VMs of the run
+        since (Optional[float], optional): only VMs created after this timestamp,
+          so VMs adopted on resume are not stored twice. Defaults to None.
+    """
+    benchmark_rows = []
+    # each benchmark is stored once, even if it is in the list twice
+    for bm in {id(bm): bm for bm in benchmarks}.values():
+      if bm.start_timestamp is None or bm.end_timestamp is None or not bm.vms:
+        continue
+      benchmark_rows.append((run_id, bm.end_timestamp, bm.benchmark_type,
+                             get_flag_fingerprint(bm.flags), bm.vms[0].cloud,
+                             get_zones_key(vm.zone for vm in bm.vms), bm.vms[0].machine_type,
+                             bm.end_timestamp - bm.start_timestamp,
+                             int(bm.status == "Executed")))
+
+    vm_rows = []
+    for vm in virtual_machines:
+      if vm.creation_time is None or vm.create_timestamp is None:
+        continue
+      if since is not None and vm.create_timestamp < since:
+        continue
+      vm_rows.append((run_id, vm.create_timestamp, vm.cloud, vm.zone, vm.machine_type,
+                      vm.creation_time, int(vm.run_uri is not None)))
+
+    with self.connection:
+      self.connection.executemany("INSERT INTO benchmark_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  benchmark_rows)
+      self.connection.executemany("INSERT INTO vm_creations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  vm_rows)
+    logger.info(f"RUN HISTORY: STORED {len(benchmark_rows)} BENCHMARK RUNS AND "
+                f"{len(vm_rows)} VM CREATIONS IN {self.path}")
@@ -0,0 +1,230 @@
+# Times the scheduling phases of pkb_scheduler on synthetic benchmark sets
+# shaped like gartner_all.yaml (an all-pairs zone matrix filtered by
+# zones < extra_zones), without running pkb or calling any cloud.
+#
+# python3 scheduler_benchmark.py --zone_counts=20,50 --machine_types=n1-standard-2,n2-standard-2
+from __future__ import annotations
+import gc
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import yaml
+import networkx as nx
+import cloud_util
+import pkb_scheduler
+
+from datetime import datetime
+from typing import List, Dict, Tuple, Set, Any, Optional
+from absl import flags
+from absl import app
+from quota_cache import QuotaCache
+from simulator import Simulator
+
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_list(
+  'zone_counts', ['20', '50', '100', '200'],
+  'Number of zones in each synthetic benchmark set')
+
+flags.DEFINE_list(
+  'machine_types', ['n1-standard-2', 'n2-standard-2', 'e2-standard-2'],
+  'Machine types crossed with the zone pairs')
+
+flags.DEFINE_integer(
+  'rounds', 3,
+  'Scheduling rounds timed per benchmark set')
+
+flags.DEFINE_integer(
+  'region_cpu_quota', 24,
+  'CPU quota of every synthetic region, per cpu type. Lower values put '
+  'more benchmarks on the waitlist')
+
+flags.DEFINE_boolean(
+  'measure_memory', True,
+  'Trace peak memory with tracemalloc. This slows down every phase, '
+  'compare timings only between runs with the same setting')
+
+flags.DEFINE_string(
+  'benchmark_output', 'scheduler_benchmark.json',
+  'File the results are written to')
+
+PHASES = ['parse_config_file', 'create_graph_from_config_list', 'equalize_graph',
+          'get_benchmark_set', 'add_benchmarks_from_waitlist', 'remove_orphaned_nodes']
+
+
+def get_synthetic_zones(zone_count: int) -> List[str]:
+  """Returns GCP style zone names, one zone per region
+  """
+  return [f"synthetic-region{i:03d}-a" for i in range(0, zone_count)]
+
+
+def get_synthetic_config(zone_count: int, machine_types: List[str]) -> Dict[str, Any]:
+  """Builds a config like gartner_all.yaml for zone_count zones
+
+  Args:
+      zone_count (int): number of zones
+      machine_types (List[str]): machine types to cross with the zone pairs
+
+  Returns:
+      Dict[str, Any]: config file contents
+  """
+  zones = get_synthetic_zones(zone_count)
+  return {
+    'throughput_latency_jitter': {
+      'flag_matrix': 'inter_region',
+      'flag_matrix_filters': {'inter_region': 'zones < extra_zones'},
+      'flag_matrix_defs': {
+        'inter_region': {
+          'gce_network_tier': ['premium'],
+          'zones': zones,
+          'extra_zones': zones,
+          'machine_type': machine_types,
+        }
+      },
+      'flags': {
+        'cloud': 'GCP',
+        'gce_network_name': 'pkb-scheduler',
+        'iperf_runtime_in_seconds': 60,
+        'netperf_benchmarks': 'TCP_RR,TCP_STREAM,UDP_RR,UDP_STREAM',
+        'netperf_test_length': 60,
+        'netperf_num_streams': '1,4,32',
+        'iperf_sending_thread_count': '1,4,32',
+      }
+    }
+  }
+
+
+class PhaseTimer():
+  """Records how long each call of each phase takes
+  """
+
+  def __init__(self):
+    self.times = {phase: [] for phase in PHASES}
+
+  def time(self, phase: str, function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    self.times[phase].append(time.perf_counter() - start_time)
+    return result
+
+  def get_results(self) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for phase, times in self.times.items():
+      results[phase] = {'seconds': times, 'total': sum(times)}
+    return results
+
+
+def finish_benchmark_set(full_graph, benchmark_set: List[Tuple[int, int]]):
+  """Marks a benchmark set as run, as if every benchmark succeeded
+
+  Stands in for create_vms and run_benchmark_set, which are not timed
+  """
+  for node_1, node_2 in benchmark_set:
+    for node in (node_1, node_2):
+      vm = full_graph.graph.nodes[node]['vm']
+      vm.status = 'Running'
+      vm.run_uri = "no_run"
+    edges = full_graph.graph.get_edge_data(node_1, node_2)
+    if not edges:
+      continue
+    key = next(iter(edges))
+    edges[key]['bm'].status = 'Executed'
+    full_graph.graph.remove_edge(node_1, node_2, key)
+
+
+def run_case(zone_count: int, machine_types: List[str], config_dir: str) -> Dict[str, Any]:
+  """Builds and schedules one synthetic benchmark set
+
+  Args:
+      zone_count (int): number of zones
+      machine_types (List[str]): machine types
+      config_dir (str): directory for the synthetic config file
+
+  Returns:
+      Dict[str, Any]: results of the case
+  """
+  config_path = os.path.join(config_dir, f"synthetic_{zone_count}.yaml")
+  with open(config_path, 'w') as config_file:
+    yaml.safe_dump(get_synthetic_config(zone_count, machine_types), config_file)
+
+  simulation = Simulator({'quota_refresh': 0,
+                          'quotas': {'GCP': {'CPUS': FLAGS.region_cpu_quota,
+                                             'default': FLAGS.region_cpu_quota,
+                                             'IN_USE_ADDRESSES': FLAGS.region_cpu_quota}}})
+  for zone in get_synthetic_zones(zone_count):
+    simulation.add_region('GCP', cloud_util.get_region_from_zone('GCP', zone), machine_types)
+  pkb_scheduler.quota_cache = QuotaCache(ttl=0, fetch_function=simulation.get_region_info)
+
+  gc.collect()
+  if FLAGS.measure_memory:
+    tracemalloc.start()
+  timer = PhaseTimer()
+
+  benchmark_config_list = timer.time('parse_config_file', pkb_scheduler.parse_config_file, config_path)
+  full_graph = timer.time('create_graph_from_config_list', pkb_scheduler.create_graph_from_config_list,
+                          benchmark_config_list, "python3 pkb.py")
+  simulation.graph = full_graph
+  benchmark_count = len(full_graph.benchmarks) + len(full_graph.benchmark_wait_list)
+  initial_nodes = len(full_graph.graph.nodes)
+  initial_edges = len(full_graph.graph.edges)
+  timer.time('equalize_graph', full_graph.equalize_graph)
+
+  set_sizes = []
+  for round_index in range(0, FLAGS.rounds):
+    benchmark_set = timer.time('get_benchmark_set', full_graph.get_benchmark_set)
+    set_sizes.append(len(benchmark_set))
+    finish_benchmark_set(full_graph, benchmark_set)
+    timer.time('add_benchmarks_from_waitlist', full_graph.add_benchmarks_from_waitlist)
+    timer.time('remove_orphaned_nodes', full_graph.remove_orphaned_nodes)
+
+  peak_memory = None
+  if FLAGS.measure_memory:
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+  return {
+    'zones': zone_count,
+    'machine_types': machine_types,
+    'benchmarks': benchmark_count,
+    'initial_nodes': initial_nodes,
+    'initial_edges': initial_edges,
+    'benchmark_set_sizes': set_sizes,
+    'phases': timer.get_results(),
+    'peak_memory_bytes': peak_memory,
+  }
+
+
+def main(argv):
+  pkb_scheduler.setup_logging()
+  # VMs are only marked as running, deleting them must not call pkb
+  FLAGS.no_run = True
+
+  results = {
+    'timestamp': datetime.now().isoformat(),
+    'python': platform.python_version(),
+    'networkx': nx.__version__,
+    'scheduling_strategy': FLAGS.scheduling_strategy,
+    'rounds': FLAGS.rounds,
+    'region_cpu_quota': FLAGS.region_cpu_quota,
+    'measure_memory': FLAGS.measure_memory,
+    'cases': [],
+  }
+
+  with tempfile.TemporaryDirectory() as config_dir:
+    for zone_count in FLAGS.zone_counts:
+      case = run_case(int(zone_count), FLAGS.machine_types, config_dir)
+      results['cases'].append(case)
+      phase_totals = ", ".join(f"{phase}: {case['phases'][phase]['total']:.3f}s" for phase in PHASES)
+      print(f"{zone_count} ZONES, {case['benchmarks']} BENCHMARKS: {phase_totals}")
+      # write after every case so results survive an interrupted run
+      with open(FLAGS.benchmark_output, 'w') as json_file:
+        json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+  FLAGS.set_default('log_level', 'warning')
+  app.run(main)
@@ -0,0 +1,254 @@
+from __future__ import annotations
+import abc
+import networkx as nx
+import logging
+import time
+import cloud_util
+
+from typing import List, Dict, Tuple, Set, Any, Optional
+from matching_engine import MatchingEngine
+from region import Region
+
+
+logger = None
+
+
+class SchedulingStrategy(abc.ABC):
+  """Picks the benchmark set to run next from the benchmark graph
+
+  Attributes:
+      name (str): name of the strategy, as passed to --scheduling_strategy
+  """
+
+  name = None
+
+  def __init__(self):
+    global logger
+    logger = logging.getLogger('pkb_scheduler')
+
+  @abc.abstractmethod
+  def get_benchmark_set(self,
+                        graph: nx.MultiGraph,
+                        regions: Dict[str, Region],
+                        vm_states: Dict[int, str],
+                        weighted_edges: Dict[Tuple[int, int], float]) -> List[Tuple[int, int]]:
+    """Get the next benchmark set to run
+
+    Args:
+        graph (nx.MultiGraph): graph of VMs (nodes) and benchmarks (edges)
+        regions (Dict[str, Region]): regions of the benchmark graph, with their quotas
+        vm_states (Dict[int, str]): status of every VM that can be part of the set,
+          keyed by node id. VMs that are not in here can not be used
+        weighted_edges (Dict[Tuple[int, int], float]): weight of each (node1, node2)
+          pair with a benchmark between them. Self-loops are (node, node)
+
+    Returns:
+        List[Tuple[int, int]]: list of tuples [(node1, node2)]
+    """
+
+  def close(self):
+    """Releases worker processes or other resources held by the strategy
+    """
+    pass
+
+
+class MaximumMatchingStrategy(SchedulingStrategy):
+  """Runs a maximum cardinality, maximum weight matching over the VMs
+
+  Attributes:
+      incremental (bool): keep the matching graph between rounds, see MatchingEngine
+      matching_engine (MatchingEngine): engine that computes the matching
+  """
+
+  name = 'MAXIMUM_MATCHING'
+
+  def __init__(self, incremental: bool = True, pool_size: int = 0,
+               parallel_min_edges: int = 2000):
+    SchedulingStrategy.__init__(self)
+    self.incremental = incremental
+    self.matching_engine = MatchingEngine(pool_size=pool_size,
+                                          parallel_min_edges=parallel_min_edges)
+
+  def get_benchmark_set(self, graph, regions, vm_states, weighted_edges):
+    if not self.incremental:
+      self.matching_engine.reset()
+    self.matching_engine.update(vm_states.keys(), weighted_edges)
+    return self.matching_engine.get_matching()
+
+  def close(self):
+    self.matching_engine.close()
+
+
+class MilpStrategy(SchedulingStrategy):
+  """Picks the benchmark set with a mixed integer linear program
+
+  Maximizes the number of concurrent benchmarks, then their total
+  weight, subject to:
+  1. every VM runs at most one benchmark
+  2. VMs that still have to be created fit in what is left of each
+     regional quota (CPUs, addresses, ...) after the VMs already on the cloud
+  3. the estimated bandwidth of the benchmarks that run at the same time
+     stays under the regional and cloud bandwidth limits
+
+  Solved locally with the HiGHS solver that ships with scipy. If the solver
+  is not available, or it finds no solution within the time budget,
+  maximum matching is used for that round instead.
+
+  Attributes:
+      time_budget (float): seconds the solver is allowed to run per round
+      fallback_strategy (SchedulingStrategy): strategy used when the solver fails
+  """
+
+  name = 'MILP'
+
+  def __init__(self, time_budget: float = 10.0, fallback_strategy: Optional[SchedulingStrategy] = None):
+    SchedulingStrategy.__init__(self)
+    self.time_budget = time_budget
+    self.fallback_strategy = fallback_strategy
+    if self.fallback_strategy is None:
+      self.fallback_strategy = MaximumMatchingStrategy()
+
+  def get_benchmark_set(self, graph, regions, vm_states, weighted_edges):
+    try:
+      import numpy as np
+      from scipy.optimize import milp, LinearConstraint, Bounds
+      from scipy.sparse import lil_matrix
+    except ImportError:
+      logger.warning("scipy is not installed, using maximum matching instead of MILP")
+      return self.fallback_strategy.get_benchmark_set(graph, regions, vm_states, weighted_edges)
+
+    pairs = list(weighted_edges.keys())
+    if len(pairs) == 0:
+      return []
+
+    rows = self._get_constraint_rows(graph, regions, vm_states, pairs)
+    constraint_matrix = lil_matrix((len(rows), len(pairs)))
+    upper_bounds = np.zeros(len(rows))
+    for row_index in range(0, len(rows)):
+      coefficients, upper_bound = rows[row_index]
+      for pair_index in coefficients:
+        constraint_matrix[row_index, pair_index] = coefficients[pair_index]
+      upper_bounds[row_index] = upper_bound
+
+    # every benchmark is worth more than the weight of all the others,
+    # so the solver maximizes the number of benchmarks first
+    cardinality_weight = 1 + sum(weighted_edges.values())
+    objective = np.array([-(cardinality_weight + weighted_edges[pair]) for pair in pairs])
+
+    start_time = time.time()
+    result = milp(objective,
+                  constraints=LinearConstraint(constraint_matrix.tocsr(), -np.inf, upper_bounds),
+                  integrality=np.ones(len(pairs)),
+                  bounds=Bounds(0, 1),
+                  options={'time_limit': self.time_budget})
+    logger.debug(f"MILP STATUS: {result.status} {result.message}, "
+                 f"SOLVE TIME: {time.time() - start_time}")
+
+    if result.x is None:
+      logger.warning(f"MILP found no solution ({result.message}), using maximum matching")
+      return self.fallback_strategy.get_benchmark_set(graph, regions, vm_states, weighted_edges)
+
+    benchmark_set = []
+    for pair_index in range(0, len(pairs)):
+      if result.x[pair_index] > 0.5:
+        benchmark_set.append(pairs[pair_index])
+    return benchmark_set
+
+  def close(self):
+    self.fallback_strategy.close()
+
+  def _get_constraint_rows(self,
+                           graph: nx.MultiGraph,
+                           regions: Dict[str, Region],
+                           vm_states: Dict[int, str],
+                           pairs: List[Tuple[int, int]]) -> List[Tuple[Dict[int, float], float]]:
+    """Builds the constraints of the program as sparse rows
+
+    Returns:
+        List[Tuple[Dict[int, float], float]]: (coefficient of each pair index, upper bound)
+    """
+    rows = []
+
+    # 1. each VM is in at most one benchmark
+    node_rows = {}
+    for pair_index in range(0, len(pairs)):
+      for node in set(pairs[pair_index]):
+        node_rows.setdefault(node, {})[pair_index] = 1
+    for node in node_rows:
+      rows.append((node_rows[node], 1))
+
+    # usage of the VMs in each pair, per region
+    quota_rows = {}
+    region_bandwidth_rows = {}
+    cloud_bandwidth_rows = {}
+    for pair_index in range(0, len(pairs)):
+      for node in set(pairs[pair_index]):
+        vm = graph.nodes[node]['vm']
+        region_name = cloud_util.get_region_from_zone(vm.cloud, vm.zone)
+        if region_name not in regions:
+          continue
+        region = regions[region_name]
+        estimated_bandwidth = max(vm.estimated_bandwidth, 0)
+
+        if vm_states[node] == 'Not Created':
+          for quota_name, amount in region.get_vm_quota_usage(vm).items():
+            quota_row = quota_rows.setdefault((region_name, quota_name), {})
+            quota_row[pair_index] = quota_row.get(pair_index, 0) + amount
+
+        if estimated_bandwidth > 0:
+          bandwidth_row = region_bandwidth_rows.setdefault(region_name, {})
+          bandwidth_row[pair_index] = bandwidth_row.get(pair_index, 0) + estimated_bandwidth
+          cloud_row = cloud_bandwidth_rows.setdefault(region.cloud, {})
+          cloud_row[pair_index] = cloud_row.get(pair_index, 0) + estimated_bandwidth
+
+    # 2. VMs to create fit in the quota that is not used by VMs on the cloud.
+    # VMs in the graph reserve quota before they are created, so their
+    # reservations are handed back before comparing
+    for (region_name, quota_name), quota_row in quota_rows.items():
+      region = regions[region_name]
+      limit = region.get_quota_limit(quota_name)
+      usage = region.get_quota_usage(quota_name)
+      if limit is None or usage is None:
+        continue
+      reserved = 0
+      for vm in region.virtual_machines:
+        if vm.status == 'Not Created':
+          reserved += region.get_vm_quota_usage(vm).get(quota_name, 0)
+      rows.append((quota_row, max(limit - max(usage - reserved, 0), 0)))
+
+    # 3. bandwidth of benchmarks running at the same time
+    for region_name, bandwidth_row in region_bandwidth_rows.items():
+      if regions[region_name].bandwidth_limit:
+        rows.append((bandwidth_row, regions[region_name].bandwidth_limit))
+    for cloud, bandwidth_row in cloud_bandwidth_rows.items():
+      if cloud.bandwidth_limit:
+        rows.append((bandwidth_row, cloud.bandwidth_limit))
+
+    return rows
+
+
+def get_scheduling_strategy(strategy_name: str,
+                            incremental_matching: bool = True,
+                            time_budget: float = 10.0,
+                            matching_pool_size: int = 0,
+                            parallel_matching_min_edges: int = 2000) -> SchedulingStrategy:
+  """Creates the scheduling strategy for a --scheduling_strategy value
+
+  Args:
+      strategy_name (str): MAXIMUM_MATCHING or MILP
+      incremental_matching (bool, optional): see MaximumMatchingStrategy. Defaults to True.
+      time_budget (float, optional): solver time budget in seconds. Defaults to 10.0.
+      matching_pool_size (int, optional): worker processes for large components,
+        see MatchingEngine. Defaults to 0.
+      parallel_matching_min_edges (int, optional): edges a component needs to
+        be matched in a worker. Defaults to 2000.
+
+  Returns:
+      SchedulingStrategy: the strategy
+  """
+  matching_strategy = MaximumMatchingStrategy(incremental=incremental_matching,
+                                              pool_size=matching_pool_size,
+                                              parallel_min_edges=parallel_matching_min_edges)
+  if strategy_name == MilpStrategy.name:
+    return MilpStrategy(time_budget=time_budget, fallback_strategy=matching_strategy)
+  return matching_strategy
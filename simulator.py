@@ -0,0 +1,454 @@
+from __future__ import annotations
+import copy
+import itertools
+import json
+import logging
+import math
+import random
+import time
+import yaml
+import benchmark_graph
+import cloud_util
+import duration_model
+import event_journal
+import instrumentation
+import quota_cache
+import virtual_machine
+
+from typing import List, Dict, Tuple, Set, Any, Optional, Iterable
+from pkb_executor import PkbProcessResult
+from region import GcpRegion, AzureRegion
+from virtual_machine_spec import VirtualMachineSpec
+
+
+logger = None
+
+# quota limits of simulated regions, 'default' is used for quotas not listed
+DEFAULT_QUOTA_LIMITS = {
+  'GCP': {'CPUS': 24, 'IN_USE_ADDRESSES': 8, 'default': 24},
+  'AWS': {'vm': 1920, 'vpc': 5, 'elastic_ip': 5, 'default': 5},
+  'AZURE': {'TOTAL REGIONAL VCPUS': 10, 'VIRTUAL MACHINES': 25000,
+            'PUBLIC IP ADDRESSES - BASIC': 10, 'default': 10},
+}
+
+# seconds, keyed by cloud. 'windows' is used for windows VMs on any cloud
+DEFAULT_VM_CREATION = {
+  'GCP': {'type': 'lognormal', 'median': 90, 'sigma': 0.25},
+  'AWS': {'type': 'lognormal', 'median': 120, 'sigma': 0.25},
+  'AZURE': {'type': 'lognormal', 'median': 180, 'sigma': 0.25},
+  'windows': {'type': 'lognormal', 'median': 420, 'sigma': 0.3},
+  'default': {'type': 'lognormal', 'median': 120, 'sigma': 0.25},
+}
+
+DEFAULT_VM_DELETION = {'default': {'type': 'uniform', 'low': 30, 'high': 90}}
+
+DEFAULT_QUOTA_REFRESH = {'type': 'uniform', 'low': 1, 'high': 5}
+
+
+class VirtualClock():
+  """Stands in for the time module in simulation mode
+
+  time() returns the virtual time and sleep() advances it without
+  waiting. Everything else is taken from the real time module.
+
+  Attributes:
+      now (float): current virtual timestamp
+  """
+
+  def __init__(self, start_time: Optional[float] = None):
+    if start_time is None:
+      start_time = time.time()
+    self.now = start_time
+
+  def time(self) -> float:
+    return self.now
+
+  def sleep(self, seconds: float):
+    if seconds > 0:
+      self.now += seconds
+
+  def advance_to(self, timestamp: float):
+    """Moves the clock forward to timestamp, never backwards
+    """
+    self.now = max(self.now, timestamp)
+
+  def __getattr__(self, name):
+    return getattr(time, name)
+
+
+# modules that keep time for the scheduler
+CLOCK_MODULES = [benchmark_graph, virtual_machine, quota_cache, instrumentation, event_journal]
+
+
+def install_clock(clock: VirtualClock, modules: Iterable[Any] = ()):
+  """Makes modules use the virtual clock instead of the time module
+
+  Args:
+      clock (VirtualClock): clock to use
+      modules (Iterable[Any], optional): modules that did 'import time',
+        on top of CLOCK_MODULES
+  """
+  for module in itertools.chain(CLOCK_MODULES, modules):
+    module.time = clock
+
+
+class Distribution():
+  """Random distribution of a duration in seconds
+
+  Built from a spec dict, or a plain number for a constant:
+    {type: constant, value: 60}
+    {type: uniform, low: 30, high: 90}
+    {type: normal, mean: 600, stddev: 60}
+    {type: lognormal, median: 90, sigma: 0.25}
+    {type: empirical, samples: [512.3, 498.1]}  or  {type: empirical, file: run_times.json}
+
+  Samples are never negative.
+  """
+
+  def __init__(self, spec: Any, rng: random.Random):
+    self.rng = rng
+    if not isinstance(spec, dict):
+      spec = {'type': 'constant', 'value': float(spec)}
+    self.spec = spec
+    self.type = spec.get('type', 'constant')
+    if self.type == 'empirical':
+      self.samples = self._load_samples(spec)
+      if len(self.samples) == 0:
+        raise ValueError(f"empirical distribution has no samples: {spec}")
+    elif self.type not in ['constant', 'uniform', 'normal', 'lognormal']:
+      raise ValueError(f"unknown distribution type: {self.type}")
+
+  @staticmethod
+  def _load_samples(spec: Dict[str, Any]) -> List[float]:
+    if 'samples' in spec:
+      return [float(sample) for sample in spec['samples']]
+    with open(spec['file']) as samples_file:
+      if spec['file'].endswith('.json'):
+        samples = json.load(samples_file)
+      else:
+        samples = samples_file.read().split()
+    return [float(sample) for sample in samples if sample is not None]
+
+  def sample(self) -> float:
+    if self.type == 'constant':
+      value = self.spec['value']
+    elif self.type == 'uniform':
+      value = self.rng.uniform(self.spec['low'], self.spec['high'])
+    elif self.type == 'normal':
+      value = self.rng.normalvariate(self.spec['mean'], self.spec['stddev'])
+    elif self.type == 'lognormal':
+      value = self.rng.lognormvariate(math.log(self.spec['median']), self.spec['sigma'])
+    else:
+      value = self.rng.choice(self.samples)
+    return max(float(value), 0.0)
+
+
+class SimulatedFuture():
+  """Future of a simulated pkb process
+
+  Done once the virtual clock reaches the end time of the process.
+  Waiting on the result moves the clock forward to the end time.
+  """
+
+  def __init__(self, clock: VirtualClock, result: PkbProcessResult):
+    self._clock = clock
+    self._result = result
+
+  def done(self) -> bool:
+    return self._clock.time() >= self._result.end_time
+
+  def result(self, timeout: Optional[float] = None) -> PkbProcessResult:
+    self._clock.advance_to(self._result.end_time)
+    return self._result
+
+
+class SimulatedPkbExecutor():
+  """Executor with the interface of AsyncioPkbExecutor that runs no processes
+
+  Each submitted pkb command finishes after a duration drawn from the
+  simulation's distributions, measured on the virtual clock.
+  """
+
+  def __init__(self, simulator: Simulator):
+    self.simulator = simulator
+    self.vm_creations = 0
+    self.vm_deletions = 0
+    self.benchmark_runs = 0
+
+  @staticmethod
+  def _get_flag(command: List[str], flag_name: str) -> Optional[str]:
+    prefix = '--' + flag_name + '='
+    for argument in command:
+      if argument.startswith(prefix):
+        return argument[len(prefix):]
+    return None
+
+  def submit(self, command: List[str], label: str = "pkb") -> SimulatedFuture:
+    run_stage = self._get_flag(command, 'run_stage') or ''
+    cloud = (self._get_flag(command, 'cloud') or 'default').upper()
+    os_type = self._get_flag(command, 'os_type') or ''
+    output = ""
+
+    if 'provision' in run_stage:
+      self.vm_creations += 1
+      duration = self.simulator.sample_vm_creation(cloud, os_type)
+      run_uri = f"sim{self.vm_creations:05d}"
+      output = (f"NAME: pkb-{run_uri}-0\n"
+                f"INTERNAL_IP: 10.0.{self.vm_creations // 256 % 256}.{self.vm_creations % 256}\n"
+                f"EXTERNAL_IP: 198.51.{self.vm_creations // 256 % 256}.{self.vm_creations % 256}\n"
+                f"RUN_URI: {run_uri}\n"
+                f"UID: {run_uri}\n")
+    elif 'teardown' in run_stage:
+      self.vm_deletions += 1
+      duration = self.simulator.sample_vm_deletion(cloud)
+    else:
+      self.benchmark_runs += 1
+      duration = self.simulator.sample_benchmark_duration(self._get_flag(command, 'benchmarks'))
+
+    start_time = self.simulator.clock.time()
+    logger.debug(f"[{label}] simulated for {duration:.1f} seconds")
+    return SimulatedFuture(self.simulator.clock,
+                           PkbProcessResult(0, output, start_time, start_time + duration))
+
+  def shutdown(self):
+    pass
+
+
+class Simulator():
+  """Runs the scheduler on a virtual clock instead of calling pkb
+
+  VM creation and deletion, benchmark run times and quota refreshes
+  take durations drawn from the distributions in the simulation config.
+  Region quotas are simulated for every region used by the configs,
+  with the usage of VMs that are running in the graph.
+
+  Simulation config (YAML), every section is optional:
+    vm_creation:          # keyed by cloud, 'windows' or 'default'
+      GCP: {type: lognormal, median: 90, sigma: 0.25}
+    vm_deletion:          # keyed by cloud or 'default'
+      default: 60
+    benchmark_duration:   # keyed by benchmark type or 'default'
+      netperf: {type: empirical, file: netperf_run_times.json}
+    quota_refresh: {type: constant, value: 2}
+    quotas:               # quota limits, keyed by cloud
+      GCP: {CPUS: 72, default: 24}
+
+  Attributes:
+      clock (VirtualClock): virtual clock of the simulation
+      executor (SimulatedPkbExecutor): executor to pass to the BenchmarkGraph
+      graph (BenchmarkGraph): graph being simulated, used for quota usage
+      regions (Dict[str, Dict[str, Set[str]]]): simulated regions, keyed by cloud,
+        with the machine types used in each region
+      quota_refreshes (int): number of quota queries answered
+  """
+
+  def __init__(self, config: Optional[Dict[str, Any]] = None, seed: int = 0):
+    global logger
+    logger = logging.getLogger('pkb_scheduler')
+
+    self.config = config or {}
+    self.rng = random.Random(seed)
+    self.clock = VirtualClock()
+    self.start_time = self.clock.time()
+    self.executor = SimulatedPkbExecutor(self)
+    self.graph = None
+    self.regions = {}
+    self.quota_refreshes = 0
+
+    self.vm_creation = self._get_distributions(DEFAULT_VM_CREATION, self.config.get('vm_creation'))
+    self.vm_deletion = self._get_distributions(DEFAULT_VM_DELETION, self.config.get('vm_deletion'))
+    self.benchmark_duration = self._get_distributions({}, self.config.get('benchmark_duration'))
+    self.quota_refresh = Distribution(self.config.get('quota_refresh', DEFAULT_QUOTA_REFRESH), self.rng)
+    self.quota_limits = copy.deepcopy(DEFAULT_QUOTA_LIMITS)
+    for cloud, limits in self.config.get('quotas', {}).items():
+      self.quota_limits.setdefault(cloud.upper(), {'default': 0}).update(limits)
+
+  @staticmethod
+  def from_config_file(config_path: Optional[str], seed: int = 0) -> Simulator:
+    config = {}
+    if config_path:
+      with open(config_path) as config_file:
+        config = yaml.safe_load(config_file) or {}
+    return Simulator(config, seed=seed)
+
+  def _get_distributions(self, defaults: Dict[str, Any],
+                         overrides: Optional[Dict[str, Any]]) -> Dict[str, Distribution]:
+    specs = dict(defaults)
+    for key, spec in (overrides or {}).items():
+      # clouds are matched without case, benchmark types are lower case anyway
+      specs[key.upper() if key.upper() in DEFAULT_QUOTA_LIMITS else key] = spec
+    return {key: Distribution(spec, self.rng) for key, spec in specs.items()}
+
+  def sample_vm_creation(self, cloud: str, os_type: str) -> float:
+    if 'windows' in os_type and 'windows' in self.vm_creation:
+      return self.vm_creation['windows'].sample()
+    return self.vm_creation.get(cloud, self.vm_creation['default']).sample()
+
+  def sample_vm_deletion(self, cloud: str) -> float:
+    return self.vm_deletion.get(cloud, self.vm_deletion['default']).sample()
+
+  def sample_benchmark_duration(self, benchmark_type: Optional[str]) -> float:
+    if benchmark_type not in self.benchmark_duration:
+      if 'default' in self.benchmark_duration:
+        return self.benchmark_duration['default'].sample()
+      # same guess the duration model makes before any run is recorded
+      estimate = duration_model.estimate_duration_from_flags(benchmark_type, {})
+      self.benchmark_duration[benchmark_type] = Distribution({'type': 'normal',
+                                                              'mean': estimate,
+                                                              'stddev': estimate * 0.1},
+                                                             self.rng)
+    return self.benchmark_duration[benchmark_type].sample()
+
+  def add_vm_specs(self, vm_specs: Iterable[VirtualMachineSpec]):
+    """Adds the regions of VM specs to the simulated regions
+
+    Args:
+        vm_specs (Iterable[VirtualMachineSpec]): VM specs from the benchmark configs
+    """
+    for vm_spec in vm_specs:
+      region_name = cloud_util.get_region_from_zone(vm_spec.cloud, vm_spec.zone)
+      self.add_region(vm_spec.cloud, region_name, [vm_spec.machine_type])
+
+  def add_region(self, cloud: str, region_name: str, machine_types: Iterable[str]):
+    """Adds a simulated region, with the machine types that will run in it
+
+    Args:
+        cloud (str): name of the cloud
+        region_name (str): name of the region
+        machine_types (Iterable[str]): machine types used in the region
+    """
+    self.regions.setdefault(cloud.upper(), {}).setdefault(region_name, set()).update(machine_types)
+
+  def _get_quota_names(self, cloud: str, region_name: str) -> List[str]:
+    quota_names = [name for name in self.quota_limits.get(cloud, {}) if name != 'default']
+    for machine_type in sorted(self.regions[cloud][region_name]):
+      if cloud == 'GCP':
+        quota_names.append(GcpRegion(region_name, None, {})._get_cpu_type(machine_type))
+      elif cloud == 'AZURE':
+        quota_names.append(AzureRegion(region_name, None, {})._get_family_quota_name(machine_type))
+    return list(dict.fromkeys(quota_names))
+
+  def _get_region_usage(self, region_name: str) -> Dict[str, int]:
+    usage = {}
+    if self.graph is None or region_name not in self.graph.regions:
+      return usage
+    region = self.graph.regions[region_name]
+    for vm in region.virtual_machines:
+      if vm.status == 'Running':
+        for quota_name, amount in region.get_vm_quota_usage(vm).items():
+          usage[quota_name] = usage.get(quota_name, 0) + amount
+    return usage
+
+  def get_region_info(self, cloud: str, max_workers: Optional[int] = None,
+                      regions: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Simulated cloud_util.get_region_info
+
+    Args:
+        cloud (str): name of the cloud
+        max_workers (Optional[int], optional): ignored
+        regions (Optional[List[str]], optional): only return these regions. Defaults to all.
+
+    Returns:
+        Dict[str, Any]: same shape as cloud_util.get_region_info
+    """
+    self.quota_refreshes += 1
+    self.clock.sleep(self.quota_refresh.sample())
+
+    cloud = cloud.upper()
+    limits = self.quota_limits.get(cloud, {'default': 0})
+    region_dict = {}
+    for region_name in self.regions.get(cloud, {}):
+      if regions is not None and region_name not in regions:
+        continue
+      usage = self._get_region_usage(region_name)
+      quotas = {}
+      for quota_name in self._get_quota_names(cloud, region_name):
+        limit = limits.get(quota_name, limits['default'])
+        if cloud == 'AZURE':
+          # azure quotas are stored as [usage, limit]
+          quotas[quota_name] = [usage.get(quota_name, 0), limit]
+        else:
+          quotas[quota_name] = {'limit': limit, 'usage': usage.get(quota_name, 0)}
+      if cloud == 'AZURE':
+        quotas['region_name'] = region_name
+      region_dict[region_name] = quotas
+    return region_dict
+
+  def _get_busy_vm_time(self, start: float, end: float) -> float:
+    """VM seconds spent running benchmarks between start and end
+    """
+    busy_time = 0
+    for bm in self.graph.benchmarks:
+      if bm.start_timestamp is None:
+        continue
+      bm_end = bm.end_timestamp if bm.end_timestamp is not None else self.clock.time()
+      overlap = min(bm_end, end) - max(bm.start_timestamp, start)
+      if overlap > 0:
+        busy_time += overlap * len(set(id(vm) for vm in bm.vms))
+    return busy_time
+
+  def _get_alive_vm_time(self, start: float, end: float) -> float:
+    """VM seconds of uptime between start and end
+    """
+    alive_time = 0
+    for vm in self.graph.virtual_machines:
+      if vm.create_timestamp is None:
+        continue
+      vm_end = vm.delete_timestamp if vm.delete_timestamp is not None else self.clock.time()
+      overlap = min(vm_end, end) - max(vm.create_timestamp, start)
+      if overlap > 0:
+        alive_time += overlap
+    return alive_time
+
+  def get_metrics(self,
+                  maximum_sets: List[List[Tuple[int, int]]],
+                  waitlist_sizes: List[int],
+                  round_start_times: List[float]) -> Dict[str, Any]:
+    """Collects the metrics of a finished simulation
+
+    VM utilization is the share of VM uptime spent running benchmarks.
+    It is only reported when VMs are precreated, otherwise every
+    benchmark creates and deletes its own VMs
+
+    Args:
+        maximum_sets (List[List[Tuple[int, int]]]): benchmark set of each round
+        waitlist_sizes (List[int]): waitlisted benchmarks at the start of each round
+        round_start_times (List[float]): virtual timestamp each round started at
+
+    Returns:
+        Dict[str, Any]: metrics
+    """
+    end_time = self.clock.time()
+    rounds = []
+    for i in range(0, len(maximum_sets)):
+      round_end = round_start_times[i + 1] if i + 1 < len(round_start_times) else end_time
+      alive_time = self._get_alive_vm_time(round_start_times[i], round_end)
+      utilization = None
+      if alive_time > 0 and self.executor.vm_creations > 0:
+        utilization = self._get_busy_vm_time(round_start_times[i], round_end) / alive_time
+      rounds.append({'round': i,
+                     'start': round_start_times[i] - self.start_time,
+                     'duration': round_end - round_start_times[i],
+                     'benchmarks': len(maximum_sets[i]),
+                     'vms_used': len(set(itertools.chain(*maximum_sets[i]))),
+                     'utilization': utilization,
+                     'waitlist': waitlist_sizes[i]})
+
+    total_alive_time = self._get_alive_vm_time(self.start_time, end_time)
+    vm_utilization = None
+    if total_alive_time > 0 and self.executor.vm_creations > 0:
+      vm_utilization = self._get_busy_vm_time(self.start_time, end_time) / total_alive_time
+    return {
+      'makespan': end_time - self.start_time,
+      'total_vm_uptime': sum(vm.uptime() for vm in self.graph.virtual_machines),
+      'vm_utilization': vm_utilization,
+      'vms_created': self.executor.vm_creations,
+      'vms_deleted': self.executor.vm_deletions,
+      'benchmarks_run': self.executor.benchmark_runs,
+      'benchmarks_executed': len([bm for bm in self.graph.benchmarks if bm.status == 'Executed']),
+      'benchmarks_left': self.graph.benchmarks_left(),
+      'rounds': rounds,
+      # rounds that could not start any benchmark while benchmarks waited for quota
+      'waitlist_stalls': len([r for r in rounds if r['benchmarks'] == 0 and r['waitlist'] > 0]),
+      'quota_refreshes': self.quota_refreshes,
+    }
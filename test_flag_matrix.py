@@ -0,0 +1,90 @@
+import itertools
+import unittest
+
+import flag_matrix
+
+
+def expand_naively(matrix, base_flags, expression):
+  """Expands a flag_matrix the way PKB does, evaluating the filter on every combination"""
+  axes = sorted(matrix.items())
+  combinations = []
+  for combination in itertools.product(*[values for name, values in axes]):
+    axis_values = dict(zip([name for name, values in axes], combination))
+    flags = dict(base_flags)
+    flags.update(axis_values)
+    if not expression or eval(expression, {}, flags):
+      combinations.append(axis_values)
+  return combinations
+
+
+ZONES = ['us-east1-b', 'us-central1-a', 'europe-west1-c', 'asia-east1-a']
+
+MATRIX = {
+  'zones': ZONES,
+  'extra_zones': ZONES,
+  'gce_network_tier': ['premium', 'standard'],
+  'machine_type': ['n1-standard-2', 'n1-standard-4', 'n2-standard-2'],
+}
+
+BASE_FLAGS = {'cloud': 'GCP', 'netperf_test_length': 60, 'machine_type': 'n1-standard-8'}
+
+
+class IterateFlagMatrixTest(unittest.TestCase):
+
+  def assert_same_as_naive(self, expression, matrix=MATRIX, base_flags=BASE_FLAGS):
+    expected = expand_naively(matrix, base_flags, expression)
+    combinations = list(flag_matrix.iterate_flag_matrix(matrix, base_flags, expression))
+    self.assertEqual(combinations, expected, expression)
+
+  def test_uses_tables(self):
+    for expression in ["zones < extra_zones", "extra_zones > zones and gce_network_tier != 'standard'"]:
+      self.assertIsNotNone(flag_matrix.FlagMatrixFilter(expression).comparisons)
+
+  def test_no_filter(self):
+    self.assert_same_as_naive(None)
+
+  def test_axis_comparisons(self):
+    for expression in ["zones < extra_zones", "extra_zones > zones", "zones != extra_zones",
+                       "zones == zones", "zones != zones",
+                       "zones <= extra_zones and machine_type != 'n1-standard-2'"]:
+      self.assert_same_as_naive(expression)
+
+  def test_chained_comparisons(self):
+    for expression in ["'europe' < zones < extra_zones",
+                       "zones < extra_zones <= 'us-central1-a'",
+                       "zones < extra_zones != 'asia-east1-a'"]:
+      self.assert_same_as_naive(expression)
+
+  def test_constant_comparisons(self):
+    for expression in ["1 > 2", "1 < 2", "1 > 2 and zones < extra_zones",
+                       "zones in ['us-east1-b', 'asia-east1-a']",
+                       "'n2-standard-2' not in machine_type"]:
+      self.assert_same_as_naive(expression)
+
+  def test_axis_shadows_base_flag(self):
+    # machine_type is both an axis and a base flag, the axis value wins
+    for expression in ["machine_type == 'n1-standard-4'",
+                       "machine_type == 'n1-standard-4' or cloud == 'AWS'"]:
+      self.assert_same_as_naive(expression)
+
+  def test_filters_without_tables(self):
+    for expression in ["cloud == 'GCP' and zones < extra_zones",
+                       "netperf_test_length > 30 and zones < extra_zones",
+                       "gce_network_tier == 'premium' or zones < extra_zones",
+                       "(zones + extra_zones).count('asia') == 1",
+                       "len([zone for zone in ['us-east1-b'] if zone != 'x']) > 0",
+                       "cloud == 'AWS'"]:
+      self.assert_same_as_naive(expression)
+
+  def test_empty_axis(self):
+    matrix = {'a': [1], 'b': []}
+    for expression in [None, "len(str(a)) > 0", "a < b", "a > 0", "missing_flag"]:
+      self.assert_same_as_naive(expression, matrix, {})
+
+  def test_no_axes(self):
+    for expression in [None, "cloud == 'GCP'", "cloud == 'AWS'", "1 > 2"]:
+      self.assert_same_as_naive(expression, {}, BASE_FLAGS)
+
+
+if __name__ == '__main__':
+  unittest.main()
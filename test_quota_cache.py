@@ -0,0 +1,79 @@
+import unittest
+import unittest.mock
+
+import cloud_util
+import pkb_scheduler
+
+from absl import flags
+from benchmark_graph import BenchmarkGraph
+from cloud import Cloud
+from quota_cache import QuotaCache
+from region import GcpRegion
+from virtual_machine import VirtualMachine
+
+
+def get_gcp_quotas(cpu_usage=0):
+  return {'us-east1': {'CPUS': {'limit': 24, 'usage': cpu_usage},
+                       'IN_USE_ADDRESSES': {'limit': 8, 'usage': 0}}}
+
+
+class UpdateQuotaUsageTest(unittest.TestCase):
+
+  def setUp(self):
+    if not flags.FLAGS.is_parsed():
+      flags.FLAGS(['test_quota_cache'])
+    self.fetches = []
+    self.cloud_cpu_usage = 0
+    pkb_scheduler.quota_cache = QuotaCache(ttl=300, fetch_function=self.fetch)
+
+    self.graph = BenchmarkGraph()
+    cloud = Cloud('GCP')
+    self.graph.add_cloud_if_not_exists(cloud)
+    self.region = GcpRegion('us-east1', cloud, get_gcp_quotas()['us-east1'])
+    self.graph.add_region_if_not_exists(new_region=self.region)
+    self.vm = VirtualMachine(node_id=0, cpu_count=2, zone='us-east1-b',
+                             machine_type='n1-standard-2', cloud='GCP')
+    self.graph.add_vm_node(self.vm)
+    self.assertTrue(self.region.add_virtual_machine_if_possible(self.vm))
+
+  def tearDown(self):
+    pkb_scheduler.quota_cache = None
+
+  def fetch(self, cloud, regions=None):
+    self.fetches.append(regions)
+    return get_gcp_quotas(self.cloud_cpu_usage)
+
+  def test_vm_created_within_ttl_keeps_its_usage(self):
+    pkb_scheduler.update_quota_usage(self.graph)
+    self.assertEqual(self.region.quotas['CPUS']['usage'], 2)
+
+    # the VM is created after the snapshot, which still has no usage
+    self.vm.status = 'Running'
+    pkb_scheduler.update_quota_usage(self.graph)
+    self.assertEqual(len(self.fetches), 1)
+    self.assertEqual(self.region.quotas['CPUS']['usage'], 2)
+
+  def test_refetched_region_is_merged(self):
+    pkb_scheduler.update_quota_usage(self.graph)
+    self.vm.status = 'Running'
+    self.cloud_cpu_usage = 6
+    pkb_scheduler.get_quota_cache().fetch_times.clear()
+    pkb_scheduler.update_quota_usage(self.graph)
+    self.assertEqual(len(self.fetches), 2)
+    self.assertEqual(self.region.quotas['CPUS']['usage'], 6)
+
+
+class FailedQuotaQueryTest(unittest.TestCase):
+
+  def test_failed_azure_query_is_not_returned(self):
+    cache = QuotaCache(ttl=0)
+    cache.region_info['Azure'] = {'eastus': {'region_name': 'eastus',
+                                             'TOTAL REGIONAL VCPUS': [0, 10]}}
+    with unittest.mock.patch.object(cloud_util, '_run_cli_json', side_effect=ValueError('az failed')):
+      self.assertIsNone(cloud_util._get_azure_region_quotas('eastus'))
+      self.assertEqual(cache.refresh_region_info('Azure', ['eastus']), {})
+    self.assertEqual(cache.region_info['Azure']['eastus']['TOTAL REGIONAL VCPUS'], [0, 10])
+
+
+if __name__ == '__main__':
+  unittest.main()
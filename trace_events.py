@@ -0,0 +1,209 @@
+from __future__ import annotations
+import json
+import logging
+
+from typing import List, Dict, Tuple, Set, Any, Optional
+from benchmark_graph import BenchmarkGraph
+from instrumentation import Instrumentation
+
+# Writes the VM lifecycles, benchmark runs and scheduler phases of a run
+# in the Chrome trace event format, viewable in chrome://tracing or
+# https://ui.perfetto.dev. Each VM is a track with slices for
+# provisioning, every benchmark it ran, the idle gaps between them and
+# teardown. Scheduler phases are on their own tracks.
+#
+# Format reference: "Trace Event Format", complete ("X") and metadata ("M") events
+
+SCHEDULER_PID = 1
+VM_PID = 2
+ROUND_TID = 0
+PHASE_TID = 1
+
+
+def _to_microseconds(timestamp: float, origin: float) -> int:
+  return int(round((timestamp - origin) * 1000000))
+
+
+def _slice(name: str, category: str, start: float, end: float, origin: float,
+           pid: int, tid: int, args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+  """Returns a complete event covering start to end
+  """
+  event = {
+    'name': name,
+    'cat': category,
+    'ph': 'X',
+    'ts': _to_microseconds(start, origin),
+    'dur': max(_to_microseconds(end, origin) - _to_microseconds(start, origin), 0),
+    'pid': pid,
+    'tid': tid,
+  }
+  if args:
+    event['args'] = args
+  return event
+
+
+def _metadata(name: str, pid: int, tid: Optional[int], args: Dict[str, Any]) -> Dict[str, Any]:
+  """Returns a metadata event, ex the name of a process or thread
+  """
+  event = {'name': name, 'ph': 'M', 'pid': pid, 'args': args}
+  if tid is not None:
+    event['tid'] = tid
+  return event
+
+
+def get_benchmarks(full_graph: BenchmarkGraph) -> List[Any]:
+  """Returns the benchmarks of a graph, each once
+
+  The same benchmark can be in a graph's benchmark list more than once,
+  it would show up as stacked identical slices
+
+  Args:
+      full_graph (BenchmarkGraph): graph after the run
+
+  Returns:
+      List[Benchmark]: benchmarks in the order they were first added
+  """
+  return list({id(bm): bm for bm in full_graph.benchmarks}.values())
+
+
+def get_vm_runs(full_graph: BenchmarkGraph) -> Dict[int, List[Tuple[float, float, Any]]]:
+  """Returns the benchmark runs of every VM, ordered by start
+
+  Args:
+      full_graph (BenchmarkGraph): graph after the run
+
+  Returns:
+      Dict[int, List[Tuple[float, float, Any]]]: (start, end, benchmark) keyed by VM id
+  """
+  vm_runs = {}
+  for bm in get_benchmarks(full_graph):
+    if bm.start_timestamp is None or bm.end_timestamp is None:
+      continue
+    for vm in bm.vms:
+      vm_runs.setdefault(id(vm), []).append((bm.start_timestamp, bm.end_timestamp, bm))
+  for runs in vm_runs.values():
+    runs.sort(key=lambda run: run[0])
+  return vm_runs
+
+
+def get_vm_events(full_graph: BenchmarkGraph, origin: float, end_of_trace: float) -> List[Dict[str, Any]]:
+  """Returns a track per created VM with provisioning, benchmark, idle and teardown slices
+
+  Args:
+      full_graph (BenchmarkGraph): graph after the run
+      origin (float): timestamp shown as 0 in the trace
+      end_of_trace (float): end of VMs that were never deleted
+
+  Returns:
+      List[Dict[str, Any]]: trace events
+  """
+  events = [_metadata('process_name', VM_PID, None, {'name': 'VMs'}),
+            _metadata('process_sort_index', VM_PID, None, {'sort_index': VM_PID})]
+  vm_runs = get_vm_runs(full_graph)
+
+  for tid, vm in enumerate(full_graph.virtual_machines):
+    if vm.create_timestamp is None:
+      continue
+    vm_start = vm.create_timestamp
+    vm_end = vm.delete_timestamp or end_of_trace
+    teardown_start = vm_end
+    if vm.delete_timestamp and vm.deletion_time:
+      teardown_start = vm.delete_timestamp - vm.deletion_time
+
+    events.append(_metadata('thread_name', VM_PID, tid, {'name': f"vm {vm.node_id} {vm.zone} {vm.machine_type}"}))
+    events.append(_slice(f"vm {vm.node_id}", 'vm', vm_start, vm_end, origin, VM_PID, tid,
+                         {'cloud': vm.cloud, 'zone': vm.zone, 'machine_type': vm.machine_type,
+                          'run_uri': vm.run_uri, 'status': vm.status}))
+
+    busy_until = vm_start
+    if vm.creation_time:
+      busy_until = vm_start + vm.creation_time
+      events.append(_slice('provisioning', 'provisioning', vm_start, busy_until,
+                           origin, VM_PID, tid))
+
+    for start, end, bm in vm_runs.get(id(vm), []):
+      if start > busy_until:
+        events.append(_slice('idle', 'idle', busy_until, start, origin, VM_PID, tid))
+      events.append(_slice(bm.benchmark_type, 'benchmark', start, end, origin, VM_PID, tid,
+                           {'benchmark_id': bm.benchmark_id, 'status': bm.status,
+                            'zones': [bm_vm.zone for bm_vm in bm.vms]}))
+      busy_until = max(busy_until, end)
+
+    if teardown_start > busy_until:
+      events.append(_slice('idle', 'idle', busy_until, teardown_start, origin, VM_PID, tid))
+    if vm.delete_timestamp and vm.deletion_time:
+      events.append(_slice('teardown', 'teardown', teardown_start, vm.delete_timestamp,
+                           origin, VM_PID, tid))
+  return events
+
+
+def get_scheduler_events(instrumentation: Instrumentation, origin: float) -> List[Dict[str, Any]]:
+  """Returns a track of scheduling rounds and a track of the phases in them
+
+  Args:
+      instrumentation (Instrumentation): phase spans of the run
+      origin (float): timestamp shown as 0 in the trace
+
+  Returns:
+      List[Dict[str, Any]]: trace events
+  """
+  events = [_metadata('process_name', SCHEDULER_PID, None, {'name': 'scheduler'}),
+            _metadata('process_sort_index', SCHEDULER_PID, None, {'sort_index': SCHEDULER_PID}),
+            _metadata('thread_name', SCHEDULER_PID, ROUND_TID, {'name': 'rounds'}),
+            _metadata('thread_name', SCHEDULER_PID, PHASE_TID, {'name': 'phases'})]
+
+  round_ends = {}
+  for name, round_index, start, end in instrumentation.spans:
+    events.append(_slice(name, 'phase', start, end, origin, SCHEDULER_PID, PHASE_TID,
+                         {'round': round_index}))
+    round_ends[round_index] = max(round_ends.get(round_index, end), end)
+
+  for round_stats in instrumentation.rounds:
+    round_end = round_ends.get(round_stats.index, round_stats.start_time)
+    events.append(_slice(f"round {round_stats.index}", 'round', round_stats.start_time, round_end,
+                         origin, SCHEDULER_PID, ROUND_TID, dict(round_stats.counts)))
+  return events
+
+
+def get_trace_events(full_graph: BenchmarkGraph,
+                     instrumentation: Optional[Instrumentation] = None) -> List[Dict[str, Any]]:
+  """Returns every trace event of a run
+
+  Args:
+      full_graph (BenchmarkGraph): graph after the run
+      instrumentation (Optional[Instrumentation], optional): phase spans of the run. Defaults to None.
+
+  Returns:
+      List[Dict[str, Any]]: trace events, timestamps relative to the first event
+  """
+  timestamps = []
+  for vm in full_graph.virtual_machines:
+    timestamps.extend(filter(None, [vm.create_timestamp, vm.delete_timestamp]))
+  for bm in get_benchmarks(full_graph):
+    timestamps.extend(filter(None, [bm.start_timestamp, bm.end_timestamp]))
+  if instrumentation:
+    for name, round_index, start, end in instrumentation.spans:
+      timestamps.extend([start, end])
+  if not timestamps:
+    return []
+
+  origin = min(timestamps)
+  events = get_vm_events(full_graph, origin, max(timestamps))
+  if instrumentation:
+    events.extend(get_scheduler_events(instrumentation, origin))
+  return events
+
+
+def write_trace_file(path: str, full_graph: BenchmarkGraph,
+                     instrumentation: Optional[Instrumentation] = None):
+  """Writes the trace of a run to a JSON file
+
+  Args:
+      path (str): file to write
+      full_graph (BenchmarkGraph): graph after the run
+      instrumentation (Optional[Instrumentation], optional): phase spans of the run. Defaults to None.
+  """
+  events = get_trace_events(full_graph, instrumentation)
+  logging.getLogger('pkb_scheduler').info(f"WRITING {len(events)} TRACE EVENTS TO {path}")
+  with open(path, 'w') as trace_file:
+    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
@@ -2,6 +2,7 @@ import subprocess
 import time
 from absl import flags
 import logging
+import pkb_tasks
 
 from virtual_machine_spec import VirtualMachineSpec
 
@@ -77,6 +78,21 @@ class VirtualMachine():
 
     return False
 
+  def get_spec_key(self, include_network: bool = True) -> tuple:
+    """Returns a hashable key of the fields compared by vm_spec_is_equivalent
+
+    Two VMs where a.vm_spec_is_equivalent(b) is True have the same key,
+    with the network fields only included when a has a preexisting network
+
+    Args:
+      include_network: whether to include the network and subnet names in the key
+    """
+    spec_key = (self.cloud, self.zone, self.machine_type,
+                self.network_tier, self.vpn, self.os_type)
+    if include_network:
+      spec_key = spec_key + (self.network_name, self.subnet_name)
+    return spec_key
+
   def uptime(self):
     if self.status == "Running":
       current_time = time.time()
@@ -88,21 +104,12 @@ class VirtualMachine():
     else:
       return 0
 
-  def create_instance(self, pkb_location):
-    """Creates a VM on the cloud from a VM object
-
-    Creates a VM on the cloud from a VM object
-    Currently only works for GCP VMs
-    TODO add AWS and Azure
+  def get_create_command(self, pkb_location: str) -> str:
+    """Returns the pkb command that creates this VM
 
     Args:
-      vm: [description]
+      pkb_location: pkb command, ex "python3 /path/to/pkb.py"
     """
-    # TODO make this more robust
-    # TODO FIX ALL OF THIS
-    if self.status == "Running":
-      return (False, self.status)
-
     cmd = (pkb_location)
 
     if 'windows' in self.os_type:
@@ -133,6 +140,24 @@ class VirtualMachine():
     if self.min_cpu_platform:
       cmd = (cmd + " --gcp_min_cpu_platform=" + self.min_cpu_platform)
     cmd = (cmd + f" --log_level={FLAGS.pkb_log_level}")
+    return cmd
+
+  def create_instance(self, pkb_location):
+    """Creates a VM on the cloud from a VM object
+
+    Creates a VM on the cloud from a VM object
+    Currently only works for GCP VMs
+    TODO add AWS and Azure
+
+    Args:
+      vm: [description]
+    """
+    # TODO make this more robust
+    # TODO FIX ALL OF THIS
+    if self.status == "Running":
+      return (False, self.status)
+
+    cmd = self.get_create_command(pkb_location)
     logging.info('CREATE INSTANCE: ' + cmd)
     if FLAGS.no_run:
       self.run_uri = "no_run"
@@ -151,75 +176,71 @@ class VirtualMachine():
     output, error = process.communicate()
 
     end_time = time.time()
-    self.creation_time = end_time - start_time
+    time.sleep(1)
 
+    return self.apply_creation_output(output.decode("utf-8"), end_time - start_time)
+
+  def apply_creation_output(self, output: str, creation_time: float):
+    """Parses the output of the pkb process that created this VM
+
+    Sets the ips, name, run_uri and password of the VM and
+    marks it as Running if the info section was found
+
+    Args:
+      output: stdout of the pkb creation process
+      creation_time: seconds the creation process took
+    """
     logging.debug("PARSING OUTPUT")
-    output = output.decode("utf-8")
     logging.debug(output)
-    ext_ip = ""
-    int_ip = ""
-    name = ""
-    password = ""
+    result = pkb_tasks.parse_creation_output(self.node_id, output)
+    result.create_timestamp = self.create_timestamp
+    result.creation_time = creation_time
+    return self.apply_creation_result(result)
 
-    self.creation_output = output
-    # info_section_found = False
-    time.sleep(1)
+  def apply_creation_result(self, result: pkb_tasks.VmCreationResult):
+    """Updates this VM with the result of the worker that created it
 
-    # have to use this instead of line in output
-    # because that splits by letter when threading?
-    for line in self.creation_output.split('\n'):
-      if "INTERNAL_IP:" in line:
-        int_ip = line.split()[1]
-      elif "EXTERNAL_IP:" in line:
-        ext_ip = line.split()[1]
-      elif "NAME:" in line:
-        name = line.split()[1]
-      elif "RUN_URI" in line:
-        self.run_uri = line.split()[1]
-      elif "UID" in line:
-        self.uid = line.split()[1]
-      # only for windows VMs
-      elif "PASSWORD" in line:
-        self.password = line.split()[1]
+    Args:
+      result: result of the creation
+    """
+    self.creation_time = result.creation_time
+    self.create_timestamp = result.create_timestamp
+    self.creation_output = result.output
+    if result.run_uri is not None:
+      self.run_uri = result.run_uri
+    if result.uid is not None:
+      self.uid = result.uid
+    if result.password is not None:
+      self.password = result.password
 
     if self.password:
       print("THIS IS THE PASSWORD: " + self.password)
     else:
       print("NO PASSWORD FOUND")
 
-
-    if self.run_uri is None:
+    if not result.success:
       print("INFO SECTION NOT FOUND")
       print("CREATION OUTPUT: ")
       print(self.creation_output)
       return (False, self.status)
 
-    self.ip_address = ext_ip
-    self.internal_ip = int_ip
-    self.name = name
+    self.ip_address = result.ip_address
+    self.internal_ip = result.internal_ip
+    self.name = result.name
     self.status = "Running"
 
     return (True, self.status)
 
-  def delete_instance(self, pkb_location):
-    """Deletes an existing vm instance on the cloud
-
-       Deletes an existing vm instances using the run_uri
-       of that vm and PKB's run_stage functionality
+  def get_delete_command(self, pkb_location: str) -> str:
+    """Returns the pkb command that deletes this VM
 
     Args:
-      vm: [description]
+      pkb_location: pkb command, ex "python3 /path/to/pkb.py"
     """
-    # TODO make this more robust
-    if self.status == "Not Created" or self.status == "Shutdown":
-      return (False, self.status)
-
     # ./pkb.py --benchmarks=vm_setup --gce_network_name=pkb-scheduler
     # --run_stage=cleanup,teardown --run_uri=074af5cd
 
     # TODO make the network a parameter
-    # print("DELETING VM INSTANCE")
-
     cmd = (pkb_location)
     if 'windows' in self.os_type:
       cmd = (cmd + " --benchmarks=vm_setup_windows" +
@@ -235,6 +256,22 @@ class VirtualMachine():
            " --ignore_package_requirements=True")
 
     cmd = (cmd + f" --log_level={FLAGS.pkb_log_level}")
+    return cmd
+
+  def delete_instance(self, pkb_location):
+    """Deletes an existing vm instance on the cloud
+
+       Deletes an existing vm instances using the run_uri
+       of that vm and PKB's run_stage functionality
+
+    Args:
+      vm: [description]
+    """
+    # TODO make this more robust
+    if self.status == "Not Created" or self.status == "Shutdown":
+      return (False, self.status)
+
+    cmd = self.get_delete_command(pkb_location)
     logging.info("DELETING INSTANCE: " + cmd)
     if FLAGS.no_run:
       self.status = "Shutdown"
@@ -247,8 +284,16 @@ class VirtualMachine():
     output, error = process.communicate()
 
     end_time = time.time()
+    return self.apply_deletion(end_time - start_time)
+
+  def apply_deletion(self, deletion_time: float):
+    """Marks this VM as deleted once the pkb teardown process finished
+
+    Args:
+      deletion_time: seconds the teardown process took
+    """
     self.delete_timestamp = time.time()
-    self.deletion_time = end_time - start_time
+    self.deletion_time = deletion_time
     self.status = "Shutdown"
 
     return (True, self.status)
@@ -289,5 +334,73 @@ class VirtualMachine():
     # or this
     # destination.__dict__.update(source.__dict__).
 
+  def to_dict(self):
+    """Returns the state of this VM as a json serializable dict
+
+    The vm_spec object is not included, only its id
+    """
+    return {
+      'node_id': self.node_id,
+      'cpu_count': self.cpu_count,
+      'zone': self.zone,
+      'os_type': self.os_type,
+      'machine_type': self.machine_type,
+      'cloud': self.cloud,
+      'network_tier': self.network_tier,
+      'vpn': self.vpn,
+      'ssh_private_key': self.ssh_private_key,
+      'ssl_cert': self.ssl_cert,
+      'min_cpu_platform': self.min_cpu_platform,
+      'network_name': self.network_name,
+      'subnet_name': self.subnet_name,
+      'preexisting_network': self.preexisting_network,
+      'vm_spec_id': self.vm_spec_id,
+      'estimated_bandwidth': self.estimated_bandwidth,
+      'status': self.status,
+      'internal_ip': self.internal_ip,
+      'ip_address': self.ip_address,
+      'name': self.name,
+      'run_uri': self.run_uri,
+      'uid': self.uid,
+      'password': self.password,
+      'create_timestamp': self.create_timestamp,
+      'delete_timestamp': self.delete_timestamp,
+      'creation_time': self.creation_time,
+      'deletion_time': self.deletion_time,
+    }
+
+  @staticmethod
+  def from_dict(vm_dict):
+    """Creates a VM from a dict made by to_dict
+    """
+    vm = VirtualMachine(node_id=vm_dict['node_id'],
+                        cpu_count=vm_dict['cpu_count'],
+                        zone=vm_dict['zone'],
+                        os_type=vm_dict['os_type'],
+                        machine_type=vm_dict['machine_type'],
+                        cloud=vm_dict['cloud'],
+                        network_tier=vm_dict['network_tier'],
+                        vpn=vm_dict['vpn'],
+                        ssh_private_key=vm_dict['ssh_private_key'],
+                        ssl_cert=vm_dict['ssl_cert'],
+                        vm_spec_id=vm_dict['vm_spec_id'],
+                        min_cpu_platform=vm_dict['min_cpu_platform'],
+                        network_name=vm_dict['network_name'],
+                        subnet_name=vm_dict['subnet_name'],
+                        preexisting_network=vm_dict['preexisting_network'],
+                        estimated_bandwidth=vm_dict['estimated_bandwidth'])
+    vm.status = vm_dict['status']
+    vm.internal_ip = vm_dict['internal_ip']
+    vm.ip_address = vm_dict['ip_address']
+    vm.name = vm_dict['name']
+    vm.run_uri = vm_dict['run_uri']
+    vm.uid = vm_dict['uid']
+    vm.password = vm_dict['password']
+    vm.create_timestamp = vm_dict['create_timestamp']
+    vm.delete_timestamp = vm_dict['delete_timestamp']
+    vm.creation_time = vm_dict['creation_time']
+    vm.deletion_time = vm_dict['deletion_time']
+    return vm
+
   def __str__(self):
     return f'VM {{id: {self.node_id}, cloud: {self.cloud}, zone: {self.zone}, machine_type: {self.machine_type}}}'
\ No newline at end of file